@@ -0,0 +1,381 @@
+"""Cold archive of old transactions.
+
+Transactions older than a cutoff are moved, month by month, into gzip JSONL segment files
+under ARCHIVE_DIR and deleted from `transactions`. Segment files are written once and never
+modified; each is indexed by an ArchiveSegment row, so readers only open files whose id/date
+range can match.
+
+Win transactions whose ticket lot still has unsold tickets stay live (selling needs them);
+closed lots are archived inside their win record. ArchivedTxTotal records per-user, per-type
+counts and sums of everything archived; lifetime per-user sums (deposits, referral bonuses)
+come from user_stats (app.user_stats), which archiving never touches.
+
+CLI:  python -m app.archive run [--before YYYY-MM-DD | --keep-days 90] [--batch-size 5000]
+      python -m app.archive list
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import heapq
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Iterator, Mapping, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.balance import bump_state_version
+from app.config import settings
+from app.db import on_conflict_insert
+from app.migrations import tx_columns_from_meta
+from app.models import ArchiveSegment, ArchivedTxTotal, TicketLot, Transaction, TxType
+
+LOT_FIELDS = ("code", "ticket_kind", "rarity", "roulette_id", "case_cost", "added", "sold")
+
+
+@dataclass(frozen=True)
+class ArchivedTx:
+    """Read-only stand-in for a Transaction row that lives in a segment file."""
+
+    id: int
+    user_id: int
+    type: TxType
+    amount: int
+    description: str
+    created_at: Optional[datetime]
+    meta: dict = field(default_factory=dict)
+    roulette_id: Optional[str] = None
+    prize_code: Optional[str] = None
+    ticket_sell_tx_id: Optional[int] = None
+    lot: Optional[dict] = None
+
+
+def archive_root() -> Path:
+    return Path(settings.archive_dir).resolve()
+
+
+def _dt(v: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(v) if v else None
+
+
+def _record(t: Transaction, lot: Optional[TicketLot]) -> dict:
+    rec = {
+        "id": int(t.id),
+        "user_id": int(t.user_id),
+        "type": t.type.value if hasattr(t.type, "value") else str(t.type),
+        "amount": int(t.amount or 0),
+        "description": t.description or "",
+        "meta": t.meta or {},
+        "created_at": t.created_at.isoformat() if t.created_at else None,
+        "roulette_id": t.roulette_id,
+        "prize_code": t.prize_code,
+        "ticket_sell_tx_id": t.ticket_sell_tx_id,
+    }
+    if lot is not None:
+        rec["lot"] = {k: getattr(lot, k) for k in LOT_FIELDS}
+        rec["lot"]["created_at"] = lot.created_at.isoformat() if lot.created_at else None
+    return rec
+
+
+def _from_record(rec: dict) -> ArchivedTx:
+    # Segments written before the columns existed only have them in meta.
+    cols = {k: rec.get(k) for k in ("roulette_id", "prize_code", "ticket_sell_tx_id")}
+    if not any(cols.values()):
+        cols = tx_columns_from_meta(rec["type"], rec.get("description"), rec.get("meta"))
+    return ArchivedTx(
+        id=int(rec["id"]),
+        user_id=int(rec["user_id"]),
+        type=TxType(rec["type"]),
+        amount=int(rec.get("amount") or 0),
+        description=str(rec.get("description") or ""),
+        created_at=_dt(rec.get("created_at")),
+        meta=rec.get("meta") or {},
+        roulette_id=cols["roulette_id"],
+        prize_code=cols["prize_code"],
+        ticket_sell_tx_id=cols["ticket_sell_tx_id"],
+        lot=rec.get("lot"),
+    )
+
+
+def _write_segment(path: Path, records: list[dict]) -> None:
+    """Write a complete segment file (tmp + fsync + rename): readers never see a partial one."""
+    body = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(gzip.compress(body.encode("utf-8")))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=16)
+def _load_segment(path: str) -> tuple[ArchivedTx, ...]:
+    # Segment files are immutable, so decoded rows can be cached by path.
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return tuple(_from_record(json.loads(line)) for line in f if line.strip())
+
+
+@lru_cache(maxsize=16)
+def _segment_by_user(path: str) -> Mapping[int, tuple[ArchivedTx, ...]]:
+    """Rows of one segment grouped by user, newest id first (a per-user index over the cache)."""
+    by_user: dict[int, list[ArchivedTx]] = {}
+    for t in _load_segment(path):
+        by_user.setdefault(t.user_id, []).append(t)
+    return MappingProxyType({u: tuple(sorted(rows, key=lambda t: t.id, reverse=True)) for u, rows in by_user.items()})
+
+
+def _bump_total(db: Session, user_id: int, tx_type: TxType, count: int, amount: int) -> None:
+    # Upsert, so two archive runs racing on a user's first archived row don't collide on INSERT.
+    insert = on_conflict_insert(db)
+    if insert is not None:
+        stmt = insert(ArchivedTxTotal).values(user_id=user_id, type=tx_type, count=count, amount=amount)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ArchivedTxTotal.user_id, ArchivedTxTotal.type],
+            set_={
+                "count": ArchivedTxTotal.count + stmt.excluded.count,
+                "amount": ArchivedTxTotal.amount + stmt.excluded.amount,
+            },
+        )
+        db.execute(stmt)
+        return
+
+    res = db.execute(
+        update(ArchivedTxTotal)
+        .where(ArchivedTxTotal.user_id == user_id, ArchivedTxTotal.type == tx_type)
+        .values(count=ArchivedTxTotal.count + count, amount=ArchivedTxTotal.amount + amount),
+        execution_options={"synchronize_session": False},
+    )
+    if res.rowcount == 0:
+        db.add(ArchivedTxTotal(user_id=user_id, type=tx_type, count=count, amount=amount))
+        db.flush()
+
+
+def _archive_month(db: Session, month: str, records: list[dict]) -> dict:
+    ids = [r["id"] for r in records]
+    lot_ids = [r["id"] for r in records if "lot" in r]
+
+    rel = Path(month) / f"tx-{min(ids):010d}-{max(ids):010d}.jsonl.gz"
+    path = archive_root() / rel
+    _write_segment(path, records)
+    try:
+        created = [_dt(r["created_at"]) for r in records]
+        segment = ArchiveSegment(
+            month=month,
+            path=rel.as_posix(),
+            rows=len(records),
+            min_tx_id=min(ids),
+            max_tx_id=max(ids),
+            min_created_at=min(created),
+            max_created_at=max(created),
+        )
+        db.add(segment)
+
+        totals: dict[tuple[int, TxType], list[int]] = {}
+        for r in records:
+            acc = totals.setdefault((r["user_id"], TxType(r["type"])), [0, 0])
+            acc[0] += 1
+            acc[1] += r["amount"]
+        for (user_id, tx_type), (count, amount) in totals.items():
+            _bump_total(db, user_id, tx_type, count, amount)
+
+        # History without ?archived changes for these users.
+        bump_state_version(db, {r["user_id"] for r in records})
+        if lot_ids:
+            db.query(TicketLot).filter(TicketLot.tx_id.in_(lot_ids)).delete(synchronize_session=False)
+        db.query(Transaction).filter(Transaction.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        path.unlink(missing_ok=True)
+        raise
+    return {"month": month, "path": rel.as_posix(), "rows": len(records)}
+
+
+def archive_transactions(db: Session, before: datetime, batch_size: int = 5000) -> dict:
+    """Move transactions created before `before` into monthly segment files.
+
+    Every segment commits on its own, so an interrupted run can simply be started again.
+    """
+    batch_size = max(1, int(batch_size))
+    open_lots = select(TicketLot.tx_id).where(TicketLot.sold < TicketLot.added)
+    kept_open = (
+        db.query(Transaction.id)
+        .filter(Transaction.created_at < before, Transaction.id.in_(open_lots))
+        .count()
+    )
+
+    segments: list[dict] = []
+    while True:
+        rows = (
+            db.query(Transaction)
+            .filter(Transaction.created_at < before, Transaction.id.not_in(open_lots))
+            .order_by(Transaction.created_at.asc(), Transaction.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        # Snapshot the batch before the first commit expires it.
+        lots = {int(l.tx_id): l for l in db.query(TicketLot).filter(TicketLot.tx_id.in_([t.id for t in rows]))}
+        by_month: dict[str, list[dict]] = {}
+        for t in rows:
+            by_month.setdefault(t.created_at.strftime("%Y-%m"), []).append(_record(t, lots.get(int(t.id))))
+        db.expunge_all()
+        for month, records in by_month.items():
+            segments.append(_archive_month(db, month, records))
+
+    return {
+        "before": before.isoformat(),
+        "rows": sum(s["rows"] for s in segments),
+        "segments": segments,
+        "kept_open_lots": int(kept_open),
+    }
+
+
+def default_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(days=max(1, int(settings.archive_keep_days)))
+
+
+def list_segments(db: Session) -> list[dict]:
+    return [
+        {
+            "id": int(s.id),
+            "month": s.month,
+            "path": s.path,
+            "rows": int(s.rows),
+            "min_tx_id": int(s.min_tx_id),
+            "max_tx_id": int(s.max_tx_id),
+            "from": s.min_created_at.isoformat(),
+            "to": s.max_created_at.isoformat(),
+        }
+        for s in db.query(ArchiveSegment).order_by(ArchiveSegment.max_tx_id.desc())
+    ]
+
+
+def _segments(
+    db: Session,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    before_id: Optional[int],
+) -> list[tuple[str, int]]:
+    """(absolute path, max_tx_id) of the segments whose ranges can match, highest max_tx_id first."""
+    q = db.query(ArchiveSegment.path, ArchiveSegment.max_tx_id)
+    if since is not None:
+        q = q.filter(ArchiveSegment.max_created_at >= since)
+    if until is not None:
+        q = q.filter(ArchiveSegment.min_created_at <= until)
+    if before_id is not None:
+        q = q.filter(ArchiveSegment.min_tx_id < before_id)
+    root = archive_root()
+    return [(str(root / rel), int(max_id)) for rel, max_id in q.order_by(ArchiveSegment.max_tx_id.desc()).all()]
+
+
+def _matches(
+    t: ArchivedTx,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    before_id: Optional[int],
+    types: Optional[set[TxType]],
+) -> bool:
+    if since is not None and (t.created_at is None or t.created_at < since):
+        return False
+    if until is not None and (t.created_at is None or t.created_at > until):
+        return False
+    if before_id is not None and t.id >= before_id:
+        return False
+    return not types or t.type in types
+
+
+def iter_archived(
+    db: Session,
+    *,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    types: Optional[set[TxType]] = None,
+) -> Iterator[ArchivedTx]:
+    """Archived transactions matching the filters, newest segment first."""
+    for path, _ in _segments(db, since, until, before_id):
+        rows = _segment_by_user(path).get(int(user_id), ()) if user_id is not None else reversed(_load_segment(path))
+        for t in rows:
+            if _matches(t, since, until, before_id, types):
+                yield t
+
+
+def archived_history(
+    db: Session,
+    user_id: int,
+    limit: int,
+    before_id: Optional[int] = None,
+    *,
+    types: Optional[set[TxType]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> list[ArchivedTx]:
+    """Newest `limit` archived transactions of one user (ids below before_id).
+
+    Segments are visited by descending max_tx_id and stop as soon as `limit` rows are kept and
+    the next segment holds only smaller ids, so a page opens the newest few files, not all.
+    """
+    limit = max(0, int(limit))
+    if limit == 0:
+        return []
+    kept: list[tuple[int, ArchivedTx]] = []  # min-heap on id of the newest `limit` rows so far
+    for path, max_id in _segments(db, since, until, before_id):
+        if len(kept) == limit and max_id < kept[0][0]:
+            break
+        for t in _segment_by_user(path).get(int(user_id), ()):
+            if len(kept) == limit and t.id < kept[0][0]:
+                break  # rows are newest first, the rest of this segment is older still
+            if not _matches(t, since, until, before_id, types):
+                continue
+            if len(kept) < limit:
+                heapq.heappush(kept, (t.id, t))
+            else:
+                heapq.heapreplace(kept, (t.id, t))
+    return [t for _, t in sorted(kept, key=lambda x: x[0], reverse=True)]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.archive", description="Archive old transactions")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    run = sub.add_parser("run", help="archive transactions older than a cutoff")
+    run.add_argument("--before", default="", help="cutoff date YYYY-MM-DD (default: now - ARCHIVE_KEEP_DAYS)")
+    run.add_argument("--keep-days", type=int, default=None)
+    run.add_argument("--batch-size", type=int, default=settings.archive_batch_size)
+    sub.add_parser("list", help="list archive segments")
+    args = parser.parse_args(argv)
+
+    from app.db import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.cmd == "list":
+            report = list_segments(db)
+        else:
+            if args.before:
+                before = datetime.fromisoformat(args.before)
+            elif args.keep_days is not None:
+                before = datetime.utcnow() - timedelta(days=max(1, args.keep_days))
+            else:
+                before = default_cutoff()
+            report = archive_transactions(db, before, batch_size=args.batch_size)
+    finally:
+        db.close()
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,70 @@
+"""Race-free balance/ticket updates.
+
+Instead of `user.balance -= cost` on a loaded ORM object (lost updates under several workers),
+changes are applied as one conditional UPDATE ... RETURNING, and the loaded User is synced
+from the returned row, so no extra refresh round trip is needed.
+
+Every applied change also bumps User.state_version (the ETag of the user's read endpoints).
+"""
+from __future__ import annotations
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models import User
+
+
+def apply_user_delta(
+    db: Session,
+    user: User,
+    *,
+    balance: int = 0,
+    tickets_sneakers: int = 0,
+    tickets_bracelet: int = 0,
+    require_balance: int = 0,
+    require_sneakers: int = 0,
+    require_bracelet: int = 0,
+) -> bool:
+    """Atomically add deltas to the user row if it still holds the required amounts.
+
+    Returns False (and changes nothing) when a `require_*` guard fails.
+    The caller still owns the transaction and commits it.
+    """
+    stmt = update(User).where(User.user_id == int(user.user_id))
+    if require_balance > 0:
+        stmt = stmt.where(User.balance >= int(require_balance))
+    if require_sneakers > 0:
+        stmt = stmt.where(User.tickets_sneakers >= int(require_sneakers))
+    if require_bracelet > 0:
+        stmt = stmt.where(User.tickets_bracelet >= int(require_bracelet))
+
+    values = {"state_version": User.state_version + 1}
+    if balance:
+        values["balance"] = User.balance + int(balance)
+    if tickets_sneakers:
+        values["tickets_sneakers"] = User.tickets_sneakers + int(tickets_sneakers)
+    if tickets_bracelet:
+        values["tickets_bracelet"] = User.tickets_bracelet + int(tickets_bracelet)
+    stmt = stmt.values(**values).returning(
+        User.balance, User.tickets_sneakers, User.tickets_bracelet, User.state_version
+    )
+    row = db.execute(stmt, execution_options={"synchronize_session": False}).first()
+    if row is None:
+        return False
+
+    set_committed_value(user, "balance", int(row.balance or 0))
+    set_committed_value(user, "tickets_sneakers", int(row.tickets_sneakers or 0))
+    set_committed_value(user, "tickets_bracelet", int(row.tickets_bracelet or 0))
+    set_committed_value(user, "state_version", int(row.state_version or 0))
+    return True
+
+
+def bump_state_version(db: Session, user_ids) -> None:
+    """Mark users' read endpoints stale after a write that doesn't go through apply_user_delta."""
+    ids = sorted({int(x) for x in user_ids})
+    if ids:
+        db.execute(
+            update(User).where(User.user_id.in_(ids)).values(state_version=User.state_version + 1),
+            execution_options={"synchronize_session": False},
+        )
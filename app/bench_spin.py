@@ -0,0 +1,127 @@
+"""Spin throughput benchmark against a scratch SQLite file.
+
+Runs `--threads` workers, each spinning `--spins` times as its own user, once with the SQLite
+profile from app.db (WAL, synchronous=NORMAL, busy_timeout, ...) and once without it, and
+prints spins/s and failed spins ("database is locked" and friends) for both.
+Every mode runs in a fresh interpreter because the engine is configured at import time.
+
+CLI:  python -m app.bench_spin [--threads 8] [--spins 200] [--case r1] [--mode both|profile|plain]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def _run(threads: int, spins: int, case_id: str) -> dict:
+    from app.db import SessionLocal, engine, init_db
+    from app.models import User
+    from app.roulette import get_catalog, spin_once
+
+    init_db()
+    db = SessionLocal()
+    try:
+        get_catalog(db)
+        for i in range(threads):
+            db.add(User(user_id=10_000_000 + i, balance=10 ** 12))
+        db.commit()
+    finally:
+        db.close()
+
+    ok = [0] * threads
+    failed = [0] * threads
+    errors: dict[str, int] = {}
+    errors_lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+
+    def worker(i: int) -> None:
+        s = SessionLocal()
+        try:
+            user = s.get(User, 10_000_000 + i)
+            start.wait()
+            for _ in range(spins):
+                try:
+                    spin_once(s, user, case_id)
+                    ok[i] += 1
+                except Exception as e:
+                    s.rollback()
+                    failed[i] += 1
+                    key = str(getattr(e, "orig", e)).splitlines()[0][:80]
+                    with errors_lock:
+                        errors[key] = errors.get(key, 0) + 1
+                    user = s.get(User, 10_000_000 + i)
+        finally:
+            s.close()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    with engine.connect() as conn:
+        journal = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+
+    return {
+        "journal_mode": journal,
+        "synchronous": synchronous,
+        "threads": threads,
+        "spins": sum(ok),
+        "failed": sum(failed),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "spins_per_sec": round(sum(ok) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def _spawn(mode: str, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        env["SQLITE_PROFILE_ENABLED"] = "true" if mode == "profile" else "false"
+        env["SQL_TIMING_ENABLED"] = "false"
+        env["ASYNC_DB_ENABLED"] = "false"
+        cmd = [
+            sys.executable, "-m", "app.bench_spin", "--worker",
+            "--threads", str(args.threads), "--spins", str(args.spins), "--case", args.case,
+        ]
+        out = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["mode"] = mode
+    return result
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench_spin", description="SQLite spin throughput benchmark")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--spins", type=int, default=200, help="spins per thread")
+    parser.add_argument("--case", default="r1")
+    parser.add_argument("--mode", choices=("both", "profile", "plain"), default="both")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.threads = max(1, args.threads)
+    args.spins = max(1, args.spins)
+
+    if args.worker:
+        sys.stdout.write(json.dumps(_run(args.threads, args.spins, args.case)) + "\n")
+        return 0
+
+    modes = ("plain", "profile") if args.mode == "both" else (args.mode,)
+    report = [_spawn(mode, args) for mode in modes]
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,190 @@
+"""Webhook mode: the bot's aiogram Dispatcher (bot.run.dp) served by the web app.
+
+With BOT_WEBHOOK_ENABLED=true the app registers `PUBLIC_BASE_URL + BOT_WEBHOOK_PATH` with
+setWebhook on startup, and Telegram pushes updates to that route instead of the bot process
+long-polling getUpdates. Updates are handled concurrently (Telegram keeps up to
+BOT_WEBHOOK_MAX_CONNECTIONS requests in flight), and payments / referral binds call the app's
+own logic in-process instead of going back over HTTP through the tunnel.
+
+Payments the polling bot queued in its outbox (BOT_OUTBOX_PATH) before the switch are credited
+on startup, and setWebhook is retried in the background, so Telegram being unreachable never
+keeps the web app from starting.
+
+aiogram is only imported here, so the web app does not need it unless webhook mode is on.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+from typing import Any, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.db import SessionLocal
+from app.payments import credit_payment
+from app.telegram_auth import webhook_secret
+
+log = logging.getLogger("app.bot_webhook")
+
+REGISTER_RETRY = 5.0
+REGISTER_MAX_RETRY = 300.0
+OUTBOX_DRAIN_BATCH = 500
+
+_bot: Any = None
+_tasks: set[asyncio.Task] = set()
+
+
+def expected_secret() -> str:
+    return webhook_secret(settings.bot_token, settings.bot_webhook_secret)
+
+
+def webhook_url() -> str:
+    return settings.public_base_url.rstrip("/") + settings.bot_webhook_path
+
+
+def _credit(user_id: int, charge_id: str, total_amount: int) -> bool:
+    db = SessionLocal()
+    try:
+        if not credit_payment(db, int(user_id), charge_id, int(total_amount)):
+            db.rollback()
+            return False
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def _drain_outbox() -> list:
+    """Credit everything left in the polling bot's outbox. Returns the newly credited items."""
+    if not os.path.exists(settings.bot_outbox_path):
+        return []
+    from bot.outbox import PaymentOutbox
+
+    outbox = PaymentOutbox(settings.bot_outbox_path)
+    credited = []
+    try:
+        while True:
+            items = outbox.due(OUTBOX_DRAIN_BATCH, now=math.inf)
+            if not items:
+                return credited
+            db = SessionLocal()
+            try:
+                fresh = [it for it in items if credit_payment(db, it.user_id, it.charge_id, it.total_amount)]
+                db.commit()
+            finally:
+                db.close()
+            outbox.done([it.charge_id for it in items])
+            credited.extend(fresh)
+    finally:
+        outbox.close()
+
+
+def _bind(bind_referral: Callable[[Any, int, int], Any], user_id: int, referrer_id: int) -> None:
+    db = SessionLocal()
+    try:
+        bind_referral(db, int(user_id), int(referrer_id))
+    finally:
+        db.close()
+
+
+async def _register(bot: Any, allowed_updates: list[str]) -> None:
+    delay = REGISTER_RETRY
+    while True:
+        try:
+            await bot.set_webhook(
+                url=webhook_url(),
+                secret_token=expected_secret(),
+                allowed_updates=allowed_updates,
+                max_connections=max(1, min(100, int(settings.bot_webhook_max_connections))),
+            )
+            log.info("bot webhook set: %s", webhook_url())
+            return
+        except Exception:
+            log.exception("setWebhook failed, retrying in %.0f s", delay)
+        await asyncio.sleep(delay)
+        delay = min(REGISTER_MAX_RETRY, delay * 2)
+
+
+async def _notify_drained(bot: Any, notify: Callable[..., Any], items: list) -> None:
+    for item in items:
+        try:
+            await notify(bot, item, True)
+        except Exception as e:
+            log.warning("payment notify failed: charge_id=%s err=%s", item.charge_id, e)
+
+
+def _spawn(coro) -> None:
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def start(bind_referral: Callable[[Any, int, int], Any]) -> None:
+    """Credit the outbox backlog, create the bot, route its hooks in-process, register the webhook.
+
+    bind_referral(db, user_id, referrer_id) is app.main.referral_bind (passed in to avoid a cycle).
+    setWebhook runs in a background task (retried until it succeeds).
+    """
+    global _bot
+    if not settings.bot_token:
+        raise RuntimeError("BOT_WEBHOOK_ENABLED=true requires BOT_TOKEN")
+    if not settings.public_base_url:
+        raise RuntimeError("BOT_WEBHOOK_ENABLED=true requires PUBLIC_BASE_URL")
+
+    # Before anything that needs aiogram or Telegram: these payments are already confirmed.
+    drained = await run_in_threadpool(_drain_outbox)
+    if drained:
+        log.info("credited %d payment(s) left in the bot outbox", len(drained))
+
+    import bot.run as bot_run
+
+    async def in_process_credit(user_id: int, charge_id: str, total_amount: int) -> bool:
+        return await run_in_threadpool(_credit, user_id, charge_id, total_amount)
+
+    async def in_process_bind(user_id: int, referrer_id: int) -> None:
+        await run_in_threadpool(_bind, bind_referral, user_id, referrer_id)
+
+    bot_run.in_process_credit = in_process_credit
+    bot_run.in_process_bind = in_process_bind
+
+    _bot = bot_run.make_bot()
+    _spawn(_register(_bot, bot_run.dp.resolve_used_update_types()))
+    if drained:
+        _spawn(_notify_drained(_bot, bot_run.notify_payment, drained))
+
+
+async def handle(data: dict) -> None:
+    """Feed one update to the dispatcher.
+
+    Failures of a successful_payment update are re-raised, so the route answers 500 and Telegram
+    redelivers it (crediting is idempotent on the charge id). Anything else is logged and
+    acknowledged: a broken /start must not make Telegram retry it forever.
+    """
+    if _bot is None:
+        raise RuntimeError("bot webhook is not started")
+
+    from aiogram.types import Update
+
+    import bot.run as bot_run
+
+    update = Update.model_validate(data, context={"bot": _bot})
+    try:
+        await bot_run.dp.feed_update(_bot, update)
+    except Exception:
+        message: Optional[Any] = update.message
+        if message is not None and message.successful_payment is not None:
+            raise
+        log.exception("bot update %s failed", update.update_id)
+
+
+async def stop() -> None:
+    """Close the bot's HTTP session. The webhook stays registered for the next start."""
+    global _bot
+    for task in list(_tasks):
+        task.cancel()
+    bot, _bot = _bot, None
+    if bot is not None:
+        await bot.session.close()
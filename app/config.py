@@ -18,9 +18,44 @@ class Settings(BaseSettings):
     bot_token: str = Field(default="", alias="BOT_TOKEN")
     bot_username: str = Field(default="madesix_bot", alias="BOT_USERNAME")
     telegram_proxy: str = Field(default="", alias="TELEGRAM_PROXY")
+    # Webhook mode: the bot runs inside the web app at PUBLIC_BASE_URL + BOT_WEBHOOK_PATH instead of
+    # a separate polling process (empty secret = derived from BOT_TOKEN)
+    bot_webhook_enabled: bool = Field(default=False, alias="BOT_WEBHOOK_ENABLED")
+    bot_webhook_path: str = Field(default="/tg/webhook", alias="BOT_WEBHOOK_PATH")
+    bot_webhook_secret: str = Field(default="", alias="BOT_WEBHOOK_SECRET")
+    bot_webhook_max_connections: int = Field(default=40, alias="BOT_WEBHOOK_MAX_CONNECTIONS")
+    # initData verification cache (0 max age = auth_date is not checked)
+    init_data_max_age: int = Field(default=0, alias="INIT_DATA_MAX_AGE")
+    init_data_cache_size: int = Field(default=4096, alias="INIT_DATA_CACHE_SIZE")
+    init_data_cache_ttl: int = Field(default=300, alias="INIT_DATA_CACHE_TTL")
+    # Signed session tokens issued by /api/session (empty secret = derived from BOT_TOKEN)
+    session_secret: str = Field(default="", alias="SESSION_SECRET")
+    session_token_ttl: int = Field(default=3600, alias="SESSION_TOKEN_TTL")
 
     # --- DB ---
     database_url: str = Field(default="sqlite:///./data/app.db", alias="DATABASE_URL")
+    # SQLite storage profile (applied on every new connection)
+    sqlite_profile_enabled: bool = Field(default=True, alias="SQLITE_PROFILE_ENABLED")
+    sqlite_busy_timeout_ms: int = Field(default=5000, alias="SQLITE_BUSY_TIMEOUT_MS")
+    sqlite_cache_size_kib: int = Field(default=65536, alias="SQLITE_CACHE_SIZE_KIB")
+    sqlite_mmap_size: int = Field(default=268435456, alias="SQLITE_MMAP_SIZE")
+    # Connection pool (ignored for in-memory SQLite)
+    db_pool_size: int = Field(default=10, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=20, alias="DB_MAX_OVERFLOW")
+    db_pool_timeout: int = Field(default=30, alias="DB_POOL_TIMEOUT")
+    # Read-only engine for admin analytics: replica URL, or empty = same SQLite file with query_only
+    read_database_url: str = Field(default="", alias="READ_DATABASE_URL")
+    read_pool_size: int = Field(default=4, alias="READ_DB_POOL_SIZE")
+    # Cold archive of old transactions (python -m app.archive, POST /api/admin/archive)
+    archive_dir: str = Field(default="./data/archive", alias="ARCHIVE_DIR")
+    archive_keep_days: int = Field(default=90, alias="ARCHIVE_KEEP_DAYS")
+    archive_batch_size: int = Field(default=5000, alias="ARCHIVE_BATCH_SIZE")
+    # Seconds between sealing finished days into the admin stats rollups (0 = only python -m app.rollups)
+    stats_seal_interval: int = Field(default=3600, alias="STATS_SEAL_INTERVAL")
+    # Async engine for user hot paths (aiosqlite for SQLite, asyncpg for Postgres)
+    async_db_enabled: bool = Field(default=False, alias="ASYNC_DB_ENABLED")
+    # Per-request SQL statement count/time in a Server-Timing header (+ debug log)
+    sql_timing_enabled: bool = Field(default=False, alias="SQL_TIMING_ENABLED")
 
     # --- URLs ---
     public_base_url: str = Field(default="", alias="PUBLIC_BASE_URL")
@@ -28,12 +63,21 @@ class Settings(BaseSettings):
 
     # --- Roulette ---
     spin_cost: int = Field(default=150, alias="SPIN_COST")
+    # Seconds before the in-process case catalog is reloaded from DB (0 = only on save_cases).
+    # Set it when several workers share one DB, so admin edits reach every worker.
+    case_catalog_ttl: int = Field(default=0, alias="CASE_CATALOG_TTL")
+    # Cache-Control max-age for /api/cases (0 = always revalidate by ETag)
+    cases_cache_max_age: int = Field(default=0, alias="CASES_CACHE_MAX_AGE")
 
     # --- Admin ---
     admin_telegram_ids: str = Field(default="", alias="ADMIN_TELEGRAM_IDS")
 
     # --- Internal API (bot -> backend) ---
     internal_api_token: str = Field(default="", alias="INTERNAL_API_TOKEN")
+    # Bot-side outbox of payment confirmations, retried until the backend accepts them
+    bot_outbox_path: str = Field(default="./data/bot_outbox.db", alias="BOT_OUTBOX_PATH")
+    bot_outbox_batch_size: int = Field(default=100, alias="BOT_OUTBOX_BATCH_SIZE")
+    bot_outbox_max_backoff: int = Field(default=300, alias="BOT_OUTBOX_MAX_BACKOFF")
 
     # --- Referrals ---
     referral_bonus_percent: int = Field(default=0, alias="REFERRAL_BONUS_PERCENT")
@@ -1,28 +1,194 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from app.config import settings
+from app.sql_timing import install as install_sql_timing
+
+IS_SQLITE = settings.database_url.startswith("sqlite")
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.rstrip("/") in ("sqlite:", "sqlite+pysqlite:"))
+
+
+def _pool_args(url: str) -> dict:
+    if _is_memory_sqlite(url):
+        return {}
+    return {
+        "pool_size": max(1, settings.db_pool_size),
+        "max_overflow": max(0, settings.db_max_overflow),
+        "pool_timeout": max(1, settings.db_pool_timeout),
+        "pool_pre_ping": not url.startswith("sqlite"),
+    }
+
+
+def _apply_sqlite_profile(dbapi_connection, in_memory: bool) -> None:
+    """WAL + NORMAL sync + busy timeout: web and bot share one file without 'database is locked'."""
+    cur = dbapi_connection.cursor()
+    try:
+        cur.execute(f"PRAGMA busy_timeout={max(0, int(settings.sqlite_busy_timeout_ms))}")
+        if not in_memory:
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute(f"PRAGMA mmap_size={max(0, int(settings.sqlite_mmap_size))}")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        # negative cache_size = KiB instead of pages
+        cur.execute(f"PRAGMA cache_size=-{max(0, int(settings.sqlite_cache_size_kib))}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cur.close()
+
+
+def install_sqlite_profile(sync_engine) -> None:
+    """Apply the profile on every new connection, judged by this engine's own URL."""
+    url = sync_engine.url
+    if url.get_backend_name() != "sqlite" or not settings.sqlite_profile_enabled:
+        return
+    in_memory = url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+    def _on_connect(dbapi_connection, connection_record) -> None:
+        _apply_sqlite_profile(dbapi_connection, in_memory)
+
+    event.listen(sync_engine, "connect", _on_connect)
+
 
 # SQLAlchemy setup
 engine = create_engine(
     settings.database_url,
-    connect_args={"check_same_thread": False} if settings.database_url.startswith("sqlite") else {},
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **_pool_args(settings.database_url),
 )
 
+install_sqlite_profile(engine)
+install_sql_timing(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL to its async driver (aiosqlite / asyncpg)."""
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        return url
+    base = scheme.split("+", 1)[0]
+    if base == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if base in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+def _read_only_connect(dbapi_connection, connection_record) -> None:
+    cur = dbapi_connection.cursor()
+    try:
+        if READ_URL.startswith("sqlite"):
+            cur.execute("PRAGMA query_only=ON")
+        elif READ_URL.startswith("postgres"):
+            cur.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+    finally:
+        cur.close()
+
+
+def _make_read_engine():
+    """Second engine for long admin reads, so they never hold the pool /api/spin needs.
+
+    READ_DATABASE_URL points it at a replica; when empty, a file SQLite database is opened
+    a second time with query_only. Anything else (in-memory SQLite, no replica) shares `engine`.
+    """
+    url = settings.read_database_url or settings.database_url
+    if url == settings.database_url and (not IS_SQLITE or _is_memory_sqlite(url)):
+        return engine, url
+    is_sqlite = url.startswith("sqlite")
+    args = _pool_args(url)
+    if args:
+        args["pool_size"] = max(1, settings.read_pool_size)
+        args["max_overflow"] = 0
+    ro = create_engine(url, connect_args={"check_same_thread": False} if is_sqlite else {}, **args)
+    install_sqlite_profile(ro)
+    event.listen(ro, "connect", _read_only_connect)
+    install_sql_timing(ro)
+    return ro, url
+
+
+read_engine, READ_URL = _make_read_engine()
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+# Optional async engine (ASYNC_DB_ENABLED): user hot paths then run on the event loop
+# instead of holding a threadpool slot for their whole DB round trip.
+async_engine = None
+AsyncSessionLocal = None
+if settings.async_db_enabled:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    async_args = _pool_args(settings.database_url)
+    if IS_SQLITE and async_args:
+        # aiosqlite defaults to NullPool (a new connection + pragmas per request).
+        async_args["poolclass"] = AsyncAdaptedQueuePool
+    async_engine = create_async_engine(
+        async_database_url(settings.database_url),
+        connect_args={"check_same_thread": False} if IS_SQLITE else {},
+        **async_args,
+    )
+    install_sqlite_profile(async_engine.sync_engine)
+    install_sql_timing(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
 Base = declarative_base()
 
 
-def init_db() -> None:
-    """Create tables if they don't exist.
+def add_missing_columns(bind) -> list[str]:
+    """Add model columns and indexes missing from existing tables (create_all only creates new tables).
+
+    Only nullable columns or columns with a server_default can be added this way.
+    Returns the added columns as "table.column".
+    """
+    from sqlalchemy import inspect as sa_inspect
+
+    insp = sa_inspect(bind)
+    existing_tables = set(insp.get_table_names())
+    added: list[str] = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        have = {c["name"] for c in insp.get_columns(table.name)}
+        missing = [c for c in table.columns if c.name not in have]
+        if missing:
+            with bind.begin() as conn:
+                for col in missing:
+                    ddl = f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(dialect=bind.dialect)}'
+                    if col.server_default is not None:
+                        ddl += f" DEFAULT {col.server_default.arg}"
+                    conn.exec_driver_sql(ddl)
+                    added.append(f"{table.name}.{col.name}")
+        have_idx = {i["name"] for i in insp.get_indexes(table.name)}
+        for idx in table.indexes:
+            if idx.name not in have_idx:
+                idx.create(bind=bind)
+    return added
+
+
+_ON_CONFLICT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def on_conflict_insert(db):
+    """The dialect's `insert` with ON CONFLICT support (SQLite, Postgres), or None on other backends."""
+    return _ON_CONFLICT_INSERTS.get(db.get_bind().dialect.name)
+
+
+def init_db() -> list[str]:
+    """Create tables if they don't exist and add columns new models introduced.
 
     IMPORTANT: we import models inside the function to avoid circular imports.
+    Returns the columns added to existing tables.
     """
     # Ensure models are imported so they register with Base.metadata
     import app.models  # noqa: F401
 
     Base.metadata.create_all(bind=engine)
+    return add_missing_columns(engine)
 
 
 def get_db():
@@ -31,3 +197,17 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Session on the read-only engine (admin GET endpoints)."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
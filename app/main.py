@@ -1,48 +1,140 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
+import hmac
+import inspect
 import json
+import logging
 import re
+import time
 from datetime import datetime, date
 from pathlib import Path
-from typing import Optional
+from typing import Mapping, Optional
 from uuid import uuid4
 
-from fastapi import FastAPI, Request, Depends, HTTPException, Query, Header, UploadFile, File
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Response, Depends, HTTPException, Query, Header, UploadFile, File
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
 
-from app.db import SessionLocal, init_db
+from app.db import AsyncSessionLocal, SessionLocal, get_async_db, get_read_db, init_db
 from app.models import (
-    User, Transaction, PrizeRequest, WithdrawRequest, Payment,
-    PrizeConfig, PrizeKey, TxType, WithdrawStatus, PrizeReqStatus
+    User, Transaction, PrizeRequest, WithdrawRequest,
+    PrizeConfig, PrizeKey, TxType, WithdrawStatus, PrizeReqStatus, TicketLot, UserStat
 )
-from app.schemas import SpinIn, WithdrawIn, InvoiceIn
+from app.schemas import SpinIn, SpinBatchIn, WithdrawIn, InvoiceIn, PaymentConfirmBatchIn
 from app.config import settings
-from app.telegram_session import get_tg_user_id
-
-from app.roulette import spin_once, ensure_case_configs, list_cases, save_cases  # spin_once(db, user, roulette_id) -> dict
+from app.sql_timing import count_statements
+from app.telegram_session import get_tg_user_id, get_session_claims, issue_session_token
+
+from app.roulette import CaseCatalog, spin_once, spin_batch, get_catalog, list_cases, save_cases, normalize_case  # spin_once(db, user, roulette_id) -> dict
+from app.balance import apply_user_delta
+from app import bot_webhook
+from app.media_config import MediaConfig, content_digest, get_media_config, save_media_config as write_media_config
+from app.archive import archive_transactions, archived_history, default_cutoff, list_segments
+from app.migrations import ensure_transaction_columns
+from app.payments import credit_payment
+from app.export import FORMATS as EXPORT_FORMATS, ExportFilter, export_filename, stream_export
+from app.rollups import seal_finished_days, stats_report
+from app.tickets import ensure_ticket_lots, open_ticket_lots, sell_ticket_lot, user_ticket_progress
+from app.user_stats import add_user_stats, ensure_user_stats
 
 
 app = FastAPI()
 
 @app.on_event("startup")
 def _startup():
-    init_db()
+    added_columns = init_db()
+    db = SessionLocal()
+    try:
+        ensure_transaction_columns(db, added_columns)
+        ensure_user_stats(db)
+        get_catalog(db)
+        ensure_ticket_lots(db)
+    finally:
+        db.close()
+
+
+def _seal_stats() -> None:
     db = SessionLocal()
     try:
-        ensure_case_configs(db)
+        seal_finished_days(db)
     finally:
         db.close()
 
 
+async def _stats_sealer(interval: int) -> None:
+    while True:
+        try:
+            await run_in_threadpool(_seal_stats)
+        except Exception:
+            logging.getLogger("app.rollups").exception("sealing daily stats failed")
+        await asyncio.sleep(interval)
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+@app.on_event("startup")
+async def _start_background_tasks():
+    if settings.stats_seal_interval > 0:
+        task = asyncio.create_task(_stats_sealer(settings.stats_seal_interval))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def _stop_background_tasks():
+    for task in list(_background_tasks):
+        task.cancel()
+
+
+@app.on_event("startup")
+async def _start_bot_webhook():
+    if not settings.bot_webhook_enabled:
+        return
+    try:
+        await bot_webhook.start(referral_bind)
+    except Exception:
+        # The web app keeps serving; webhook updates answer 500 (Telegram retries) until fixed.
+        logging.getLogger("app.bot_webhook").exception("bot webhook mode failed to start")
+
+
+@app.on_event("shutdown")
+async def _stop_bot_webhook():
+    if settings.bot_webhook_enabled:
+        await bot_webhook.stop()
+
+
+sql_log = logging.getLogger("app.sql")
+
+
+@app.middleware("http")
+async def _sql_timing(request: Request, call_next):
+    if not settings.sql_timing_enabled or not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    started = time.perf_counter()
+    with count_statements() as stats:
+        response = await call_next(request)
+    total_ms = (time.perf_counter() - started) * 1000.0
+    response.headers.append("Server-Timing", f"{stats.server_timing()}, app;dur={total_ms:.1f}")
+    sql_log.debug(
+        "%s %s -> %s: %d statements, db %.1f ms, total %.1f ms",
+        request.method, request.url.path, response.status_code, stats.statements, stats.ms, total_ms,
+    )
+    return response
+
+
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
-MEDIA_CONFIG_PATH = Path("app/static/prizes/roulettes.json")
 UPLOADS_DIR = Path("app/static/uploads")
+SIMULATE_MAX_STEPS = 50_000_000
 
 
 def get_db():
@@ -53,6 +145,36 @@ def get_db():
         db.close()
 
 
+def hot_path(method: str, path: str):
+    """Register a user hot-path handler.
+
+    With ASYNC_DB_ENABLED the route becomes an async endpoint on the async engine; the same
+    handler body runs through AsyncSession.run_sync, so there is one implementation.
+    """
+    def deco(fn):
+        if AsyncSessionLocal is None:
+            return app.api_route(path, methods=[method])(fn)
+
+        from sqlalchemy.ext.asyncio import AsyncSession
+
+        sig = inspect.signature(fn)
+        params = [
+            p.replace(default=Depends(get_async_db), annotation=AsyncSession) if p.name == "db" else p
+            for p in sig.parameters.values()
+        ]
+
+        @functools.wraps(fn)
+        async def run(**kwargs):
+            adb = kwargs.pop("db")
+            return await adb.run_sync(lambda db: fn(db=db, **kwargs))
+
+        run.__signature__ = sig.replace(parameters=params)
+        app.api_route(path, methods=[method])(run)
+        return fn
+
+    return deco
+
+
 def ensure_user(db: Session, user_id: int) -> User:
     u = db.query(User).filter(User.user_id == user_id).first()
     if not u:
@@ -77,10 +199,47 @@ def _is_local_browser_test_request(request: Request) -> bool:
 
 
 def get_request_user_id(request: Request, db: Session) -> int | None:
+    claims = get_session_claims(request)
+    if claims:
+        return int(claims[0])
+
     uid = get_tg_user_id(request)
     if uid:
         return int(uid)
 
+    return _browser_test_user_id(request, db)
+
+
+STATE_CACHE_CONTROL = "private, no-cache"
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == bare for t in if_none_match.split(","))
+
+
+def _state_cache(request: Request, response: Response, db: Session, uid: int, kind: str, *parts) -> Response | None:
+    """ETag the user's read endpoints by User.state_version.
+
+    Returns a 304 response (after one primary-key lookup) when the client copy is current;
+    otherwise sets ETag/Cache-Control on `response` and returns None.
+    """
+    version = db.query(User.state_version).filter(User.user_id == int(uid)).scalar()
+    etag = 'W/"' + "-".join(str(p) for p in (kind, int(uid), int(version or 0), *parts)) + '"'
+    if version is not None and _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": STATE_CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = STATE_CACHE_CONTROL
+    return None
+
+
+def _browser_test_user_id(request: Request, db: Session) -> int | None:
     if not bool(getattr(settings, "browser_test_auth_enabled", False)):
         return None
     if not _is_local_browser_test_request(request):
@@ -92,6 +251,7 @@ def get_request_user_id(request: Request, db: Session) -> int | None:
     u = ensure_user(db, test_uid)
     if int(u.balance or 0) < min_balance:
         u.balance = min_balance
+        u.state_version = int(u.state_version or 0) + 1
         db.add(u)
         db.commit()
         db.refresh(u)
@@ -126,8 +286,10 @@ def require_admin(uid: int | None):
 
 
 def get_admin_uid(request: Request, db: Session | None = None) -> int:
-    uid = get_tg_user_id(request)
-    if uid and is_admin(uid):
+    claims = get_session_claims(request)
+    uid = claims[0] if claims else get_tg_user_id(request)
+    # A session token must carry the admin flag; the admin list stays authoritative.
+    if uid and is_admin(uid) and (claims is None or claims[1]):
         return int(uid)
 
     # Local fallback for admin editing in browser (localhost only).
@@ -143,31 +305,14 @@ def get_admin_uid(request: Request, db: Session | None = None) -> int:
 
 
 def load_media_config() -> dict:
-    if not MEDIA_CONFIG_PATH.exists():
-        return {"event": {}, "roulettes": {}, "ticket_targets": {}, "economy": {}, "contact": {}}
-    with MEDIA_CONFIG_PATH.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-    if not isinstance(data, dict):
-        return {"event": {}, "roulettes": {}, "ticket_targets": {}, "economy": {}, "contact": {}}
-    data.setdefault("event", {})
-    data.setdefault("roulettes", {})
-    data.setdefault("ticket_targets", {})
-    data.setdefault("economy", {})
-    data.setdefault("contact", {})
-    return data
+    return get_media_config().to_dict()
 
 
 def save_media_config(payload: dict) -> None:
-    if not isinstance(payload, dict):
-        raise HTTPException(status_code=400, detail="payload must be object")
-    payload.setdefault("event", {})
-    payload.setdefault("roulettes", {})
-    payload.setdefault("ticket_targets", {})
-    payload.setdefault("economy", {})
-    payload.setdefault("contact", {})
-    MEDIA_CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with MEDIA_CONFIG_PATH.open("w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    try:
+        write_media_config(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 def _human_code_title(code: str) -> str:
@@ -199,47 +344,31 @@ def _rarity_title(v: str) -> str:
     }.get(str(v or "").lower(), "Обычный")
 
 
-def _ticket_sell_percent(media: dict) -> int:
-    economy = media.get("economy") if isinstance(media.get("economy"), dict) else {}
-    return max(0, min(100, int((economy or {}).get("ticket_sell_percent") or 50)))
-
-
-def _ticket_sell_lots(db: Session, user: User, media: dict) -> list[dict]:
-    sell_percent = _ticket_sell_percent(media)
-    rows = (
-        db.query(Transaction)
-        .filter(Transaction.user_id == int(user.user_id), Transaction.type == TxType.win)
-        .order_by(Transaction.id.desc())
-        .all()
-    )
+def _ticket_sell_lots(db: Session, user: User, media: MediaConfig) -> list[dict]:
+    sell_percent = media.ticket_sell_percent
     lots: list[dict] = []
-    for t in rows:
-        meta = dict(t.meta or {})
-        added = int(meta.get("hidden_tickets_added") or 0)
-        sold = int(meta.get("hidden_tickets_sold") or 0)
-        left = max(0, added - sold)
-        if left <= 0:
-            continue
-        code = str(meta.get("prize_code") or "")
-        if not code:
+    for lot in open_ticket_lots(db, int(user.user_id)):
+        left = max(0, int(lot.added or 0) - int(lot.sold or 0))
+        code = str(lot.code or "")
+        if left <= 0 or not code:
             continue
-        case_cost = max(0, int(meta.get("case_cost") or 0))
+        case_cost = max(0, int(lot.case_cost or 0))
         unit_price = (case_cost * sell_percent) // 100 if case_cost > 0 else 0
         lots.append(
             {
-                "tx_id": int(t.id),
+                "tx_id": int(lot.tx_id),
                 "code": code,
                 "title": _human_code_title(code),
-                "ticket_kind": str(meta.get("hidden_ticket_kind") or ("bracelet" if code == "bracelet" else "sneakers")),
-                "rarity": str(meta.get("rarity") or "blue"),
-                "rarity_title": _rarity_title(str(meta.get("rarity") or "blue")),
+                "ticket_kind": str(lot.ticket_kind or ("bracelet" if code == "bracelet" else "sneakers")),
+                "rarity": str(lot.rarity or "blue"),
+                "rarity_title": _rarity_title(str(lot.rarity or "blue")),
                 "left": left,
-                "case_id": str(meta.get("roulette_id") or ""),
+                "case_id": str(lot.roulette_id or ""),
                 "case_cost": case_cost,
                 "sell_percent": sell_percent,
                 "unit_sell_price": unit_price,
                 "sell_price_total": unit_price * left,
-                "created_at": t.created_at.isoformat() if t.created_at else None,
+                "created_at": lot.created_at.isoformat() if lot.created_at else None,
             }
         )
     return lots
@@ -259,40 +388,56 @@ def admin_page(request: Request):
 
 # ---------------- PUBLIC API (MiniApp) ----------------
 
-@app.get("/api/me")
-def api_me(request: Request, db: Session = Depends(get_db)):
-    uid = get_request_user_id(request, db)
+@app.post("/api/session")
+def api_session(request: Request, db: Session = Depends(get_db)):
+    """Exchange initData for a compact signed session token (sent back as X-Session-Token)."""
+    uid = get_tg_user_id(request) or _browser_test_user_id(request, db)
     if not uid:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    u = ensure_user(db, uid)
+    token, expires_at = issue_session_token(int(uid), is_admin(uid))
+    return {"token": token, "expires_at": expires_at, "user_id": int(uid), "is_admin": is_admin(uid)}
+
+
+@hot_path("GET", "/api/me")
+def api_me(request: Request, response: Response, db: Session = Depends(get_db)):
+    uid = get_request_user_id(request, db)
+    if not uid:
+        raise HTTPException(status_code=401, detail="Unauthorized")
 
     bot_username = getattr(settings, "bot_username", None) or "madesix_bot"
     ref_link = f"https://t.me/{bot_username}?start=ref_{uid}"
+    admin = is_admin(uid)
+
+    # is_admin and ref_link come from settings, not the user row: a config change must change the ETag.
+    config_tag = content_digest({"admin": admin, "ref_link": ref_link})
+    not_modified = _state_cache(request, response, db, uid, "me", config_tag)
+    if not_modified is not None:
+        return not_modified
+    u = ensure_user(db, uid)
 
     return {
         "user_id": uid,
         "balance": int(u.balance),
         "tickets_sneakers": int(u.tickets_sneakers),
         "tickets_bracelet": int(u.tickets_bracelet),
-        "is_admin": is_admin(uid),
+        "is_admin": admin,
         "ref_link": ref_link,
     }
 
 
-@app.get("/api/cases")
-def api_cases(db: Session = Depends(get_db)):
-    media = load_media_config()
-    media_roulettes = media.get("roulettes") if isinstance(media.get("roulettes"), dict) else {}
+def _cases_payload(catalog: CaseCatalog, media: MediaConfig) -> dict:
+    media_roulettes = media.roulettes
     items: list[dict] = []
-    for c in list_cases(db):
+    for compiled in catalog.cases:
+        c = compiled.case
         if not int(c.get("is_enabled") or 0):
             continue
         rid = str(c.get("id") or "")
-        media_case = media_roulettes.get(rid) if isinstance(media_roulettes, dict) else {}
-        if not isinstance(media_case, dict):
+        media_case = media_roulettes.get(rid)
+        if not isinstance(media_case, Mapping):
             media_case = {}
-        media_items = media_case.get("items") if isinstance(media_case.get("items"), dict) else {}
+        media_items = media_case.get("items") if isinstance(media_case.get("items"), Mapping) else {}
         prizes = []
         for p in (c.get("prizes") or []):
             if not int(p.get("is_enabled") or 0):
@@ -321,21 +466,44 @@ def api_cases(db: Session = Depends(get_db)):
             }
         )
 
-    event = media.get("event") if isinstance(media.get("event"), dict) else {}
-    contact = media.get("contact") if isinstance(media.get("contact"), dict) else {}
-    economy = media.get("economy") if isinstance(media.get("economy"), dict) else {}
     return {
         "items": items,
-        "event": event,
-        "contact": contact,
+        "event": dict(media.event),
+        "contact": dict(media.contact),
         "economy": {
-            "ticket_sell_percent": _ticket_sell_percent(media),
-            "near_target_ticket_boost_percent": max(0, min(100, int((economy or {}).get("near_target_ticket_boost_percent") or 0))),
+            "ticket_sell_percent": media.ticket_sell_percent,
+            "near_target_ticket_boost_percent": media.near_target_ticket_boost_percent,
         },
     }
 
 
-@app.post("/api/spin")
+# (catalog version, media version, body, etag); both versions bump on save_cases/save_media_config.
+_cases_cache: tuple[int, int, bytes, str] | None = None
+
+
+def _cases_body(catalog: CaseCatalog, media: MediaConfig) -> tuple[bytes, str]:
+    global _cases_cache
+    cached = _cases_cache
+    if cached is not None and cached[0] == catalog.version and cached[1] == media.version:
+        return cached[2], cached[3]
+    # Same encoding as JSONResponse, done once per version instead of per request.
+    body = json.dumps(_cases_payload(catalog, media), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    _cases_cache = (catalog.version, media.version, body, etag)
+    return body, etag
+
+
+@app.get("/api/cases")
+def api_cases(request: Request, db: Session = Depends(get_db)):
+    body, etag = _cases_body(get_catalog(db), get_media_config())
+    max_age = max(0, int(settings.cases_cache_max_age))
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}" if max_age else "public, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@hot_path("POST", "/api/spin")
 def api_spin(payload: SpinIn, request: Request, db: Session = Depends(get_db)):
     uid = get_request_user_id(request, db)
     if not uid:
@@ -353,9 +521,41 @@ def api_spin(payload: SpinIn, request: Request, db: Session = Depends(get_db)):
         "prize_key": (result.get("prize") or {}).get("code"),
         "prize": (result.get("prize") or {}),
         "message": (result.get("ui") or {}).get("win_text") or "OK",
-        "balance": int(u.balance),
-        "tickets_sneakers": int(u.tickets_sneakers),
-        "tickets_bracelet": int(u.tickets_bracelet),
+        "balance": int(result["balance"]),
+        "tickets_sneakers": int(result["tickets"]["sneakers"]),
+        "tickets_bracelet": int(result["tickets"]["bracelet"]),
+    }
+
+
+@hot_path("POST", "/api/spin/batch")
+def api_spin_batch(payload: SpinBatchIn, request: Request, db: Session = Depends(get_db)):
+    """Open one case several times (x3/x5/x10) in a single request and a single commit."""
+    uid = get_request_user_id(request, db)
+    if not uid:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    u = ensure_user(db, uid)
+    roulette_id = payload.roulette_id or "r1"
+
+    result = spin_batch(db, u, roulette_id, payload.count)
+    if not result.get("ok", False):
+        raise HTTPException(status_code=400, detail=result.get("message", "Spin error"))
+
+    return {
+        "roulette_id": roulette_id,
+        "count": int(result["count"]),
+        "total_cost": int(result["total_cost"]),
+        "results": [
+            {
+                "prize_key": r["prize"]["code"],
+                "prize": r["prize"],
+                "message": r["ui"]["win_text"],
+            }
+            for r in result["results"]
+        ],
+        "balance": int(result["balance"]),
+        "tickets_sneakers": int(result["tickets"]["sneakers"]),
+        "tickets_bracelet": int(result["tickets"]["bracelet"]),
     }
 
 
@@ -395,8 +595,10 @@ def api_withdraw(payload: WithdrawIn, request: Request, db: Session = Depends(ge
         raise HTTPException(status_code=400, detail="Minimum withdraw is 1000 Stars")
     if amount > u.balance:
         raise HTTPException(status_code=400, detail="Insufficient balance")
+    if not apply_user_delta(db, u, balance=-amount, require_balance=amount):
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient balance")
 
-    u.balance -= amount
     wr = WithdrawRequest(user_id=uid, amount=amount, status=WithdrawStatus.pending)
     db.add(wr)
     db.add(Transaction(
@@ -406,25 +608,58 @@ def api_withdraw(payload: WithdrawIn, request: Request, db: Session = Depends(ge
         description="Вывод Stars (заявка)",
         meta={"withdraw_id": None},
     ))
-    db.add(u)
+    balance = int(u.balance)
     db.commit()
-    return {"ok": True, "balance": int(u.balance)}
+    return {"ok": True, "balance": balance}
 
 
-@app.get("/api/history")
-def api_history(request: Request, db: Session = Depends(get_db)):
+@hot_path("GET", "/api/history")
+def api_history(
+    request: Request,
+    response: Response,
+    archived: bool = Query(default=False),
+    before_id: Optional[int] = Query(default=None, ge=1),
+    limit: int = Query(default=HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    type_: Optional[list[TxType]] = Query(default=None, alias="type"),
+    from_: str = Query(default="", alias="from"),
+    to: str = Query(default=""),
+    db: Session = Depends(get_db),
+):
     uid = get_request_user_id(request, db)
     if not uid:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    rows = (
-        db.query(Transaction)
-        .filter(Transaction.user_id == uid)
-        .order_by(Transaction.id.desc())
-        .limit(50)
-        .all()
+    types = sorted({t.value for t in type_ or []})
+    dt_from, dt_to = _date_range(from_, to)
+    not_modified = _state_cache(
+        request, response, db, uid, "history",
+        int(archived), before_id or 0, limit, ".".join(types), from_, to,
     )
+    if not_modified is not None:
+        return not_modified
+
+    # Keyset page: (user_id, id) / (user_id, type, id) index range scans, no OFFSET, no meta JSON.
+    q = db.query(
+        Transaction.id, Transaction.type, Transaction.amount, Transaction.description, Transaction.created_at
+    ).filter(Transaction.user_id == uid)
+    if before_id:
+        q = q.filter(Transaction.id < before_id)
+    if types:
+        q = q.filter(Transaction.type.in_([TxType(t) for t in types]))
+    if dt_from:
+        q = q.filter(Transaction.created_at >= dt_from)
+    if dt_to:
+        q = q.filter(Transaction.created_at <= dt_to)
+    rows = q.order_by(Transaction.id.desc()).limit(limit).all()
+    if archived:
+        # Kept-live rows (open ticket lots) can be older than archived ones, so merge both.
+        older = archived_history(
+            db, uid, limit, before_id,
+            types={TxType(t) for t in types} or None, since=dt_from, until=dt_to,
+        )
+        rows = sorted([*rows, *older], key=lambda t: t.id, reverse=True)[:limit]
     return {
+        "next_before_id": int(rows[-1].id) if len(rows) == limit else None,
         "items": [
             {
                 "id": int(t.id),
@@ -438,60 +673,32 @@ def api_history(request: Request, db: Session = Depends(get_db)):
     }
 
 
-@app.get("/api/inventory")
-def api_inventory(request: Request, db: Session = Depends(get_db)):
+@hot_path("GET", "/api/inventory")
+def api_inventory(request: Request, response: Response, db: Session = Depends(get_db)):
     uid = get_request_user_id(request, db)
     if not uid:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    u = ensure_user(db, uid)
 
-    rows = (
-        db.query(Transaction)
-        .filter(Transaction.user_id == uid, Transaction.type == TxType.win)
-        .order_by(Transaction.id.desc())
-        .limit(5000)
-        .all()
-    )
+    # Titles, images and targets come from the case catalog and media config, so they version it too.
+    # Content digests, not their per-process version counters: every worker must agree on the ETag.
+    media = get_media_config()
+    catalog = get_catalog(db)
+    not_modified = _state_cache(request, response, db, uid, "inventory", media.digest, catalog.digest)
+    if not_modified is not None:
+        return not_modified
+    u = ensure_user(db, uid)
 
-    items: dict[str, int] = {}
-    for t in rows:
-        meta = t.meta or {}
-        code = str(meta.get("prize_code") or "")
-        added = int(meta.get("hidden_tickets_added") or 0)
-        sold = int(meta.get("hidden_tickets_sold") or 0)
-        left = max(0, added - sold)
-        if code and left > 0:
-            items[code] = int(items.get(code, 0)) + left
-
-    media = load_media_config()
-    raw_targets = media.get("ticket_targets") or {}
-    if not isinstance(raw_targets, dict):
-        raw_targets = {}
+    items = user_ticket_progress(db, uid)
 
     item_codes: set[str] = set()
-    for c in list_cases(db):
-        for p in (c.get("prizes") or []):
-            if str(p.get("type") or "") == "item":
-                item_codes.add(str(p.get("code") or ""))
-    item_codes = {x for x in item_codes if x}
+    for compiled in catalog.cases:
+        item_codes.update(compiled.item_codes)
     item_codes.update(items.keys())
-    item_codes.update(raw_targets.keys())
-
-    image_map: dict[str, str] = {}
-    for rid, r in (media.get("roulettes") or {}).items():
-        if not isinstance(r, dict):
-            continue
-        items_map = r.get("items") or {}
-        if not isinstance(items_map, dict):
-            continue
-        for code, arr in items_map.items():
-            if isinstance(arr, list) and arr:
-                image_map[str(code)] = str(arr[0])
+    item_codes.update(str(k) for k in media.ticket_targets.keys())
 
     progress = []
     for code in sorted(item_codes):
-        target_default = 10 if code in {"shoes"} else 5
-        target = max(1, int(raw_targets.get(code) or target_default))
+        target = media.ticket_target(code)
         now = int(items.get(code, 0))
         progress.append(
             {
@@ -501,7 +708,7 @@ def api_inventory(request: Request, db: Session = Depends(get_db)):
                 "target": target,
                 "left": max(0, target - now),
                 "percent": min(100, int((now / target) * 100)),
-                "image": image_map.get(code) or "",
+                "image": media.item_images.get(code) or "",
             }
         )
 
@@ -510,7 +717,7 @@ def api_inventory(request: Request, db: Session = Depends(get_db)):
         "total": int(sum(items.values())),
         "progress": progress,
         "lots": _ticket_sell_lots(db, u, media),
-        "economy": {"ticket_sell_percent": _ticket_sell_percent(media)},
+        "economy": {"ticket_sell_percent": media.ticket_sell_percent},
     }
 
 
@@ -525,22 +732,16 @@ def api_tickets_sell(payload: dict, request: Request, db: Session = Depends(get_
         raise HTTPException(status_code=400, detail="tx_id required")
 
     u = ensure_user(db, uid)
-    row = (
-        db.query(Transaction)
-        .filter(Transaction.id == tx_id, Transaction.user_id == int(uid), Transaction.type == TxType.win)
-        .first()
-    )
-    if not row:
+    lot = db.get(TicketLot, tx_id)
+    if not lot or int(lot.user_id) != int(uid):
         raise HTTPException(status_code=404, detail="Ticket lot not found")
 
-    meta = dict(row.meta or {})
-    added = int(meta.get("hidden_tickets_added") or 0)
-    sold = int(meta.get("hidden_tickets_sold") or 0)
-    left = max(0, added - sold)
+    sold = int(lot.sold or 0)
+    left = max(0, int(lot.added or 0) - sold)
     if left <= 0:
         raise HTTPException(status_code=400, detail="Лот уже продан")
 
-    ticket_kind = str(meta.get("hidden_ticket_kind") or ("bracelet" if str(meta.get("prize_code") or "") == "bracelet" else "sneakers"))
+    ticket_kind = str(lot.ticket_kind or ("bracelet" if str(lot.code or "") == "bracelet" else "sneakers"))
     if ticket_kind == "bracelet":
         if int(u.tickets_bracelet or 0) < left:
             raise HTTPException(status_code=400, detail="Недостаточно тикетов браслета")
@@ -548,40 +749,59 @@ def api_tickets_sell(payload: dict, request: Request, db: Session = Depends(get_
         if int(u.tickets_sneakers or 0) < left:
             raise HTTPException(status_code=400, detail="Недостаточно тикетов обуви")
 
-    media = load_media_config()
-    sell_percent = _ticket_sell_percent(media)
-    case_cost = max(0, int(meta.get("case_cost") or 0))
+    sell_percent = get_media_config().ticket_sell_percent
+    case_cost = max(0, int(lot.case_cost or 0))
     unit_price = (case_cost * sell_percent) // 100 if case_cost > 0 else 0
     total_credit = unit_price * left
     if total_credit <= 0:
         raise HTTPException(status_code=400, detail="Для этого лота нет цены выкупа")
 
+    # Lot first: a concurrent sale of the same lot makes this a no-op.
+    if not sell_ticket_lot(db, lot, left):
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Лот уже продан")
     if ticket_kind == "bracelet":
-        u.tickets_bracelet = max(0, int(u.tickets_bracelet or 0) - left)
+        ok = apply_user_delta(db, u, balance=total_credit, tickets_bracelet=-left, require_bracelet=left)
     else:
-        u.tickets_sneakers = max(0, int(u.tickets_sneakers or 0) - left)
-    u.balance = int(u.balance or 0) + total_credit
+        ok = apply_user_delta(db, u, balance=total_credit, tickets_sneakers=-left, require_sneakers=left)
+    if not ok:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Недостаточно тикетов")
 
+    # Keep the win meta in sync for history/backfill readers.
+    row = lot.transaction
+    meta = dict(row.meta or {})
     meta["hidden_tickets_sold"] = sold + left
     row.meta = meta
     db.add(row)
-    db.add(u)
     db.add(Transaction(
         user_id=int(uid),
         type=TxType.win,
         amount=int(total_credit),
-        description=f"Продажа тикетов: {_human_code_title(str(meta.get('prize_code') or 'ticket'))}",
+        description=f"Продажа тикетов: {_human_code_title(str(lot.code or 'ticket'))}",
         meta={"ticket_sell_tx_id": int(tx_id), "ticket_count": int(left), "unit_price": int(unit_price), "case_cost": int(case_cost)},
+        roulette_id=str(lot.roulette_id or "") or None,
+        ticket_sell_tx_id=int(tx_id),
     ))
-    db.commit()
-    db.refresh(u)
-    return {
+    out = {
         "ok": True,
         "credited": int(total_credit),
         "balance": int(u.balance),
         "tickets_sneakers": int(u.tickets_sneakers),
         "tickets_bracelet": int(u.tickets_bracelet),
     }
+    db.commit()
+    return out
+
+
+def _deposit_sums(db: Session, user_ids: list[int]) -> dict[int, int]:
+    """Lifetime deposit sum per user (archived deposits included)."""
+    if not user_ids:
+        return {}
+    return {
+        int(uid): int(total or 0)
+        for uid, total in db.query(UserStat.user_id, UserStat.deposit_sum).filter(UserStat.user_id.in_(user_ids))
+    }
 
 
 @app.get("/api/referrals/my")
@@ -600,17 +820,7 @@ def api_referrals_my(request: Request, db: Session = Depends(get_db)):
     if not invitees:
         return {"items": [], "count": 0}
 
-    ids = [int(u.user_id) for u in invitees]
-    dep_rows = (
-        db.query(
-            Transaction.user_id,
-            func.coalesce(func.sum(Transaction.amount), 0).label("deposit_sum"),
-        )
-        .filter(Transaction.type == TxType.deposit, Transaction.user_id.in_(ids))
-        .group_by(Transaction.user_id)
-        .all()
-    )
-    dep_map = {int(r.user_id): int(r.deposit_sum) for r in dep_rows}
+    dep_map = _deposit_sums(db, [int(u.user_id) for u in invitees])
 
     return {
         "count": len(invitees),
@@ -637,13 +847,12 @@ def api_prize_request(request: Request, payload: dict, db: Session = Depends(get
         raise HTTPException(status_code=400, detail="Invalid prize_type")
 
     if prize_type == "sneakers":
-        if u.tickets_sneakers < 10:
-            raise HTTPException(status_code=400, detail="Not enough tickets")
-        u.tickets_sneakers -= 10
+        ok = apply_user_delta(db, u, tickets_sneakers=-10, require_sneakers=10)
     else:
-        if u.tickets_bracelet < 5:
-            raise HTTPException(status_code=400, detail="Not enough tickets")
-        u.tickets_bracelet -= 5
+        ok = apply_user_delta(db, u, tickets_bracelet=-5, require_bracelet=5)
+    if not ok:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Not enough tickets")
 
     pr = PrizeRequest(user_id=uid, prize_type=prize_type, status=PrizeReqStatus.new)
     db.add(pr)
@@ -677,49 +886,35 @@ def api_internal_payment_confirm(
         if (x_internal_token or "") != settings.internal_api_token:
             raise HTTPException(status_code=403, detail="Forbidden")
 
-    # already processed?
-    exists = db.query(Payment).filter(Payment.telegram_payment_charge_id == telegram_payment_charge_id).first()
-    if exists:
+    if not credit_payment(db, int(user_id), telegram_payment_charge_id, int(total_amount)):
+        db.rollback()
         return {"ok": True, "already": True}
+    db.commit()
+    return {"ok": True, "credited": int(total_amount)}
 
-    u = ensure_user(db, int(user_id))
-
-    # record payment + deposit tx
-    pay = Payment(
-        user_id=int(user_id),
-        telegram_payment_charge_id=telegram_payment_charge_id,
-        total_amount=int(total_amount),
-    )
-    db.add(pay)
 
-    u.balance += int(total_amount)
-    db.add(Transaction(
-        user_id=int(user_id),
-        type=TxType.deposit,
-        amount=int(total_amount),
-        description="Пополнение Stars",
-        meta={"telegram_payment_charge_id": telegram_payment_charge_id},
-    ))
+@app.post("/api/internal/payment/confirm_batch")
+def api_internal_payment_confirm_batch(
+    payload: PaymentConfirmBatchIn,
+    x_internal_token: Optional[str] = Header(default=None, alias="X-Internal-Token"),
+    db: Session = Depends(get_db),
+):
+    """Credit many confirmed payments in one transaction (bot flushing its backlog).
 
-    # referral bonus (optional)
-    bonus_percent = int(getattr(settings, "referral_bonus_percent", 0) or 0)
-    if bonus_percent > 0 and u.referrer_id:
-        bonus = (int(total_amount) * bonus_percent) // 100
-        if bonus > 0:
-            ref_u = ensure_user(db, int(u.referrer_id))
-            ref_u.balance += bonus
-            db.add(ref_u)
-            db.add(Transaction(
-                user_id=int(ref_u.user_id),
-                type=TxType.referral,
-                amount=bonus,
-                description=f"Реферальный бонус {bonus_percent}% за депозит приглашённого {u.user_id}",
-                meta={"invitee_id": int(u.user_id), "payment_charge_id": telegram_payment_charge_id},
-            ))
+    Each item is idempotent on its charge id, exactly like /api/internal/payment/confirm.
+    """
+    if settings.internal_api_token:
+        if (x_internal_token or "") != settings.internal_api_token:
+            raise HTTPException(status_code=403, detail="Forbidden")
 
-    db.add(u)
+    items = []
+    for it in payload.items:
+        if credit_payment(db, it.user_id, it.telegram_payment_charge_id, it.total_amount):
+            items.append({"telegram_payment_charge_id": it.telegram_payment_charge_id, "credited": it.total_amount})
+        else:
+            items.append({"telegram_payment_charge_id": it.telegram_payment_charge_id, "already": True})
     db.commit()
-    return {"ok": True, "credited": int(total_amount)}
+    return {"ok": True, "items": items, "credited": sum(int(x.get("credited", 0)) for x in items)}
 
 
 @app.post("/api/internal/referral/bind")
@@ -733,7 +928,11 @@ def api_internal_referral_bind(
     if settings.internal_api_token:
         if (x_internal_token or "") != settings.internal_api_token:
             raise HTTPException(status_code=403, detail="Forbidden")
+    return referral_bind(db, int(user_id), int(referrer_id))
 
+
+def referral_bind(db: Session, user_id: int, referrer_id: int) -> dict:
+    """Bind the referrer once and pay the signup bonuses (bot /start, over HTTP or in-process)."""
     u = ensure_user(db, int(user_id))
     changed = bind_referrer(db, u, int(referrer_id))
     if changed:
@@ -742,8 +941,8 @@ def api_internal_referral_bind(
         bonus_inv = int(getattr(settings, "referral_signup_bonus_invitee", 0) or 0)
 
         if bonus_ref > 0:
-            ref_u.balance += bonus_ref
-            db.add(ref_u)
+            apply_user_delta(db, ref_u, balance=int(bonus_ref))
+            add_user_stats(db, int(ref_u.user_id), referral_bonus=int(bonus_ref))
             db.add(Transaction(
                 user_id=int(ref_u.user_id),
                 type=TxType.referral,
@@ -753,8 +952,8 @@ def api_internal_referral_bind(
             ))
 
         if bonus_inv > 0:
-            u.balance += bonus_inv
-            db.add(u)
+            apply_user_delta(db, u, balance=int(bonus_inv))
+            add_user_stats(db, int(u.user_id), referral_bonus=int(bonus_inv))
             db.add(Transaction(
                 user_id=int(u.user_id),
                 type=TxType.referral,
@@ -773,6 +972,24 @@ def api_internal_referral_bind(
     }
 
 
+@app.post(settings.bot_webhook_path, include_in_schema=False)
+async def bot_webhook_update(
+    request: Request,
+    x_telegram_secret: Optional[str] = Header(default=None, alias="X-Telegram-Bot-Api-Secret-Token"),
+):
+    """Telegram update push (webhook mode). Non-2xx makes Telegram redeliver the update."""
+    if not settings.bot_webhook_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((x_telegram_secret or "").encode(), bot_webhook.expected_secret().encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid update")
+    await bot_webhook.handle(data)
+    return {"ok": True}
+
+
 # ---------------- ADMIN API ----------------
 
 @app.get("/api/admin/cases")
@@ -791,6 +1008,55 @@ def admin_cases_put(payload: dict, request: Request, db: Session = Depends(get_d
     return {"ok": True}
 
 
+def _int_field(payload: dict, key: str) -> int | None:
+    """Integer field of a JSON body (None if missing/null); 400 if it isn't a number."""
+    raw = payload.get(key)
+    if raw is None:
+        return None
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{key} must be an integer")
+
+
+@app.post("/api/admin/cases/simulate")
+def admin_cases_simulate(payload: dict, request: Request, db: Session = Depends(get_db)):
+    """Monte Carlo economy report (RTP, payout quantiles, spins-to-target, buyback liability).
+
+    Optional `items` simulates a draft case list (same shape as PUT /api/admin/cases) without saving it.
+    """
+    _ = get_admin_uid(request, db)
+    try:
+        from app.simulator import simulate_cases
+    except ImportError:
+        raise HTTPException(status_code=501, detail="numpy is not installed")
+
+    paths = max(1, min(1_000_000, _int_field(payload, "paths") or 100_000))
+    spins = max(1, min(1_000, _int_field(payload, "spins") or 100))
+    if paths * spins > SIMULATE_MAX_STEPS:
+        raise HTTPException(status_code=400, detail=f"paths * spins must be <= {SIMULATE_MAX_STEPS}")
+    seed = _int_field(payload, "seed")
+
+    draft = payload.get("items")
+    if draft is not None:
+        if not isinstance(draft, list):
+            raise HTTPException(status_code=400, detail="items must be list")
+        cases = [normalize_case(c) for c in draft if isinstance(c, dict)]
+    else:
+        cases = [dict(c.case) for c in get_catalog(db).cases]
+    rid = str(payload.get("roulette_id") or "")
+    if rid:
+        cases = [c for c in cases if c["id"] == rid]
+        if not cases:
+            raise HTTPException(status_code=404, detail="Case not found")
+
+    return {
+        "paths": paths,
+        "spins": spins,
+        "items": simulate_cases(cases, get_media_config(), paths=paths, spins=spins, seed=seed),
+    }
+
+
 @app.get("/api/admin/media_config")
 def admin_media_config(request: Request):
     _ = get_admin_uid(request)
@@ -869,9 +1135,27 @@ def admin_prizes_put(payload: dict, request: Request, db: Session = Depends(get_
     return {"ok": True}
 
 
-@app.get("/api/admin/withdraws")
-def admin_withdraws(request: Request, db: Session = Depends(get_db)):
+@app.get("/api/admin/archive")
+def admin_archive_list(request: Request, db: Session = Depends(get_read_db)):
+    _ = get_admin_uid(request)
+    return {"items": list_segments(db)}
+
+
+@app.post("/api/admin/archive")
+def admin_archive_run(payload: dict, request: Request, db: Session = Depends(get_db)):
     _ = get_admin_uid(request, db)
+    before = _parse_date(str(payload.get("before") or ""))
+    if payload.get("before") and before is None:
+        raise HTTPException(status_code=400, detail="before must be YYYY-MM-DD")
+    before = before or default_cutoff()
+    if before > datetime.utcnow():
+        raise HTTPException(status_code=400, detail="before must be in the past")
+    return archive_transactions(db, before, batch_size=settings.archive_batch_size)
+
+
+@app.get("/api/admin/withdraws")
+def admin_withdraws(request: Request, db: Session = Depends(get_read_db)):
+    _ = get_admin_uid(request)
     rows = db.query(WithdrawRequest).order_by(WithdrawRequest.id.desc()).limit(200).all()
     return {"items": [
         {"id": int(r.id), "user_id": int(r.user_id), "amount": int(r.amount), "status": (r.status.value if hasattr(r.status,"value") else str(r.status))}
@@ -880,8 +1164,8 @@ def admin_withdraws(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/api/admin/prize_requests")
-def admin_prize_requests(request: Request, db: Session = Depends(get_db)):
-    _ = get_admin_uid(request, db)
+def admin_prize_requests(request: Request, db: Session = Depends(get_read_db)):
+    _ = get_admin_uid(request)
     rows = db.query(PrizeRequest).order_by(PrizeRequest.id.desc()).limit(200).all()
     return {"items": [
         {"id": int(r.id), "user_id": int(r.user_id), "prize_type": r.prize_type, "status": (r.status.value if hasattr(r.status,"value") else str(r.status))}
@@ -889,6 +1173,55 @@ def admin_prize_requests(request: Request, db: Session = Depends(get_db)):
     ]}
 
 
+def _export_response(request: Request, name: str, fmt: str, from_: str, to: str, user_id: Optional[int], kinds: tuple = (), archived: bool = False):
+    _ = get_admin_uid(request)
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    dt_from, dt_to = _date_range(from_, to)
+    f = ExportFilter(since=dt_from, until=dt_to, user_id=user_id, kinds=kinds, archived=archived)
+    return StreamingResponse(
+        stream_export(name, fmt, f),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(name, fmt, f)}"'},
+    )
+
+
+@app.get("/api/admin/export/transactions")
+def admin_export_transactions(
+    request: Request,
+    format: str = Query(default="csv"),
+    from_: str = Query(default="", alias="from"),
+    to: str = Query(default=""),
+    user_id: Optional[int] = Query(default=None),
+    type_: Optional[list[TxType]] = Query(default=None, alias="type"),
+    archived: bool = Query(default=False),
+):
+    return _export_response(request, "transactions", format, from_, to, user_id, tuple(type_ or ()), archived)
+
+
+@app.get("/api/admin/export/payments")
+def admin_export_payments(
+    request: Request,
+    format: str = Query(default="csv"),
+    from_: str = Query(default="", alias="from"),
+    to: str = Query(default=""),
+    user_id: Optional[int] = Query(default=None),
+):
+    return _export_response(request, "payments", format, from_, to, user_id)
+
+
+@app.get("/api/admin/export/withdraws")
+def admin_export_withdraws(
+    request: Request,
+    format: str = Query(default="csv"),
+    from_: str = Query(default="", alias="from"),
+    to: str = Query(default=""),
+    user_id: Optional[int] = Query(default=None),
+    status: Optional[list[WithdrawStatus]] = Query(default=None),
+):
+    return _export_response(request, "withdraws", format, from_, to, user_id, tuple(status or ()))
+
+
 @app.post("/api/admin/adjust")
 def admin_adjust(payload: dict, request: Request, db: Session = Depends(get_db)):
     uid = get_admin_uid(request, db)
@@ -903,9 +1236,7 @@ def admin_adjust(payload: dict, request: Request, db: Session = Depends(get_db))
     tb = int(payload.get("tickets_bracelet_delta") or 0)
     note = str(payload.get("note") or "admin adjust")[:200]
 
-    u.balance += bal
-    u.tickets_sneakers += ts
-    u.tickets_bracelet += tb
+    apply_user_delta(db, u, balance=bal, tickets_sneakers=ts, tickets_bracelet=tb)
 
     db.add(Transaction(
         user_id=user_id,
@@ -932,15 +1263,37 @@ def _parse_date(s: str) -> Optional[datetime]:
             return None
 
 
+def _is_date_only(s: str) -> bool:
+    try:
+        date.fromisoformat(s)
+    except ValueError:
+        return False
+    return True
+
+
+def _date_range(from_: str, to: str) -> tuple[Optional[datetime], Optional[datetime]]:
+    """Parsed `from`/`to` query params; 400 if either is given but isn't a date.
+
+    A plain-date `to` covers that whole day, not just its midnight.
+    """
+    dt_from = _parse_date(from_)
+    dt_to = _parse_date(to)
+    if (from_ and dt_from is None) or (to and dt_to is None):
+        raise HTTPException(status_code=400, detail="from/to must be YYYY-MM-DD")
+    if dt_to is not None and _is_date_only(to):
+        dt_to = datetime.combine(dt_to.date(), datetime.max.time())
+    return dt_from, dt_to
+
+
 @app.get("/api/admin/referrals/summary")
 def admin_referrals_summary(
     request: Request,
     q: str = Query(default=""),
     from_: str = Query(default="", alias="from"),
     to: str = Query(default=""),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    _ = get_admin_uid(request, db)
+    _ = get_admin_uid(request)
 
     dt_from = _parse_date(from_)
     dt_to = _parse_date(to)
@@ -962,37 +1315,28 @@ def admin_referrals_summary(
         func.count(User.user_id).label("invited_count"),
     ).filter(and_(*u_filter)).group_by(User.referrer_id).subquery()
 
-    # deposits of invitees
+    # Lifetime deposits of the matching invitees and bonuses of the referrer, from user_stats.
     dep = db.query(
         User.referrer_id.label("referrer_id"),
-        func.coalesce(func.sum(Transaction.amount), 0).label("total_deposit"),
-    ).join(Transaction, Transaction.user_id == User.user_id).filter(
-        and_(
-            User.referrer_id.isnot(None),
-            Transaction.type == TxType.deposit,
-            *( [User.created_at >= dt_from] if dt_from else [] ),
-            *( [User.created_at <= dt_to] if dt_to else [] ),
-            *( [(User.referrer_id == int(q)) | (User.user_id == int(q))] if q.isdigit() else [] ),
-        )
-    ).group_by(User.referrer_id).subquery()
-
-    # referral bonuses earned by referrers
-    bonus = db.query(
-        Transaction.user_id.label("referrer_id"),
-        func.coalesce(func.sum(Transaction.amount), 0).label("total_bonus"),
-    ).filter(Transaction.type == TxType.referral).group_by(Transaction.user_id).subquery()
+        func.coalesce(func.sum(UserStat.deposit_sum), 0).label("total_deposit"),
+    ).join(UserStat, UserStat.user_id == User.user_id).filter(and_(*u_filter)).group_by(User.referrer_id).subquery()
 
     rows = db.query(
         sub_invited.c.referrer_id,
         sub_invited.c.invited_count,
         func.coalesce(dep.c.total_deposit, 0),
-        func.coalesce(bonus.c.total_bonus, 0),
+        func.coalesce(UserStat.referral_bonus, 0),
     ).outerjoin(dep, dep.c.referrer_id == sub_invited.c.referrer_id
-    ).outerjoin(bonus, bonus.c.referrer_id == sub_invited.c.referrer_id
+    ).outerjoin(UserStat, UserStat.user_id == sub_invited.c.referrer_id
     ).order_by(sub_invited.c.invited_count.desc()).limit(500).all()
 
     return {"items": [
-        {"referrer_id": int(r[0]), "invited_count": int(r[1]), "total_deposit": int(r[2]), "total_bonus": int(r[3])}
+        {
+            "referrer_id": int(r[0]),
+            "invited_count": int(r[1]),
+            "total_deposit": int(r[2]),
+            "total_bonus": int(r[3]),
+        }
         for r in rows
     ]}
 
@@ -1004,9 +1348,9 @@ def admin_referrals_details(
     q: str = Query(default=""),
     from_: str = Query(default="", alias="from"),
     to: str = Query(default=""),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    _ = get_admin_uid(request, db)
+    _ = get_admin_uid(request)
 
     dt_from = _parse_date(from_)
     dt_to = _parse_date(to)
@@ -1024,15 +1368,7 @@ def admin_referrals_details(
     if not invitees:
         return {"invitees": []}
 
-    ids = [u.user_id for u in invitees]
-    dep_rows = db.query(
-        Transaction.user_id,
-        func.coalesce(func.sum(Transaction.amount), 0).label("deposit_sum"),
-    ).filter(
-        Transaction.type == TxType.deposit,
-        Transaction.user_id.in_(ids),
-    ).group_by(Transaction.user_id).all()
-    dep_map = {int(r.user_id): int(r.deposit_sum) for r in dep_rows}
+    dep_map = _deposit_sums(db, [int(u.user_id) for u in invitees])
 
     return {"invitees": [
         {"user_id": int(u.user_id), "created_at": u.created_at.isoformat() if u.created_at else None, "deposit_sum": dep_map.get(int(u.user_id), 0)}
@@ -1045,98 +1381,15 @@ def admin_stats(
     request: Request,
     from_: str = Query(default="", alias="from"),
     to: str = Query(default=""),
-    db: Session = Depends(get_db),
+    archived: bool = Query(default=False),
+    db: Session = Depends(get_read_db),
 ):
-    _ = get_admin_uid(request, db)
-
-    dt_from = _parse_date(from_)
-    dt_to = _parse_date(to)
-
-    tx_filters = []
-    if dt_from:
-        tx_filters.append(Transaction.created_at >= dt_from)
-    if dt_to:
-        tx_filters.append(Transaction.created_at <= dt_to)
-    tx_rows = db.query(Transaction).filter(*tx_filters).order_by(Transaction.created_at.asc()).all()
-
-    by_day: dict[str, dict] = {}
-    by_case: dict[str, dict] = {}
-    users_set: set[int] = set()
-    totals = {
-        "spins_count": 0,
-        "spent_on_spins": 0,
-        "deposits": 0,
-        "wins_stars": 0,
-        "ticket_sales": 0,
-        "withdraws": 0,
-        "unique_users": 0,
-    }
+    """Totals, by day, by case and by prize for [from, to].
 
-    for t in tx_rows:
-        day_key = t.created_at.date().isoformat() if t.created_at else "unknown"
-        day = by_day.setdefault(day_key, {
-            "date": day_key,
-            "spins_count": 0,
-            "spent_on_spins": 0,
-            "deposits": 0,
-            "wins_stars": 0,
-            "ticket_sales": 0,
-            "withdraws": 0,
-            "unique_users_set": set(),
-        })
-        day["unique_users_set"].add(int(t.user_id))
-        users_set.add(int(t.user_id))
-
-        amt = int(t.amount or 0)
-        meta = t.meta or {}
-        if t.type == TxType.spin:
-            spend = abs(amt)
-            day["spins_count"] += 1
-            day["spent_on_spins"] += spend
-            totals["spins_count"] += 1
-            totals["spent_on_spins"] += spend
-            rid = str(meta.get("roulette_id") or "")
-            if not rid:
-                m = re.search(r"\((r\d+)\)$", str(t.description or ""))
-                rid = m.group(1) if m else ""
-            if rid:
-                case_row = by_case.setdefault(rid, {"case_id": rid, "spins_count": 0, "spent_on_spins": 0})
-                case_row["spins_count"] += 1
-                case_row["spent_on_spins"] += spend
-        elif t.type == TxType.deposit:
-            val = max(0, amt)
-            day["deposits"] += val
-            totals["deposits"] += val
-        elif t.type == TxType.withdraw:
-            val = abs(amt)
-            day["withdraws"] += val
-            totals["withdraws"] += val
-        elif t.type == TxType.win:
-            val = max(0, amt)
-            if meta.get("ticket_sell_tx_id"):
-                day["ticket_sales"] += val
-                totals["ticket_sales"] += val
-            else:
-                day["wins_stars"] += val
-                totals["wins_stars"] += val
-
-    by_day_out = []
-    for k in sorted(by_day.keys()):
-        row = by_day[k]
-        by_day_out.append({
-            "date": row["date"],
-            "spins_count": int(row["spins_count"]),
-            "spent_on_spins": int(row["spent_on_spins"]),
-            "deposits": int(row["deposits"]),
-            "wins_stars": int(row["wins_stars"]),
-            "ticket_sales": int(row["ticket_sales"]),
-            "withdraws": int(row["withdraws"]),
-            "unique_users": len(row["unique_users_set"]),
-        })
-
-    totals["unique_users"] = len(users_set)
-    return {
-        "totals": totals,
-        "by_day": by_day_out,
-        "by_case": sorted(by_case.values(), key=lambda x: x["spins_count"], reverse=True),
-    }
+    Sealed days come from the daily rollups and only the unsealed rest is aggregated from
+    transactions. Rollups fold in archived rows when a day is sealed, so sealed days include
+    archived transactions even with archived=0; the flag only adds archive segments for the
+    days that are not sealed yet.
+    """
+    _ = get_admin_uid(request)
+    return stats_report(db, _parse_date(from_), _parse_date(to), archived=archived)
@@ -0,0 +1,168 @@
+"""Shared loader for app/static/prizes/roulettes.json (media + economy config).
+
+The file is parsed once and re-read only when its mtime/size changes or save_media_config
+writes it, so hot requests pay one os.stat() instead of a read and a JSON parse.
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Mapping
+
+MEDIA_CONFIG_PATH = Path(__file__).resolve().parent / "static" / "prizes" / "roulettes.json"
+
+SECTIONS = ("event", "roulettes", "ticket_targets", "economy", "contact")
+
+
+def _freeze(v: Any) -> Any:
+    if isinstance(v, dict):
+        return MappingProxyType({k: _freeze(x) for k, x in v.items()})
+    if isinstance(v, list):
+        return tuple(_freeze(x) for x in v)
+    return v
+
+
+def content_digest(data: Any) -> str:
+    """Stable short sha256 of JSON-able content: equal in every process for equal content."""
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def _section(data: dict, key: str) -> dict:
+    v = data.get(key)
+    return v if isinstance(v, dict) else {}
+
+
+def _int(v: Any, default: int) -> int:
+    try:
+        return int(v or default)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class MediaConfig:
+    """Read-only parsed view of roulettes.json with typed economy values."""
+
+    version: int
+    # Content hash of the file: unlike `version` (a per-process counter) it can key shared ETags.
+    digest: str
+    event: Mapping[str, Any]
+    roulettes: Mapping[str, Any]
+    ticket_targets: Mapping[str, Any]
+    economy: Mapping[str, Any]
+    contact: Mapping[str, Any]
+    ticket_sell_percent: int
+    near_target_ticket_boost_percent: int
+    item_images: Mapping[str, str]
+    _raw: dict
+
+    @classmethod
+    def build(cls, version: int, data: dict) -> "MediaConfig":
+        economy = _section(data, "economy")
+        # First image of every item code (later roulettes win, as the inventory always did).
+        item_images: dict[str, str] = {}
+        for r in _section(data, "roulettes").values():
+            items_map = r.get("items") if isinstance(r, dict) else None
+            if not isinstance(items_map, dict):
+                continue
+            for code, arr in items_map.items():
+                if isinstance(arr, list) and arr:
+                    item_images[str(code)] = str(arr[0])
+        return cls(
+            version=version,
+            digest=content_digest(data),
+            event=_freeze(_section(data, "event")),
+            roulettes=_freeze(_section(data, "roulettes")),
+            ticket_targets=_freeze(_section(data, "ticket_targets")),
+            economy=_freeze(economy),
+            contact=_freeze(_section(data, "contact")),
+            ticket_sell_percent=max(0, min(100, _int(economy.get("ticket_sell_percent"), 50))),
+            near_target_ticket_boost_percent=max(0, min(100, _int(economy.get("near_target_ticket_boost_percent"), 0))),
+            item_images=MappingProxyType(item_images),
+            _raw=data,
+        )
+
+    def ticket_target(self, code: str) -> int:
+        default_target = 10 if code == "shoes" else 5
+        return max(1, _int(self.ticket_targets.get(code), default_target))
+
+    def to_dict(self) -> dict:
+        """Mutable deep copy of the file contents (with all sections present)."""
+        data = copy.deepcopy(self._raw)
+        for key in SECTIONS:
+            if not isinstance(data.get(key), dict):
+                data[key] = {}
+        return data
+
+
+_current: MediaConfig | None = None
+_stamp: tuple[int, int] | None = None
+_version = 0
+_lock = threading.Lock()
+
+
+def _file_stamp() -> tuple[int, int] | None:
+    try:
+        st = os.stat(MEDIA_CONFIG_PATH)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read() -> dict:
+    with MEDIA_CONFIG_PATH.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data if isinstance(data, dict) else {}
+
+
+def get_media_config() -> MediaConfig:
+    global _current, _stamp, _version
+    stamp = _file_stamp()
+    current = _current
+    if current is not None and stamp == _stamp:
+        return current
+
+    with _lock:
+        if _current is not None and stamp == _stamp:
+            return _current
+        if stamp is None:
+            data = {}
+        else:
+            try:
+                data = _read()
+            except Exception:
+                # Half-written or broken file: keep serving the last good config.
+                if _current is not None:
+                    return _current
+                data = {}
+        _version += 1
+        _current = MediaConfig.build(_version, data)
+        _stamp = stamp
+        return _current
+
+
+def save_media_config(payload: dict) -> MediaConfig:
+    """Write payload to roulettes.json and make it the current config."""
+    global _current, _stamp, _version
+    if not isinstance(payload, dict):
+        raise ValueError("payload must be object")
+    for key in SECTIONS:
+        payload.setdefault(key, {})
+
+    with _lock:
+        MEDIA_CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = MEDIA_CONFIG_PATH.with_suffix(".json.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, MEDIA_CONFIG_PATH)
+        _version += 1
+        _current = MediaConfig.build(_version, copy.deepcopy(payload))
+        _stamp = _file_stamp()
+        return _current
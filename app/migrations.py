@@ -0,0 +1,110 @@
+"""Data migrations for columns promoted out of Transaction.meta.
+
+init_db() adds the columns to an existing `transactions` table; this fills them for rows
+written before that (startup does it automatically right after the columns are added).
+
+One-off migrations that can't be keyed on a schema change record a `data_migrations` marker
+(record_migration) so every worker's startup runs them at most once.
+
+CLI:  python -m app.migrations backfill-tx-columns
+"""
+from __future__ import annotations
+
+import re
+import sys
+from typing import Any, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from app.models import DataMigration, Transaction, TxType
+
+_RID_IN_DESCRIPTION = re.compile(r"\((r\d+)\)$")
+
+
+def tx_columns_from_meta(tx_type: Any, description: Optional[str], meta: Optional[dict]) -> dict:
+    """roulette_id / prize_code / ticket_sell_tx_id as older code stored them in meta."""
+    meta = meta or {}
+    rid = str(meta.get("roulette_id") or "")
+    if not rid and str(getattr(tx_type, "value", tx_type)) == TxType.spin.value:
+        m = _RID_IN_DESCRIPTION.search(str(description or ""))
+        rid = m.group(1) if m else ""
+    sale = meta.get("ticket_sell_tx_id")
+    return {
+        "roulette_id": rid or None,
+        "prize_code": str(meta.get("prize_code") or "") or None,
+        "ticket_sell_tx_id": int(sale) if sale else None,
+    }
+
+
+def backfill_transaction_columns(db: Session, batch_size: int = 1000) -> int:
+    """Fill the promoted columns from meta/description. Idempotent. Returns rows updated."""
+    updated = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(Transaction.id, Transaction.type, Transaction.description, Transaction.meta)
+            .filter(
+                Transaction.id > last_id,
+                Transaction.roulette_id.is_(None),
+                Transaction.prize_code.is_(None),
+                Transaction.ticket_sell_tx_id.is_(None),
+                or_(Transaction.type == TxType.spin, Transaction.type == TxType.win),
+            )
+            .order_by(Transaction.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        for r in rows:
+            values = {k: v for k, v in tx_columns_from_meta(r.type, r.description, r.meta).items() if v is not None}
+            if values:
+                db.execute(
+                    update(Transaction).where(Transaction.id == r.id).values(**values),
+                    execution_options={"synchronize_session": False},
+                )
+                updated += 1
+        last_id = int(rows[-1].id)
+        db.commit()
+    return updated
+
+
+def ensure_transaction_columns(db: Session, added_columns: list[str]) -> None:
+    """Run the backfill once, right after init_db() added the columns."""
+    if any(c.startswith("transactions.") for c in added_columns):
+        backfill_transaction_columns(db)
+
+
+def migration_applied(db: Session, name: str) -> bool:
+    return db.get(DataMigration, name) is not None
+
+
+def record_migration(db: Session, name: str) -> None:
+    """Insert the marker for `name` in the caller's transaction.
+
+    Raises IntegrityError (at flush) if another worker recorded it first, so a migration that
+    records its marker before doing the work runs at most once.
+    """
+    db.add(DataMigration(name=name))
+    db.flush()
+
+
+def main(argv: list[str]) -> int:
+    from app.db import SessionLocal, init_db
+
+    if argv[:1] != ["backfill-tx-columns"]:
+        print("usage: python -m app.migrations backfill-tx-columns")
+        return 2
+    init_db()
+    db = SessionLocal()
+    try:
+        updated = backfill_transaction_columns(db)
+    finally:
+        db.close()
+    print(f"transactions updated: {updated}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
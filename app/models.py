@@ -1,7 +1,7 @@
 from __future__ import annotations
 import enum
-from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, Enum, ForeignKey, JSON, Index
+from datetime import date, datetime
+from sqlalchemy import String, Integer, Date, DateTime, Enum, ForeignKey, JSON, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db import Base
@@ -42,6 +42,8 @@ class User(Base):
     tickets_bracelet: Mapped[int] = mapped_column(Integer, default=0)
     referrer_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Bumped by every balance/ticket/transaction write; ETag source for /api/me, /api/inventory, /api/history
+    state_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     transactions: Mapped[list["Transaction"]] = relationship(back_populates="user", cascade="all, delete-orphan")
 
 class Transaction(Base):
@@ -54,6 +56,10 @@ class Transaction(Base):
     description: Mapped[str] = mapped_column("title", String(140), default="")
     meta: Mapped[dict] = mapped_column(JSON, default=dict)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    # Promoted from meta so stats can GROUP BY in SQL (see app.migrations for the backfill)
+    roulette_id: Mapped[str | None] = mapped_column(String(32), nullable=True, index=True)
+    prize_code: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    ticket_sell_tx_id: Mapped[int | None] = mapped_column(Integer, nullable=True, index=True)
 
     user: Mapped["User"] = relationship(back_populates="transactions")
 
@@ -113,4 +119,109 @@ class CaseConfig(Base):
     is_enabled: Mapped[int] = mapped_column(Integer, default=1)
 
 
+class TicketLot(Base):
+    """Hidden tickets granted by one item win (keyed by that win transaction)."""
+    __tablename__ = "ticket_lots"
+    tx_id: Mapped[int] = mapped_column(ForeignKey("transactions.id"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer)
+    code: Mapped[str] = mapped_column(String(64))
+    ticket_kind: Mapped[str] = mapped_column(String(20), default="sneakers")
+    rarity: Mapped[str] = mapped_column(String(20), default="blue")
+    roulette_id: Mapped[str] = mapped_column(String(32), default="")
+    case_cost: Mapped[int] = mapped_column(Integer, default=0)
+    added: Mapped[int] = mapped_column(Integer, default=0)
+    sold: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    transaction: Mapped["Transaction"] = relationship()
+
+
+class TicketProgress(Base):
+    """Per-user, per-item count of unsold hidden tickets (sum of added - sold over lots)."""
+    __tablename__ = "ticket_progress"
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    code: Mapped[str] = mapped_column(String(64), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class ArchiveSegment(Base):
+    """One immutable gzip JSONL file of archived transactions (all from one calendar month)."""
+    __tablename__ = "archive_segments"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    month: Mapped[str] = mapped_column(String(7), index=True)  # YYYY-MM
+    path: Mapped[str] = mapped_column(String(255), unique=True)
+    rows: Mapped[int] = mapped_column(Integer, default=0)
+    min_tx_id: Mapped[int] = mapped_column(Integer)
+    max_tx_id: Mapped[int] = mapped_column(Integer)
+    min_created_at: Mapped[datetime] = mapped_column(DateTime)
+    max_created_at: Mapped[datetime] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class ArchivedTxTotal(Base):
+    """Per-user, per-type count and sum of transactions moved to the archive."""
+    __tablename__ = "archived_tx_totals"
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    type: Mapped[TxType] = mapped_column(Enum(TxType), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+    amount: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class DailyStat(Base):
+    """Sealed per-day totals for admin stats (one row per finished UTC day, empty days included)."""
+    __tablename__ = "daily_stats"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    spins_count: Mapped[int] = mapped_column(Integer, default=0)
+    spent_on_spins: Mapped[int] = mapped_column(Integer, default=0)
+    deposits: Mapped[int] = mapped_column(Integer, default=0)
+    wins_stars: Mapped[int] = mapped_column(Integer, default=0)
+    ticket_sales: Mapped[int] = mapped_column(Integer, default=0)
+    withdraws: Mapped[int] = mapped_column(Integer, default=0)
+    unique_users: Mapped[int] = mapped_column(Integer, default=0)
+    sealed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class DailyCaseStat(Base):
+    __tablename__ = "daily_case_stats"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    case_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    spins_count: Mapped[int] = mapped_column(Integer, default=0)
+    spent_on_spins: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class DailyPrizeStat(Base):
+    __tablename__ = "daily_prize_stats"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    prize_code: Mapped[str] = mapped_column(String(64), primary_key=True)
+    wins_count: Mapped[int] = mapped_column(Integer, default=0)
+    wins_stars: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class DailyActiveUser(Base):
+    """Users with at least one transaction on a sealed day (exact distinct counts over ranges)."""
+    __tablename__ = "daily_active_users"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+
+class UserStat(Base):
+    """Lifetime per-user totals, updated in the same transaction as the writes they count."""
+    __tablename__ = "user_stats"
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    deposit_sum: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    spins_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    spent_on_spins: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    wins_stars: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    referral_bonus: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+
+class DataMigration(Base):
+    """One-off data migrations that already ran (see app.migrations)."""
+    __tablename__ = "data_migrations"
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 Index("ix_transactions_user_created", Transaction.user_id, Transaction.created_at.desc())
+Index("ix_transactions_user_type_id", Transaction.user_id, Transaction.type, Transaction.id)
+Index("ix_ticket_lots_user_code", TicketLot.user_id, TicketLot.code)
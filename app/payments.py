@@ -0,0 +1,83 @@
+"""Crediting confirmed Telegram Stars payments.
+
+The Payment row is written with a single INSERT ... ON CONFLICT DO NOTHING on the charge id,
+and the balance is credited only when that statement actually inserted the row. Concurrent or
+repeated deliveries of one charge therefore credit it exactly once and never hit the unique
+index with an error. Nothing here commits: a batch of confirmations shares one transaction.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.balance import apply_user_delta
+from app.config import settings
+from app.db import on_conflict_insert
+from app.models import Payment, Transaction, TxType, User
+from app.user_stats import add_user_stats
+
+
+def _insert_ignore(db: Session, model: Any, key: str, values: dict) -> bool:
+    """INSERT a row unless one with the same `key` exists. True if this call inserted it."""
+    insert = on_conflict_insert(db)
+    if insert is not None:
+        stmt = insert(model).values(**values).on_conflict_do_nothing(index_elements=[getattr(model, key)])
+        return db.execute(stmt.returning(getattr(model, key))).first() is not None
+
+    try:
+        with db.begin_nested():
+            db.add(model(**values))
+    except IntegrityError:
+        return False
+    return True
+
+
+def _user(db: Session, user_id: int) -> User:
+    _insert_ignore(
+        db, User, "user_id",
+        {"user_id": int(user_id), "balance": 0, "tickets_sneakers": 0, "tickets_bracelet": 0, "referrer_id": None},
+    )
+    return db.get(User, int(user_id))
+
+
+def credit_payment(db: Session, user_id: int, charge_id: str, total_amount: int) -> bool:
+    """Record the payment and credit it (plus the referrer's bonus). False if already recorded.
+
+    The caller commits.
+    """
+    inserted = _insert_ignore(
+        db, Payment, "telegram_payment_charge_id",
+        {"user_id": int(user_id), "telegram_payment_charge_id": charge_id, "total_amount": int(total_amount)},
+    )
+    if not inserted:
+        return False
+
+    u = _user(db, user_id)
+    apply_user_delta(db, u, balance=int(total_amount))
+    add_user_stats(db, int(user_id), deposit_sum=int(total_amount))
+    db.add(Transaction(
+        user_id=int(user_id),
+        type=TxType.deposit,
+        amount=int(total_amount),
+        description="Пополнение Stars",
+        meta={"telegram_payment_charge_id": charge_id},
+    ))
+
+    # referral bonus (optional)
+    bonus_percent = int(getattr(settings, "referral_bonus_percent", 0) or 0)
+    if bonus_percent > 0 and u.referrer_id:
+        bonus = (int(total_amount) * bonus_percent) // 100
+        if bonus > 0:
+            ref_u = _user(db, int(u.referrer_id))
+            apply_user_delta(db, ref_u, balance=bonus)
+            add_user_stats(db, int(ref_u.user_id), referral_bonus=bonus)
+            db.add(Transaction(
+                user_id=int(ref_u.user_id),
+                type=TxType.referral,
+                amount=bonus,
+                description=f"Реферальный бонус {bonus_percent}% за депозит приглашённого {u.user_id}",
+                meta={"invitee_id": int(u.user_id), "payment_charge_id": charge_id},
+            ))
+    return True
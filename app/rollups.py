@@ -0,0 +1,350 @@
+"""Daily rollups behind /api/admin/stats.
+
+Finished UTC days are sealed into daily_stats / daily_case_stats / daily_prize_stats /
+daily_active_users by seal_finished_days(). Days are sealed contiguously, so the last sealed
+day is the watermark; admin_stats() reads rollups for the days they fully cover and aggregates
+only the rest (normally just today) from `transactions`. Archived rows of a day that was not
+sealed yet are folded in while sealing, so rollups survive archival.
+
+The app seals every STATS_SEAL_INTERVAL seconds; it can also be run by hand:
+    python -m app.rollups seal
+    python -m app.rollups rebuild
+"""
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Optional
+
+from sqlalchemy import case, func, or_, select, union
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.archive import iter_archived
+from app.models import (
+    ArchiveSegment,
+    DailyActiveUser,
+    DailyCaseStat,
+    DailyPrizeStat,
+    DailyStat,
+    Transaction,
+    TxType,
+)
+
+STAT_KEYS = ("spins_count", "spent_on_spins", "deposits", "wins_stars", "ticket_sales", "withdraws")
+# Rows are stamped with utcnow() at insert; wait a little past midnight before sealing a day.
+SEAL_GRACE = timedelta(minutes=10)
+SEAL_CHUNK_DAYS = 31
+
+
+def day_key(v: Any) -> str:
+    if not v:
+        return "unknown"
+    return v.isoformat() if hasattr(v, "isoformat") else str(v)[:10]
+
+
+def add_stats(row: dict, tx_type, is_sale: bool, count: int, spent: int, positive: int) -> None:
+    """Fold one (type, sale) aggregate into a by-day row. `spent` = sum |amount|, `positive` = sum max(0, amount)."""
+    if tx_type == TxType.spin:
+        row["spins_count"] += count
+        row["spent_on_spins"] += spent
+    elif tx_type == TxType.deposit:
+        row["deposits"] += positive
+    elif tx_type == TxType.withdraw:
+        row["withdraws"] += spent
+    elif tx_type == TxType.win:
+        row["ticket_sales" if is_sale else "wins_stars"] += positive
+
+
+@dataclass
+class StatsAgg:
+    """Per-day aggregates: totals, per case, per prize and (optionally) the active user ids."""
+
+    by_day: dict[str, dict] = field(default_factory=dict)
+    cases: dict[str, dict[str, dict]] = field(default_factory=dict)
+    prizes: dict[str, dict[str, dict]] = field(default_factory=dict)
+    users: Optional[dict[str, set[int]]] = None
+
+    def day(self, key: str) -> dict:
+        return self.by_day.setdefault(key, {"date": key, **{k: 0 for k in STAT_KEYS}, "unique_users": 0})
+
+    def case(self, key: str, rid: str) -> dict:
+        return self.cases.setdefault(key, {}).setdefault(rid, {"case_id": rid, "spins_count": 0, "spent_on_spins": 0})
+
+    def prize(self, key: str, code: str) -> dict:
+        return self.prizes.setdefault(key, {}).setdefault(code, {"prize_code": code, "wins_count": 0, "wins_stars": 0})
+
+
+def aggregate(
+    db: Session,
+    tx_filters: list,
+    *,
+    with_users: bool = False,
+    archived: Optional[tuple[Optional[datetime], Optional[datetime], Callable[[datetime], bool]]] = None,
+) -> StatsAgg:
+    """GROUP BY day over live transactions matching `tx_filters`.
+
+    `archived` = (since, until, keep) also folds archive segment rows whose created_at passes `keep`.
+    With archived rows or `with_users`, distinct users are collected as ids (they do not add up).
+    """
+    agg = StatsAgg()
+    day_col = func.date(Transaction.created_at)
+    sale_col = case((Transaction.ticket_sell_tx_id.isnot(None), 1), else_=0)
+    spent_col = func.coalesce(func.sum(func.abs(Transaction.amount)), 0)
+    positive_col = func.coalesce(func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0)), 0)
+
+    for day, tx_type, is_sale, count, spent, positive in (
+        db.query(day_col, Transaction.type, sale_col, func.count(Transaction.id), spent_col, positive_col)
+        .filter(*tx_filters)
+        .group_by(day_col, Transaction.type, sale_col)
+    ):
+        add_stats(agg.day(day_key(day)), tx_type, bool(is_sale), int(count), int(spent), int(positive))
+
+    for day, rid, count, spent in (
+        db.query(day_col, Transaction.roulette_id, func.count(Transaction.id), spent_col)
+        .filter(Transaction.type == TxType.spin, Transaction.roulette_id.isnot(None), *tx_filters)
+        .group_by(day_col, Transaction.roulette_id)
+    ):
+        row = agg.case(day_key(day), str(rid))
+        row["spins_count"] += int(count)
+        row["spent_on_spins"] += int(spent)
+
+    for day, code, count, positive in (
+        db.query(day_col, Transaction.prize_code, func.count(Transaction.id), positive_col)
+        .filter(
+            Transaction.type == TxType.win,
+            Transaction.prize_code.isnot(None),
+            Transaction.ticket_sell_tx_id.is_(None),
+            *tx_filters,
+        )
+        .group_by(day_col, Transaction.prize_code)
+    ):
+        row = agg.prize(day_key(day), str(code))
+        row["wins_count"] += int(count)
+        row["wins_stars"] += int(positive)
+
+    if not with_users and archived is None:
+        for day, users in db.query(day_col, func.count(func.distinct(Transaction.user_id))).filter(*tx_filters).group_by(day_col):
+            agg.day(day_key(day))["unique_users"] = int(users)
+        return agg
+
+    agg.users = {}
+    for day, user_id in db.query(day_col, Transaction.user_id).filter(*tx_filters).distinct():
+        agg.users.setdefault(day_key(day), set()).add(int(user_id))
+    if archived is not None:
+        since, until, keep = archived
+        for t in iter_archived(db, since=since, until=until):
+            if t.created_at is None or not keep(t.created_at):
+                continue
+            key = day_key(t.created_at.date())
+            agg.users.setdefault(key, set()).add(t.user_id)
+            amt = int(t.amount or 0)
+            add_stats(agg.day(key), t.type, bool(t.ticket_sell_tx_id), 1, abs(amt), max(0, amt))
+            if t.type == TxType.spin and t.roulette_id:
+                row = agg.case(key, t.roulette_id)
+                row["spins_count"] += 1
+                row["spent_on_spins"] += abs(amt)
+            elif t.type == TxType.win and t.prize_code and not t.ticket_sell_tx_id:
+                row = agg.prize(key, t.prize_code)
+                row["wins_count"] += 1
+                row["wins_stars"] += max(0, amt)
+    for key, users in agg.users.items():
+        agg.day(key)["unique_users"] = len(users)
+    return agg
+
+
+def sealed_through(db: Session) -> Optional[date]:
+    """Last sealed day (the watermark), or None before the first seal."""
+    v = db.query(func.max(DailyStat.day)).scalar()
+    if isinstance(v, str):
+        v = date.fromisoformat(v)
+    return v
+
+
+def _first_activity_day(db: Session) -> Optional[date]:
+    firsts = [
+        db.query(func.min(Transaction.created_at)).scalar(),
+        db.query(func.min(ArchiveSegment.min_created_at)).scalar(),
+    ]
+    firsts = [v for v in firsts if v is not None]
+    return min(firsts).date() if firsts else None
+
+
+def _seal_range(db: Session, start: date, end: date) -> None:
+    """Write rollups for days [start, end) and commit."""
+    lo = datetime.combine(start, time.min)
+    hi = datetime.combine(end, time.min)
+    agg = aggregate(
+        db,
+        [Transaction.created_at >= lo, Transaction.created_at < hi],
+        with_users=True,
+        archived=(lo, hi, lambda ts: lo <= ts < hi),
+    )
+    now = datetime.utcnow()
+    d = start
+    while d < end:
+        key = d.isoformat()
+        row = agg.by_day.get(key) or {k: 0 for k in STAT_KEYS}
+        db.add(DailyStat(day=d, sealed_at=now, unique_users=len(agg.users.get(key, ())), **{k: int(row[k]) for k in STAT_KEYS}))
+        for c in agg.cases.get(key, {}).values():
+            db.add(DailyCaseStat(day=d, case_id=c["case_id"], spins_count=c["spins_count"], spent_on_spins=c["spent_on_spins"]))
+        for p in agg.prizes.get(key, {}).values():
+            db.add(DailyPrizeStat(day=d, prize_code=p["prize_code"], wins_count=p["wins_count"], wins_stars=p["wins_stars"]))
+        db.add_all(DailyActiveUser(day=d, user_id=uid) for uid in sorted(agg.users.get(key, ())))
+        d += timedelta(days=1)
+    db.commit()
+
+
+def seal_finished_days(db: Session, now: Optional[datetime] = None) -> int:
+    """Seal every finished day after the watermark. Returns number of days sealed.
+
+    Safe to run from several workers: a concurrent seal of the same days loses on the
+    primary key and this call simply stops.
+    """
+    now = now or datetime.utcnow()
+    last_finished = (now - SEAL_GRACE).date() - timedelta(days=1)
+    watermark = sealed_through(db)
+    start = watermark + timedelta(days=1) if watermark else _first_activity_day(db)
+    sealed = 0
+    while start is not None and start <= last_finished:
+        end = min(start + timedelta(days=SEAL_CHUNK_DAYS), last_finished + timedelta(days=1))
+        try:
+            _seal_range(db, start, end)
+        except IntegrityError:
+            db.rollback()
+            break
+        sealed += (end - start).days
+        start = end
+    return sealed
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Drop all rollups and seal every finished day again."""
+    for model in (DailyActiveUser, DailyPrizeStat, DailyCaseStat, DailyStat):
+        db.query(model).delete(synchronize_session=False)
+    db.commit()
+    return seal_finished_days(db)
+
+
+def stats_report(db: Session, dt_from: Optional[datetime], dt_to: Optional[datetime], archived: bool = False) -> dict:
+    """totals / by_day / by_case / by_prize for [dt_from, dt_to] from rollups plus the unsealed rest."""
+    # Sealed days lying entirely inside the requested range come from rollups.
+    watermark = sealed_through(db)
+    r_start = r_end = None
+    if watermark is not None:
+        first = db.query(func.min(DailyStat.day)).scalar()
+        first = date.fromisoformat(first) if isinstance(first, str) else first
+        r_start = first
+        if dt_from is not None:
+            r_start = max(first, dt_from.date() + timedelta(days=0 if dt_from.time() == time.min else 1))
+        r_end = watermark + timedelta(days=1)
+        if dt_to is not None:
+            r_end = min(r_end, dt_to.date() + timedelta(days=1 if dt_to.time() == time.max else 0))
+        if r_start >= r_end:
+            r_start = r_end = None
+
+    tx_filters = []
+    if dt_from:
+        tx_filters.append(Transaction.created_at >= dt_from)
+    if dt_to:
+        tx_filters.append(Transaction.created_at <= dt_to)
+    lo = hi = None
+    if r_start is not None:
+        lo = datetime.combine(r_start, time.min)
+        hi = datetime.combine(r_end, time.min)
+        tx_filters.append(or_(Transaction.created_at < lo, Transaction.created_at >= hi))
+
+    def keep(ts: datetime) -> bool:
+        if dt_from is not None and ts < dt_from:
+            return False
+        if dt_to is not None and ts > dt_to:
+            return False
+        return lo is None or not (lo <= ts < hi)
+
+    agg = aggregate(db, tx_filters, archived=(dt_from, dt_to, keep) if archived else None)
+
+    by_day = dict(agg.by_day)
+    by_case: dict[str, dict] = {}
+    by_prize: dict[str, dict] = {}
+    for rows in agg.cases.values():
+        for rid, c in rows.items():
+            row = by_case.setdefault(rid, {"case_id": rid, "spins_count": 0, "spent_on_spins": 0})
+            row["spins_count"] += c["spins_count"]
+            row["spent_on_spins"] += c["spent_on_spins"]
+    for rows in agg.prizes.values():
+        for code, p in rows.items():
+            row = by_prize.setdefault(code, {"prize_code": code, "wins_count": 0, "wins_stars": 0})
+            row["wins_count"] += p["wins_count"]
+            row["wins_stars"] += p["wins_stars"]
+
+    if r_start is not None:
+        in_range = (DailyStat.day >= r_start, DailyStat.day < r_end)
+        for s in db.query(DailyStat).filter(*in_range):
+            if not any(getattr(s, k) for k in STAT_KEYS) and not s.unique_users:
+                continue
+            key = day_key(s.day)
+            by_day[key] = {"date": key, **{k: int(getattr(s, k)) for k in STAT_KEYS}, "unique_users": int(s.unique_users)}
+        for rid, count, spent in (
+            db.query(DailyCaseStat.case_id, func.sum(DailyCaseStat.spins_count), func.sum(DailyCaseStat.spent_on_spins))
+            .filter(DailyCaseStat.day >= r_start, DailyCaseStat.day < r_end)
+            .group_by(DailyCaseStat.case_id)
+        ):
+            row = by_case.setdefault(rid, {"case_id": rid, "spins_count": 0, "spent_on_spins": 0})
+            row["spins_count"] += int(count or 0)
+            row["spent_on_spins"] += int(spent or 0)
+        for code, count, stars in (
+            db.query(DailyPrizeStat.prize_code, func.sum(DailyPrizeStat.wins_count), func.sum(DailyPrizeStat.wins_stars))
+            .filter(DailyPrizeStat.day >= r_start, DailyPrizeStat.day < r_end)
+            .group_by(DailyPrizeStat.prize_code)
+        ):
+            row = by_prize.setdefault(code, {"prize_code": code, "wins_count": 0, "wins_stars": 0})
+            row["wins_count"] += int(count or 0)
+            row["wins_stars"] += int(stars or 0)
+
+    # Distinct users over the whole range: union of sealed days' users and the live rest.
+    rollup_users = (
+        select(DailyActiveUser.user_id).where(DailyActiveUser.day >= r_start, DailyActiveUser.day < r_end)
+        if r_start is not None
+        else None
+    )
+    if agg.users is None:
+        live_users = select(Transaction.user_id).where(*tx_filters)
+        users_q = union(live_users, rollup_users) if rollup_users is not None else live_users.distinct()
+        unique_users = int(db.execute(select(func.count()).select_from(users_q.subquery())).scalar() or 0)
+    else:
+        ids = set().union(*agg.users.values())
+        if rollup_users is not None:
+            ids.update(int(x) for (x,) in db.execute(rollup_users.distinct()))
+        unique_users = len(ids)
+
+    by_day_out = [by_day[k] for k in sorted(by_day.keys())]
+    totals = {k: sum(int(row[k]) for row in by_day_out) for k in STAT_KEYS}
+    totals["unique_users"] = unique_users
+    return {
+        "totals": totals,
+        "by_day": by_day_out,
+        "by_case": sorted(by_case.values(), key=lambda x: x["spins_count"], reverse=True),
+        "by_prize": sorted(by_prize.values(), key=lambda x: x["wins_count"], reverse=True),
+    }
+
+
+def main(argv: list[str]) -> int:
+    from app.db import SessionLocal, init_db
+
+    if argv[:1] not in (["seal"], ["rebuild"]):
+        print("usage: python -m app.rollups seal|rebuild")
+        return 2
+    init_db()
+    db = SessionLocal()
+    try:
+        days = seal_finished_days(db) if argv[0] == "seal" else rebuild_rollups(db)
+        watermark = sealed_through(db)
+    finally:
+        db.close()
+    print(f"days sealed: {days}; sealed through: {watermark.isoformat() if watermark else '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -1,26 +1,24 @@
 from __future__ import annotations
 
-import json
 import random
-from pathlib import Path
-from typing import Any, Dict, Optional
+import threading
+import time
+from dataclasses import dataclass, field
+from itertools import combinations
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence
 
 from sqlalchemy.orm import Session
 
+from app.balance import apply_user_delta
 from app.config import settings
+from app.media_config import content_digest, get_media_config
 from app.models import CaseConfig, Transaction, TxType, User
 from app.roulette_sets import DEFAULT_CASES
+from app.tickets import add_ticket_lot, user_ticket_progress
+from app.user_stats import add_user_stats
 
-MEDIA_CONFIG_PATH = Path(__file__).resolve().parent / "static" / "prizes" / "roulettes.json"
-
-
-def _load_media_config() -> dict[str, Any]:
-    try:
-        with MEDIA_CONFIG_PATH.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data if isinstance(data, dict) else {}
-    except Exception:
-        return {}
+MAX_BATCH_SPINS = 10
 
 
 def _default_rarity(p: dict[str, Any]) -> str:
@@ -50,51 +48,28 @@ def _default_rarity(p: dict[str, Any]) -> str:
     return "blue"
 
 
-def _user_item_ticket_progress(db: Session, user_id: int) -> dict[str, int]:
-    rows = (
-        db.query(Transaction)
-        .filter(Transaction.user_id == int(user_id), Transaction.type == TxType.win)
-        .all()
-    )
-    out: dict[str, int] = {}
-    for t in rows:
-        meta = t.meta or {}
-        code = str(meta.get("prize_code") or "")
-        added = int(meta.get("hidden_tickets_added") or 0)
-        sold = int(meta.get("hidden_tickets_sold") or 0)
-        if not code:
-            continue
-        out[code] = int(out.get(code, 0)) + added - sold
-    return {k: v for k, v in out.items() if v > 0}
-
-
-def _maybe_boost_near_target_ticket(db: Session, user: User, roulette: dict[str, Any], prize: dict[str, Any]) -> dict[str, Any]:
-    prizes = list(roulette.get("prizes") or [])
-    if not prizes:
+def _maybe_boost_near_target_ticket(
+    db: Session,
+    user: User,
+    compiled: CompiledCase,
+    prize: dict[str, Any],
+    progress: Optional[dict[str, int]] = None,
+) -> dict[str, Any]:
+    if not compiled.case.get("prizes"):
         return prize
 
-    media = _load_media_config()
-    economy = media.get("economy") if isinstance(media.get("economy"), dict) else {}
-    boost_percent = int((economy or {}).get("near_target_ticket_boost_percent") or 0)
+    media = get_media_config()
+    boost_percent = media.near_target_ticket_boost_percent
     if boost_percent <= 0:
         return prize
 
-    targets = media.get("ticket_targets") if isinstance(media.get("ticket_targets"), dict) else {}
-    progress = _user_item_ticket_progress(db, int(user.user_id))
+    if progress is None:
+        progress = user_ticket_progress(db, int(user.user_id))
 
     one_left_codes: list[str] = []
     boosted_codes: list[str] = []
-    left_map: dict[str, int] = {}
-    for p in prizes:
-        if str(p.get("type") or "") != "item":
-            continue
-        code = str(p.get("code") or "")
-        if not code:
-            continue
-        default_target = 10 if code == "shoes" else 5
-        target = max(1, int((targets or {}).get(code) or default_target))
-        left = max(0, target - int(progress.get(code, 0)))
-        left_map[code] = left
+    for code in compiled.item_codes:
+        left = max(0, media.ticket_target(code) - int(progress.get(code, 0)))
         if left == 1:
             one_left_codes.append(code)
         elif left in (2, 3):
@@ -107,14 +82,9 @@ def _maybe_boost_near_target_ticket(db: Session, user: User, roulette: dict[str,
     if current_type == "item" and current_code in one_left_codes:
         penalty_roll = max(70, min(97, 100 - max(1, boost_percent // 2)))  # higher => rarer final ticket
         if random.randint(1, 100) <= penalty_roll:
-            alt = [
-                p for p in prizes
-                if int(p.get("is_enabled") or 0) == 1
-                and not (str(p.get("type") or "") == "item" and str(p.get("code") or "") in one_left_codes)
-            ]
-            if alt:
-                weights = [max(1, int(p.get("weight") or 1)) for p in alt]
-                return random.choices(alt, weights=weights, k=1)[0]
+            alt = compiled.without_items(frozenset(one_left_codes))
+            if alt is not None:
+                return alt.sample()
 
     if not boosted_codes:
         return prize
@@ -123,24 +93,29 @@ def _maybe_boost_near_target_ticket(db: Session, user: User, roulette: dict[str,
     if random.random() > (boost_percent / 100.0):
         return prize
 
-    boosted = [
-        p for p in prizes
-        if str(p.get("type") or "") == "item"
-        and str(p.get("code") or "") in boosted_codes
-        and int(p.get("is_enabled") or 0) == 1
-    ]
-    if not boosted:
+    boosted = compiled.only_items(frozenset(boosted_codes))
+    if boosted is None:
         return prize
-    weights = [max(1, int(p.get("weight") or 1)) for p in boosted]
-    return random.choices(boosted, weights=weights, k=1)[0]
+    return boosted.sample()
 
 
-def _tx(db: Session, user_id: int, ttype: str, amount: int, desc: str, meta: Optional[dict] = None) -> None:
+def _tx(db: Session, user_id: int, ttype: str, amount: int, desc: str, meta: Optional[dict] = None) -> Transaction:
     try:
         tx_type = TxType(ttype)
     except Exception:
         tx_type = TxType.win
-    db.add(Transaction(user_id=user_id, type=tx_type, amount=amount, description=desc, meta=meta or {}))
+    meta = meta or {}
+    tx = Transaction(
+        user_id=user_id,
+        type=tx_type,
+        amount=amount,
+        description=desc,
+        meta=meta,
+        roulette_id=meta.get("roulette_id") or None,
+        prize_code=meta.get("prize_code") or None,
+    )
+    db.add(tx)
+    return tx
 
 
 def _norm_prize(p: dict[str, Any]) -> dict[str, Any]:
@@ -170,6 +145,11 @@ def _norm_case(c: dict[str, Any]) -> dict[str, Any]:
     }
 
 
+def normalize_case(raw: dict[str, Any]) -> dict[str, Any]:
+    """Public alias of the case normalizer (same rules save_cases applies)."""
+    return _norm_case(raw)
+
+
 def ensure_case_configs(db: Session) -> None:
     if db.query(CaseConfig).count() > 0:
         return
@@ -188,7 +168,7 @@ def ensure_case_configs(db: Session) -> None:
     db.commit()
 
 
-def list_cases(db: Session) -> list[dict[str, Any]]:
+def _load_cases(db: Session) -> list[dict[str, Any]]:
     ensure_case_configs(db)
     rows = db.query(CaseConfig).order_by(CaseConfig.id.asc()).all()
     out: list[dict[str, Any]] = []
@@ -208,6 +188,186 @@ def list_cases(db: Session) -> list[dict[str, Any]]:
     return out
 
 
+class AliasTable:
+    """Walker/Vose alias table: O(n) setup, O(1) allocation-free weighted sampling."""
+
+    __slots__ = ("items", "prob", "alias", "n")
+
+    def __init__(self, items: Sequence[Any], weights: Sequence[float]):
+        n = len(items)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("alias table needs at least one positive weight")
+
+        scaled = [float(w) * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, v in enumerate(scaled) if v < 1.0]
+        large = [i for i, v in enumerate(scaled) if v >= 1.0]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = g
+            scaled[g] = (scaled[g] + scaled[s]) - 1.0
+            (small if scaled[g] < 1.0 else large).append(g)
+        # Leftovers are 1.0 up to float rounding.
+
+        self.items = tuple(items)
+        self.prob = tuple(prob)
+        self.alias = tuple(alias)
+        self.n = n
+
+    def sample(self, rnd: Callable[[], float] = random.random) -> Any:
+        u = rnd() * self.n
+        i = min(int(u), self.n - 1)
+        if u - i < self.prob[i]:
+            return self.items[i]
+        return self.items[self.alias[i]]
+
+
+# Boost variants are precomputed for every subset of a case's item codes up to this many codes
+# (2**n tables per kind); larger cases build the rare variant they need per draw instead.
+MAX_PRECOMPUTED_ITEM_CODES = 10
+
+
+def _variant_table(prizes: Sequence[dict[str, Any]], kind: str, codes: frozenset[str]) -> AliasTable | None:
+    if kind == "without":
+        pool = [
+            p for p in prizes
+            if int(p.get("is_enabled") or 0) == 1
+            and not (str(p.get("type") or "") == "item" and str(p.get("code") or "") in codes)
+        ]
+    else:
+        pool = [
+            p for p in prizes
+            if str(p.get("type") or "") == "item"
+            and str(p.get("code") or "") in codes
+            and int(p.get("is_enabled") or 0) == 1
+        ]
+    # Boost draws have always counted zero-weight prizes as weight 1.
+    return AliasTable(pool, [max(1, int(p.get("weight") or 1)) for p in pool]) if pool else None
+
+
+def _build_variants(
+    prizes: Sequence[dict[str, Any]], item_codes: Sequence[str]
+) -> Mapping[tuple[str, frozenset[str]], AliasTable | None]:
+    distinct = sorted(set(item_codes))
+    if len(distinct) > MAX_PRECOMPUTED_ITEM_CODES:
+        return MappingProxyType({})
+    variants: dict[tuple[str, frozenset[str]], AliasTable | None] = {}
+    for size in range(1, len(distinct) + 1):
+        for combo in combinations(distinct, size):
+            codes = frozenset(combo)
+            variants[("without", codes)] = _variant_table(prizes, "without", codes)
+            variants[("only", codes)] = _variant_table(prizes, "only", codes)
+    return MappingProxyType(variants)
+
+
+@dataclass(frozen=True)
+class CompiledCase:
+    """Normalized case plus everything the spin path needs precomputed."""
+
+    case: Mapping[str, Any]
+    enabled: tuple[dict[str, Any], ...]
+    table: AliasTable | None
+    item_codes: tuple[str, ...]
+    # Boost variant tables keyed by (kind, item codes), built with the catalog and read-only after.
+    variants: Mapping[tuple[str, frozenset[str]], AliasTable | None] = field(compare=False, repr=False)
+
+    @classmethod
+    def build(cls, case: dict[str, Any]) -> "CompiledCase":
+        prizes = case.get("prizes") or []
+        enabled = tuple(
+            p for p in prizes
+            if int(p.get("is_enabled") or 0) == 1 and int(p.get("weight") or 0) > 0
+        )
+        item_codes = tuple(
+            str(p.get("code") or "") for p in prizes
+            if str(p.get("type") or "") == "item" and p.get("code")
+        )
+        return cls(
+            case=MappingProxyType(case),
+            enabled=enabled,
+            table=AliasTable(enabled, [float(p.get("weight", 1.0)) for p in enabled]) if enabled else None,
+            item_codes=item_codes,
+            variants=_build_variants(prizes, item_codes),
+        )
+
+    def _variant(self, kind: str, codes: frozenset[str]) -> AliasTable | None:
+        # Codes outside this case's items select the same prizes as without them.
+        codes = codes & frozenset(self.item_codes)
+        try:
+            return self.variants[(kind, codes)]
+        except KeyError:
+            return _variant_table(self.case.get("prizes") or [], kind, codes)
+
+    def without_items(self, codes: frozenset[str]) -> AliasTable | None:
+        """Enabled prizes except the given item codes (one-left penalty redraw)."""
+        return self._variant("without", codes)
+
+    def only_items(self, codes: frozenset[str]) -> AliasTable | None:
+        """Enabled items among the given codes (near-target boost draw)."""
+        return self._variant("only", codes)
+
+
+@dataclass(frozen=True)
+class CaseCatalog:
+    """Immutable snapshot of all cases. Rebuilt only when save_cases commits."""
+
+    version: int
+    digest: str
+    built_at: float
+    cases: tuple[CompiledCase, ...]
+    by_id: Mapping[str, CompiledCase]
+
+    @classmethod
+    def build(cls, version: int, cases: list[dict[str, Any]]) -> "CaseCatalog":
+        compiled = tuple(CompiledCase.build(c) for c in cases)
+        return cls(
+            version=version,
+            digest=content_digest(cases),
+            built_at=time.monotonic(),
+            cases=compiled,
+            by_id=MappingProxyType({c.case["id"]: c for c in compiled}),
+        )
+
+    def get(self, roulette_id: str) -> CompiledCase:
+        found = self.by_id.get(roulette_id)
+        if found is not None:
+            return found
+        if self.cases:
+            return self.cases[0]
+        return CompiledCase.build(_norm_case(DEFAULT_CASES[0]))
+
+
+_catalog: CaseCatalog | None = None
+_catalog_version = 0
+_catalog_lock = threading.Lock()
+
+
+def _rebuild_catalog(db: Session) -> CaseCatalog:
+    global _catalog, _catalog_version
+    with _catalog_lock:
+        _catalog_version += 1
+        _catalog = CaseCatalog.build(_catalog_version, _load_cases(db))
+        return _catalog
+
+
+def get_catalog(db: Session) -> CaseCatalog:
+    """Current case catalog; touches the DB only on first use (or after CASE_CATALOG_TTL)."""
+    catalog = _catalog
+    if catalog is not None:
+        ttl = int(getattr(settings, "case_catalog_ttl", 0) or 0)
+        if ttl <= 0 or time.monotonic() - catalog.built_at < ttl:
+            return catalog
+    return _rebuild_catalog(db)
+
+
+def list_cases(db: Session) -> list[dict[str, Any]]:
+    """Normalized cases from the catalog snapshot (shallow copies; prize dicts are shared)."""
+    return [dict(c.case) for c in get_catalog(db).cases]
+
+
 def save_cases(db: Session, items: list[dict[str, Any]]) -> None:
     if not items:
         return
@@ -233,53 +393,45 @@ def save_cases(db: Session, items: list[dict[str, Any]]) -> None:
         if row.id not in seen_ids:
             db.delete(row)
     db.commit()
+    _rebuild_catalog(db)
 
 
-def _get_case(db: Session, roulette_id: str) -> dict[str, Any]:
-    cases = list_cases(db)
-    if not cases:
-        return _norm_case(DEFAULT_CASES[0])
-    by_id = {c["id"]: c for c in cases}
-    return by_id.get(roulette_id) or cases[0]
+def _get_case(db: Session, roulette_id: str) -> CompiledCase:
+    return get_catalog(db).get(roulette_id)
 
 
-def _choose_prize(prizes: list[dict[str, Any]]) -> dict[str, Any]:
-    enabled = [p for p in prizes if int(p.get("is_enabled") or 0) == 1 and int(p.get("weight") or 0) > 0]
-    if not enabled:
+def _choose_prize(compiled: CompiledCase) -> dict[str, Any]:
+    if compiled.table is None:
         raise RuntimeError("No enabled prizes with positive weight")
-    weights = [float(p.get("weight", 1.0)) for p in enabled]
-    return random.choices(enabled, weights=weights, k=1)[0]
-
-
-def spin_once(db: Session, user: User, roulette_id: str) -> Dict[str, Any]:
-    roulette = _get_case(db, roulette_id)
-    cost = int(roulette.get("spin_cost") or settings.spin_cost)
-
-    if user.balance < cost:
-        return {
-            "ok": False,
-            "error": "insufficient_balance",
-            "message": "Недостаточно Stars",
-            "roulette_id": roulette.get("id", roulette_id),
-            "cost": cost,
-            "balance": user.balance,
-        }
-
-    user.balance -= cost
+    return compiled.table.sample()
+
+
+def _spin_draw(
+    db: Session,
+    user: User,
+    compiled: CompiledCase,
+    cost: int,
+    delta: dict[str, int],
+    progress: Optional[dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """Draw one prize and stage its transactions (no commit, no balance write).
+
+    Balance/ticket winnings are added to `delta` for the caller's single atomic user update.
+    `progress` is the user's unsold ticket count per item; when given it is updated in place,
+    so consecutive draws in one batch see each other's tickets.
+    """
+    roulette = compiled.case
     _tx(
         db,
         user.user_id,
         "spin",
         -cost,
-        f"Spin {roulette.get('title', 'Case')} ({roulette.get('id', roulette_id)})",
-        {"roulette_id": roulette.get("id", roulette_id), "case_cost": cost},
+        f"Spin {roulette.get('title', 'Case')} ({roulette.get('id')})",
+        {"roulette_id": roulette.get("id"), "case_cost": cost},
     )
 
-    try:
-        prize = _choose_prize(list(roulette.get("prizes") or []))
-        prize = _maybe_boost_near_target_ticket(db, user, roulette, prize)
-    except Exception:
-        return {"ok": False, "message": "В кейсе нет доступных призов"}
+    prize = _choose_prize(compiled)
+    prize = _maybe_boost_near_target_ticket(db, user, compiled, prize, progress)
 
     p_type = str(prize.get("type") or "item")
     p_title = str(prize.get("title") or "Приз")
@@ -287,7 +439,7 @@ def spin_once(db: Session, user: User, roulette_id: str) -> Dict[str, Any]:
     p_amount = int(prize.get("amount", 0) or 0)
 
     if p_type == "stars":
-        user.balance += p_amount
+        delta["balance"] += p_amount
         win_text = f"Вы выиграли ⭐ {p_amount} Stars"
         _tx(
             db,
@@ -311,12 +463,9 @@ def spin_once(db: Session, user: User, roulette_id: str) -> Dict[str, Any]:
         # Hidden ticket accrual: user sees item drop text, while tickets are tracked internally.
         qty = max(1, p_amount or 1)
         ticket_kind = "bracelet" if p_code in {"bracelet"} else "sneakers"
-        if ticket_kind == "bracelet":
-            user.tickets_bracelet = int(user.tickets_bracelet or 0) + qty
-        else:
-            user.tickets_sneakers = int(user.tickets_sneakers or 0) + qty
+        delta[f"tickets_{ticket_kind}"] += qty
         win_text = f"Вы выиграли {p_title}"
-        _tx(
+        win_tx = _tx(
             db,
             user.user_id,
             "win",
@@ -333,20 +482,21 @@ def spin_once(db: Session, user: User, roulette_id: str) -> Dict[str, Any]:
                 "rarity": prize.get("rarity"),
             },
         )
-
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+        add_ticket_lot(
+            db,
+            win_tx,
+            user_id=user.user_id,
+            code=p_code,
+            ticket_kind=ticket_kind,
+            qty=qty,
+            rarity=str(prize.get("rarity") or "blue"),
+            roulette_id=str(roulette.get("id") or ""),
+            case_cost=cost,
+        )
+        if progress is not None:
+            progress[p_code] = int(progress.get(p_code, 0)) + qty
 
     return {
-        "ok": True,
-        "roulette_id": roulette.get("id", roulette_id),
-        "cost": cost,
-        "balance": int(user.balance),
-        "tickets": {
-            "sneakers": int(user.tickets_sneakers or 0),
-            "bracelet": int(user.tickets_bracelet or 0),
-        },
         "prize": {
             "type": p_type,
             "code": p_code,
@@ -359,3 +509,112 @@ def spin_once(db: Session, user: User, roulette_id: str) -> Dict[str, Any]:
             "win_text": win_text,
         },
     }
+
+
+def _insufficient(roulette: Mapping[str, Any], roulette_id: str, cost: int, balance: int, **extra: Any) -> Dict[str, Any]:
+    return {
+        "ok": False,
+        "error": "insufficient_balance",
+        "message": "Недостаточно Stars",
+        "roulette_id": roulette.get("id", roulette_id),
+        "cost": cost,
+        **extra,
+        "balance": balance,
+    }
+
+
+def _new_delta() -> dict[str, int]:
+    return {"balance": 0, "tickets_sneakers": 0, "tickets_bracelet": 0}
+
+
+def _settle(db: Session, user: User, count: int, total_cost: int, delta: dict[str, int]) -> bool:
+    """Debit total_cost and credit winnings in one guarded UPDATE; roll back the draws on failure."""
+    ok = apply_user_delta(
+        db,
+        user,
+        balance=delta["balance"] - total_cost,
+        tickets_sneakers=delta["tickets_sneakers"],
+        tickets_bracelet=delta["tickets_bracelet"],
+        require_balance=total_cost,
+    )
+    if not ok:
+        db.rollback()
+        return False
+    # delta["balance"] is exactly the stars won by these draws.
+    add_user_stats(db, user.user_id, spins_count=count, spent_on_spins=total_cost, wins_stars=delta["balance"])
+    return True
+
+
+def _user_state(user: User) -> Dict[str, Any]:
+    return {
+        "balance": int(user.balance),
+        "tickets": {
+            "sneakers": int(user.tickets_sneakers or 0),
+            "bracelet": int(user.tickets_bracelet or 0),
+        },
+    }
+
+
+def spin_once(db: Session, user: User, roulette_id: str) -> Dict[str, Any]:
+    compiled = _get_case(db, roulette_id)
+    roulette = compiled.case
+    cost = int(roulette.get("spin_cost") or settings.spin_cost)
+
+    # Fast path only; the guarded UPDATE in _settle is what actually enforces the balance.
+    if user.balance < cost:
+        return _insufficient(roulette, roulette_id, cost, user.balance)
+
+    delta = _new_delta()
+    try:
+        drawn = _spin_draw(db, user, compiled, cost, delta)
+    except Exception:
+        return {"ok": False, "message": "В кейсе нет доступных призов"}
+
+    if not _settle(db, user, 1, cost, delta):
+        return _insufficient(roulette, roulette_id, cost, user.balance)
+    state = _user_state(user)
+    db.commit()
+
+    return {
+        "ok": True,
+        "roulette_id": roulette.get("id", roulette_id),
+        "cost": cost,
+        **state,
+        **drawn,
+    }
+
+
+def spin_batch(db: Session, user: User, roulette_id: str, count: int) -> Dict[str, Any]:
+    """Open one case `count` times atomically: one debit, `count` draws, one commit."""
+    compiled = _get_case(db, roulette_id)
+    roulette = compiled.case
+    cost = int(roulette.get("spin_cost") or settings.spin_cost)
+    count = max(1, min(MAX_BATCH_SPINS, int(count)))
+    total_cost = cost * count
+
+    if user.balance < total_cost:
+        return _insufficient(roulette, roulette_id, cost, user.balance, count=count, total_cost=total_cost)
+    if compiled.table is None:
+        return {"ok": False, "message": "В кейсе нет доступных призов"}
+
+    progress = None
+    if get_media_config().near_target_ticket_boost_percent > 0:
+        progress = user_ticket_progress(db, int(user.user_id))
+
+    delta = _new_delta()
+    results = [_spin_draw(db, user, compiled, cost, delta, progress) for _ in range(count)]
+
+    if not _settle(db, user, count, total_cost, delta):
+        return _insufficient(roulette, roulette_id, cost, user.balance, count=count, total_cost=total_cost)
+    state = _user_state(user)
+    db.commit()
+
+    return {
+        "ok": True,
+        "roulette_id": roulette.get("id", roulette_id),
+        "cost": cost,
+        "count": count,
+        "total_cost": total_cost,
+        **state,
+        "results": results,
+    }
@@ -10,6 +10,11 @@ class SpinIn(BaseModel):
     roulette_id: str = Field(default="r1", min_length=1, max_length=50)
 
 
+class SpinBatchIn(BaseModel):
+    roulette_id: str = Field(default="r1", min_length=1, max_length=50)
+    count: int = Field(default=10, ge=1, le=10)
+
+
 class WithdrawIn(BaseModel):
     amount: int = Field(..., ge=1)
 
@@ -20,6 +25,18 @@ class InvoiceIn(BaseModel):
     description: Optional[str] = Field(default=None)
 
 
+# --- Internal API (bot -> backend) ---
+
+class PaymentConfirmIn(BaseModel):
+    user_id: int = Field(..., ge=1)
+    telegram_payment_charge_id: str = Field(..., min_length=1, max_length=512)
+    total_amount: int = Field(..., ge=1)
+
+
+class PaymentConfirmBatchIn(BaseModel):
+    items: list[PaymentConfirmIn] = Field(..., min_length=1, max_length=500)
+
+
 # --- (опционально) общие модели, если где-то используются ---
 TransactionType = Literal["deposit", "spin", "win", "withdraw", "referral"]
 
@@ -0,0 +1,231 @@
+"""Vectorized Monte Carlo simulator of the case economy.
+
+Simulates many independent users ("paths"), each opening one case `spins` times, with the
+same draw rules as app.roulette: base weighted draw, one-left penalty redraw and
+near-target boost (both path-dependent on the user's ticket progress).
+
+Reports RTP in Stars, per-path payout quantiles, spins needed to reach each item's ticket
+target, and the liability if every won ticket were sold back at ticket_sell_percent.
+
+CLI:  python -m app.simulator [--case r1] [--paths 100000] [--spins 100] [--seed 1]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, Mapping, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.media_config import MediaConfig
+
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+def _quantiles(values: np.ndarray, qs: tuple[float, ...] = QUANTILES) -> dict[str, float]:
+    if values.size == 0:
+        return {}
+    out = np.quantile(values, qs)
+    return {f"p{int(round(q * 100))}": float(v) for q, v in zip(qs, out)}
+
+
+def _draw_rows(rng: np.random.Generator, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Draw one column per row of a (rows x prizes) weight matrix. Returns (index, has_any)."""
+    cdf = np.cumsum(weights, axis=1)
+    total = cdf[:, -1]
+    x = rng.random(weights.shape[0]) * total
+    return (cdf > x[:, None]).argmax(axis=1), total > 0
+
+
+def simulate_case(
+    case: Mapping[str, Any],
+    media: MediaConfig,
+    *,
+    paths: int = 100_000,
+    spins: int = 100,
+    seed: Optional[int] = None,
+) -> dict[str, Any]:
+    """Simulate `paths` users opening a normalized case `spins` times each."""
+    rng = np.random.default_rng(seed)
+    paths = max(1, int(paths))
+    spins = max(1, int(spins))
+
+    prizes = list(case.get("prizes") or [])
+    cost = int(case.get("spin_cost") or settings.spin_cost)
+    codes = [str(p.get("code") or "prize") for p in prizes]
+    types = np.array([str(p.get("type") or "item") for p in prizes])
+    amount = np.array([int(p.get("amount") or 0) for p in prizes], dtype=np.int64)
+    weight = np.array([max(0, int(p.get("weight") or 0)) for p in prizes], dtype=np.float64)
+    enabled = np.array([int(p.get("is_enabled") or 0) == 1 for p in prizes], dtype=bool)
+
+    base_w = np.where(enabled & (weight > 0), weight, 0.0)
+    if base_w.sum() <= 0:
+        raise ValueError("No enabled prizes with positive weight")
+    base_cdf = np.cumsum(base_w)
+    # Boost/penalty redraws weight zero-weight enabled prizes as 1, like the live code.
+    alt_w = np.where(enabled, np.maximum(1.0, weight), 0.0)
+
+    is_stars = types == "stars"
+    is_item = types == "item"
+    item_codes = list(dict.fromkeys(c for c, it in zip(codes, is_item) if it))
+    k = len(item_codes)
+    code_idx = np.array([item_codes.index(c) if it else -1 for c, it in zip(codes, is_item)], dtype=np.int64)
+    qty = np.where(is_item, np.maximum(1, amount), 0)
+    stars = np.where(is_stars, amount, 0)
+    # prize x item-code incidence, used to turn per-path code masks into per-path prize masks
+    incidence = np.zeros((len(prizes), max(k, 1)), dtype=bool)
+    for i, ci in enumerate(code_idx):
+        if ci >= 0:
+            incidence[i, ci] = True
+
+    targets = np.array([media.ticket_target(c) for c in item_codes], dtype=np.int64)
+    boost = media.near_target_ticket_boost_percent
+    penalty_roll = max(70, min(97, 100 - max(1, boost // 2)))
+
+    rows_all = np.arange(paths)
+    progress = np.zeros((paths, k), dtype=np.int64)
+    spins_to_target = np.full((paths, k), -1, dtype=np.int64)
+    payout = np.zeros(paths, dtype=np.int64)
+    payout_sq_sum = 0.0
+    drops = np.zeros(len(prizes), dtype=np.int64)
+
+    for step in range(spins):
+        idx = np.searchsorted(base_cdf, rng.random(paths) * base_cdf[-1], side="right")
+
+        if boost > 0 and k > 0:
+            left = np.maximum(0, targets[None, :] - progress)
+            one_left = left == 1
+            boosted = (left == 2) | (left == 3)
+            settled = np.zeros(paths, dtype=bool)
+
+            cur = code_idx[idx]
+            cur_safe = np.maximum(cur, 0)
+            penalty = (cur >= 0) & one_left[rows_all, cur_safe] & (rng.integers(1, 101, paths) <= penalty_roll)
+            if penalty.any():
+                rows = np.nonzero(penalty)[0]
+                excluded = (one_left[rows].astype(np.int8) @ incidence.T.astype(np.int8)) > 0
+                new, ok = _draw_rows(rng, np.where(excluded, 0.0, alt_w[None, :]))
+                idx[rows[ok]] = new[ok]
+                settled[rows[ok]] = True
+
+            cur = code_idx[idx]
+            cur_safe = np.maximum(cur, 0)
+            cur_boosted = (cur >= 0) & boosted[rows_all, cur_safe]
+            cand = ~settled & boosted.any(axis=1) & ~cur_boosted & (rng.random(paths) <= boost / 100.0)
+            if cand.any():
+                rows = np.nonzero(cand)[0]
+                included = (boosted[rows].astype(np.int8) @ incidence.T.astype(np.int8)) > 0
+                new, ok = _draw_rows(rng, np.where(included, alt_w[None, :], 0.0))
+                idx[rows[ok]] = new[ok]
+
+        won = stars[idx]
+        payout += won
+        payout_sq_sum += float(np.dot(won, won))
+        drops += np.bincount(idx, minlength=len(prizes))
+
+        item_rows = np.nonzero(is_item[idx])[0]
+        if item_rows.size:
+            ci = code_idx[idx[item_rows]]
+            progress[item_rows, ci] += qty[idx[item_rows]]
+            newly = (spins_to_target[item_rows, ci] < 0) & (progress[item_rows, ci] >= targets[ci])
+            spins_to_target[item_rows[newly], ci[newly]] = step + 1
+
+    total_spins = paths * spins
+    per_spin_mean = float(payout.sum()) / total_spins
+    per_spin_std = float(np.sqrt(max(0.0, payout_sq_sum / total_spins - per_spin_mean ** 2)))
+
+    unit_price = (cost * media.ticket_sell_percent) // 100
+    tickets_per_path = progress.sum(axis=1) if k else np.zeros(paths, dtype=np.int64)
+    liability = tickets_per_path * unit_price
+    rtp_stars = per_spin_mean / cost
+    rtp_buyback = float(liability.mean()) / (spins * cost)
+
+    drop_by_code: dict[str, dict[str, float]] = {}
+    for i, code in enumerate(codes):
+        row = drop_by_code.setdefault(code, {"observed": 0.0, "configured": 0.0})
+        row["observed"] += float(drops[i]) / total_spins
+        row["configured"] += float(base_w[i] / base_cdf[-1])
+
+    items: dict[str, Any] = {}
+    for ci, code in enumerate(item_codes):
+        reached = spins_to_target[:, ci]
+        reached = reached[reached > 0]
+        items[code] = {
+            "target": int(targets[ci]),
+            "reached_share": float(reached.size) / paths,
+            "spins_to_target_mean": float(reached.mean()) if reached.size else None,
+            "spins_to_target": _quantiles(reached, (0.1, 0.25, 0.5, 0.75, 0.9)),
+        }
+
+    return {
+        "case_id": str(case.get("id") or ""),
+        "title": str(case.get("title") or ""),
+        "spin_cost": cost,
+        "paths": paths,
+        "spins_per_path": spins,
+        "total_spins": total_spins,
+        "boost_percent": boost,
+        "rtp_stars": rtp_stars,
+        "rtp_buyback": rtp_buyback,
+        "rtp_total": rtp_stars + rtp_buyback,
+        "house_edge": 1.0 - (rtp_stars + rtp_buyback),
+        "stars_per_spin": {"mean": per_spin_mean, "std": per_spin_std},
+        "path_payout_quantiles": _quantiles(payout),
+        "drop_rates": drop_by_code,
+        "items": items,
+        "buyback": {
+            "ticket_sell_percent": media.ticket_sell_percent,
+            "unit_price": unit_price,
+            "tickets_per_path_mean": float(tickets_per_path.mean()),
+            "liability_per_path_mean": float(liability.mean()),
+            "liability_per_path": _quantiles(liability),
+        },
+    }
+
+
+def simulate_cases(
+    cases: list[Mapping[str, Any]],
+    media: MediaConfig,
+    *,
+    paths: int = 100_000,
+    spins: int = 100,
+    seed: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    out = []
+    for i, case in enumerate(cases):
+        try:
+            out.append(simulate_case(case, media, paths=paths, spins=spins, seed=None if seed is None else seed + i))
+        except ValueError as e:
+            out.append({"case_id": str(case.get("id") or ""), "error": str(e)})
+    return out
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.simulator", description="Monte Carlo case economy simulator")
+    parser.add_argument("--case", action="append", default=[], help="case id (repeatable, default: all)")
+    parser.add_argument("--paths", type=int, default=100_000)
+    parser.add_argument("--spins", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from app.db import SessionLocal, init_db
+    from app.media_config import get_media_config
+    from app.roulette import get_catalog
+
+    init_db()
+    db = SessionLocal()
+    try:
+        cases = [c.case for c in get_catalog(db).cases if not args.case or c.case["id"] in args.case]
+    finally:
+        db.close()
+
+    report = simulate_cases(cases, get_media_config(), paths=args.paths, spins=args.spins, seed=args.seed)
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,101 @@
+"""Per-request SQL statement counter and DB time.
+
+Engine event hooks add to the SqlStats bound to the current context. The HTTP middleware in
+app.main binds one per request and reports it as a `Server-Timing` header and a debug log line.
+Code called directly can be checked with `count_statements()` / `statement_budget()`;
+HTTP responses (e.g. from a TestClient) with `assert_response_budget()`; the `sql_budget`
+fixture in tests/conftest.py wraps it, and tests/test_sql_budget.py holds the per-endpoint budgets.
+"""
+from __future__ import annotations
+
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@dataclass
+class SqlStats:
+    statements: int = 0
+    seconds: float = 0.0
+    sql: list[str] = field(default_factory=list)
+    keep_sql: bool = False
+
+    @property
+    def ms(self) -> float:
+        return self.seconds * 1000.0
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.ms:.1f};desc="{self.statements} queries"'
+
+
+_current: ContextVar[Optional[SqlStats]] = ContextVar("sql_stats", default=None)
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("sql_timing_start", []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    starts = conn.info.get("sql_timing_start")
+    if starts:
+        stats.seconds += time.perf_counter() - starts.pop()
+    stats.statements += 1
+    if stats.keep_sql:
+        stats.sql.append(statement)
+
+
+def install(engine: Engine) -> None:
+    """Attach the counting hooks to an engine (idempotent)."""
+    if not event.contains(engine, "before_cursor_execute", _before):
+        event.listen(engine, "before_cursor_execute", _before)
+        event.listen(engine, "after_cursor_execute", _after)
+
+
+@contextmanager
+def count_statements(keep_sql: bool = False) -> Iterator[SqlStats]:
+    """Count statements executed in this context (and threads/tasks started from it)."""
+    stats = SqlStats(keep_sql=keep_sql)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def statement_budget(max_statements: int) -> Iterator[SqlStats]:
+    """Fail with AssertionError if the block runs more than `max_statements` statements."""
+    with count_statements(keep_sql=True) as stats:
+        yield stats
+    if stats.statements > max_statements:
+        listing = "\n".join(f"  {i + 1}. {s.splitlines()[0][:160]}" for i, s in enumerate(stats.sql))
+        raise AssertionError(f"{stats.statements} SQL statements > budget {max_statements}:\n{listing}")
+
+
+_SERVER_TIMING_DB = re.compile(r'db;dur=[0-9.]+;desc="(\d+) queries"')
+
+
+def response_statements(headers) -> Optional[int]:
+    """Statement count reported in a response's Server-Timing header (None if absent)."""
+    m = _SERVER_TIMING_DB.search(headers.get("server-timing") or "")
+    return int(m.group(1)) if m else None
+
+
+def assert_response_budget(response, max_statements: int) -> int:
+    """Fail with AssertionError if the request behind `response` ran more than `max_statements` statements."""
+    used = response_statements(response.headers)
+    if used is None:
+        raise AssertionError("response has no Server-Timing db entry (SQL_TIMING_ENABLED off?)")
+    if used > max_statements:
+        raise AssertionError(f"{response.request.method} {response.request.url.path}: {used} SQL statements > budget {max_statements}")
+    return used
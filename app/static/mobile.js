@@ -29,11 +29,33 @@ function initDataHeader(){
   return initData ? { "X-Tg-Init-Data": initData } : {};
 }
 
-async function api(path, opts={}){
+// initData is exchanged once for a compact signed token (see /api/session).
+let SESSION=null;
+let SESSION_PENDING=null;
+async function sessionHeader(){
+  const now = Math.floor(Date.now()/1000);
+  if(SESSION && SESSION.expires_at - 60 > now) return { "X-Session-Token": SESSION.token };
+  SESSION=null;
+  if(!tg?.initData) return {};
+  if(!SESSION_PENDING){
+    SESSION_PENDING = fetch("/api/session", { method:"POST", headers: initDataHeader() })
+      .then(res => res.ok ? res.json() : null)
+      .catch(() => null)
+      .then(data => { SESSION = data; SESSION_PENDING = null; });
+  }
+  await SESSION_PENDING;
+  return SESSION ? { "X-Session-Token": SESSION.token } : initDataHeader();
+}
+
+async function api(path, opts={}, retried=false){
   const res = await fetch(path, {
-    headers: { "Content-Type":"application/json", ...(opts.headers||{}), ...initDataHeader() },
+    headers: { "Content-Type":"application/json", ...(opts.headers||{}), ...(await sessionHeader()) },
     ...opts,
   });
+  if(res.status === 401 && SESSION && !retried){
+    SESSION=null;
+    return api(path, opts, true);
+  }
   const txt = await res.text();
   let data=null;
   try{ data = txt ? JSON.parse(txt) : null; }catch{ data = { raw: txt }; }
@@ -895,18 +917,21 @@ async function loadMe(){
   if(me.is_admin) $("adminLink")?.classList.remove("hidden");
 }
 
-async function loadHistory(){
+async function loadHistory(beforeId=null){
   const box=$("history");
   if(!box) return;
 
-  const data = await api("/api/history", { method:"GET" });
+  const qs = new URLSearchParams({ limit: "20" });
+  if(beforeId) qs.set("before_id", String(beforeId));
+  const data = await api(`/api/history?${qs}`, { method:"GET" });
   const items = data.items || [];
-  if(!items.length){
+  if(!beforeId && !items.length){
     box.innerHTML = `<div class="text-xs text-white/60">Операций пока нет.</div>`;
     return;
   }
-  box.innerHTML="";
-  for(const it of items.slice(0, 20)){
+  if(!beforeId) box.innerHTML="";
+  box.querySelector("[data-history-more]")?.remove();
+  for(const it of items){
     const el=document.createElement("div");
     el.className="rounded-2xl bg-white/5 border border-white/15 p-3";
     el.innerHTML = `
@@ -919,6 +944,15 @@ async function loadHistory(){
     `;
     box.appendChild(el);
   }
+  if(data.next_before_id){
+    const more=document.createElement("button");
+    more.type="button";
+    more.dataset.historyMore="1";
+    more.className="w-full rounded-2xl bg-white/5 border border-white/15 p-2 text-xs text-white/70";
+    more.textContent="Показать ещё";
+    more.addEventListener("click", ()=>loadHistory(data.next_before_id));
+    box.appendChild(more);
+  }
 }
 
 async function loadMyReferrals(){
@@ -1,40 +1,65 @@
+import base64
 import hashlib
 import hmac
 import json
-from typing import Dict
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional
 from urllib.parse import parse_qsl
 
 
+@lru_cache(maxsize=8)
 def _secret_key(bot_token: str) -> bytes:
     # Telegram WebApp initData validation key:
     # secret_key = HMAC_SHA256("WebAppData", bot_token)
+    # It only depends on the token, so compute it once per token.
     return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
 
 
-def validate_init_data(init_data: str, bot_token: str) -> bool:
-    """Return True if init_data hash is valid for this bot_token."""
+def _checked_pairs(init_data: str, bot_token: str) -> Optional[Dict]:
+    """Parse init_data once and return its pairs (without hash) if the hash is valid."""
     if not init_data or not bot_token:
-        return False
+        return None
 
     pairs = dict(parse_qsl(init_data, keep_blank_values=True))
     received_hash = pairs.pop("hash", None)
     if not received_hash:
-        return False
+        return None
 
     data_check_string = "\n".join(f"{k}={pairs[k]}" for k in sorted(pairs.keys()))
     computed_hash = hmac.new(
         _secret_key(bot_token), data_check_string.encode(), hashlib.sha256
     ).hexdigest()
-    return hmac.compare_digest(computed_hash, received_hash)
+    if not hmac.compare_digest(computed_hash, received_hash):
+        return None
+    return pairs
+
 
+def _auth_date(pairs: Dict) -> int:
+    try:
+        return int(pairs.get("auth_date") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def validate_init_data(init_data: str, bot_token: str) -> bool:
+    """Return True if init_data hash is valid for this bot_token."""
+    return _checked_pairs(init_data, bot_token) is not None
 
-def verify_init_data(init_data: str, bot_token: str) -> Dict:
-    """Validate init_data and return parsed dict with decoded JSON fields."""
-    if not validate_init_data(init_data, bot_token):
+
+def verify_init_data(init_data: str, bot_token: str, max_age: int = 0) -> Dict:
+    """Validate init_data and return parsed dict with decoded JSON fields.
+
+    max_age > 0 additionally rejects initData whose auth_date is older than max_age seconds.
+    """
+    pairs = _checked_pairs(init_data, bot_token)
+    if pairs is None:
         raise ValueError("invalid initData hash")
 
-    pairs = dict(parse_qsl(init_data, keep_blank_values=True))
-    pairs.pop("hash", None)
+    if max_age > 0 and _auth_date(pairs) + max_age < time.time():
+        raise ValueError("initData expired")
 
     for key in ("user", "chat", "receiver"):
         if key in pairs and isinstance(pairs[key], str):
@@ -44,3 +69,94 @@ def verify_init_data(init_data: str, bot_token: str) -> Dict:
                 pass
 
     return pairs
+
+
+class InitDataCache:
+    """Bounded TTL cache of successfully verified initData.
+
+    Keyed by (bot_token, init_data), so a hit is exactly the string that was verified before.
+    Entries never outlive auth_date + max_age. Returned dicts are shared: treat them as read-only.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: int = 300):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = max(1, int(ttl))
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[tuple[str, str], tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, init_data: str, bot_token: str, max_age: int = 0) -> Dict:
+        key = (bot_token, init_data)
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                del self._items[key]
+            self.misses += 1
+
+        data = verify_init_data(init_data, bot_token, max_age=max_age)
+        expires_at = now + self.ttl
+        if max_age > 0:
+            expires_at = min(expires_at, _auth_date(data) + max_age)
+
+        with self._lock:
+            self._items[key] = (expires_at, data)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+def session_secret(bot_token: str, override: str = "") -> bytes:
+    """Key for signing session tokens (explicit secret, or derived from the bot token)."""
+    if override:
+        return override.encode()
+    return hmac.new(b"SessionToken", bot_token.encode(), hashlib.sha256).digest()
+
+
+def webhook_secret(bot_token: str, override: str = "") -> str:
+    """secret_token for setWebhook (explicit secret, or derived from the bot token; [A-Za-z0-9_-] only)."""
+    if override:
+        return override
+    return hmac.new(b"WebhookSecret", bot_token.encode(), hashlib.sha256).hexdigest()
+
+
+def _session_sig(payload: str, secret: bytes) -> str:
+    digest = hmac.new(secret, payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def sign_session_token(user_id: int, is_admin: bool, secret: bytes, ttl: int) -> tuple[str, int]:
+    """Return (token, expires_at). Token format: `<user_id>.<expires_at>.<admin 0|1>.<sig>`."""
+    expires_at = int(time.time()) + max(1, int(ttl))
+    payload = f"{int(user_id)}.{expires_at}.{1 if is_admin else 0}"
+    return f"{payload}.{_session_sig(payload, secret)}", expires_at
+
+
+def verify_session_token(token: str, secret: bytes) -> tuple[int, int, bool]:
+    """Return (user_id, expires_at, is_admin) for a valid, unexpired token."""
+    payload, _, sig = (token or "").rpartition(".")
+    if not payload or not hmac.compare_digest(_session_sig(payload, secret).encode(), sig.encode()):
+        raise ValueError("invalid session token")
+    parts = payload.split(".")
+    if len(parts) != 3 or not all(p.isdigit() for p in parts):
+        raise ValueError("invalid session token")
+    user_id, expires_at, admin = int(parts[0]), int(parts[1]), parts[2] == "1"
+    if expires_at < time.time():
+        raise ValueError("session token expired")
+    return user_id, expires_at, admin
@@ -1,9 +1,15 @@
-from typing import Optional
+from typing import Optional, Tuple
 
 from fastapi import Request, HTTPException
 
 from .config import settings
-from .telegram_auth import verify_init_data
+from .telegram_auth import InitDataCache, session_secret, sign_session_token, verify_session_token
+
+# Verified initData per WebApp session: repeated requests cost one dict lookup.
+init_data_cache = InitDataCache(
+    maxsize=settings.init_data_cache_size,
+    ttl=settings.init_data_cache_ttl,
+)
 
 
 def get_tg_user_id(request: Request) -> Optional[int]:
@@ -21,8 +27,39 @@ def get_tg_user_id(request: Request) -> Optional[int]:
         raise HTTPException(status_code=500, detail="BOT_TOKEN not set")
 
     try:
-        v = verify_init_data(init_data, settings.bot_token)
+        v = init_data_cache.verify(init_data, settings.bot_token, max_age=settings.init_data_max_age)
         u = v.get("user") or {}
         return int(u["id"]) if isinstance(u, dict) and "id" in u else None
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Telegram initData invalid: {e}")
+
+
+def _session_key() -> bytes:
+    return session_secret(settings.bot_token, settings.session_secret)
+
+
+def issue_session_token(user_id: int, is_admin: bool) -> Tuple[str, int]:
+    """Sign a short-lived session token for a user whose initData was just verified."""
+    if not settings.bot_token and not settings.session_secret:
+        raise HTTPException(status_code=500, detail="BOT_TOKEN not set")
+    return sign_session_token(user_id, is_admin, _session_key(), settings.session_token_ttl)
+
+
+def get_session_claims(request: Request) -> Optional[Tuple[int, bool]]:
+    """Return (user_id, is_admin) from the session token header, if one was sent."""
+    token = request.headers.get("X-Session-Token") or ""
+    if not token:
+        auth = request.headers.get("Authorization") or ""
+        if auth[:7].lower() == "bearer ":
+            token = auth[7:].strip()
+    if not token:
+        return None
+
+    if not settings.bot_token and not settings.session_secret:
+        raise HTTPException(status_code=500, detail="BOT_TOKEN not set")
+
+    try:
+        user_id, _, admin = verify_session_token(token, _session_key())
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=f"Session token invalid: {e}")
+    return user_id, admin
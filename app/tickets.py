@@ -0,0 +1,218 @@
+"""Hidden ticket ledger: one TicketLot per item win plus a per-user TicketProgress counter.
+
+Both are written in the same transaction as the win (spin_once) or the sale (api_tickets_sell),
+so reading progress or open lots is a single indexed query instead of a scan of win meta.
+
+Backfill for existing data:  python -m app.tickets backfill
+Recompute progress from lots (app stopped):  python -m app.tickets rebuild-progress
+"""
+from __future__ import annotations
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.db import on_conflict_insert
+from app.migrations import migration_applied, record_migration
+from app.models import TicketLot, TicketProgress, Transaction, TxType
+
+TICKET_LOTS_MIGRATION = "ticket_lots_backfill"
+
+
+def _bump_progress(db: Session, user_id: int, code: str, delta: int) -> None:
+    # Relative upsert so concurrent spins/sales never lose an increment, and two first wins of
+    # the same item don't both try to INSERT the row.
+    insert = on_conflict_insert(db)
+    if insert is not None:
+        stmt = insert(TicketProgress).values(user_id=int(user_id), code=code, count=int(delta))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TicketProgress.user_id, TicketProgress.code],
+            set_={"count": TicketProgress.count + stmt.excluded.count},
+        )
+        db.execute(stmt)
+        return
+
+    res = db.execute(
+        update(TicketProgress)
+        .where(TicketProgress.user_id == int(user_id), TicketProgress.code == code)
+        .values(count=TicketProgress.count + int(delta)),
+        execution_options={"synchronize_session": False},
+    )
+    if res.rowcount == 0:
+        db.add(TicketProgress(user_id=int(user_id), code=code, count=int(delta)))
+        db.flush()
+
+
+def add_ticket_lot(
+    db: Session,
+    tx: Transaction,
+    *,
+    user_id: int,
+    code: str,
+    ticket_kind: str,
+    qty: int,
+    rarity: str,
+    roulette_id: str,
+    case_cost: int,
+) -> TicketLot:
+    """Record tickets granted by the (not yet flushed) win transaction `tx`."""
+    lot = TicketLot(
+        transaction=tx,
+        user_id=int(user_id),
+        code=code,
+        ticket_kind=ticket_kind,
+        rarity=rarity or "blue",
+        roulette_id=roulette_id or "",
+        case_cost=max(0, int(case_cost or 0)),
+        added=int(qty),
+        sold=0,
+        created_at=datetime.utcnow(),
+    )
+    db.add(lot)
+    _bump_progress(db, user_id, code, qty)
+    return lot
+
+
+def sell_ticket_lot(db: Session, lot: TicketLot, qty: int) -> bool:
+    """Mark `qty` tickets of the lot sold, unless another request sold them first."""
+    seen_sold = int(lot.sold or 0)
+    res = db.execute(
+        update(TicketLot)
+        .where(TicketLot.tx_id == lot.tx_id, TicketLot.sold == seen_sold)
+        .values(sold=seen_sold + int(qty)),
+        execution_options={"synchronize_session": False},
+    )
+    if res.rowcount != 1:
+        return False
+    set_committed_value(lot, "sold", seen_sold + int(qty))
+    _bump_progress(db, lot.user_id, lot.code, -int(qty))
+    return True
+
+
+def user_ticket_progress(db: Session, user_id: int) -> dict[str, int]:
+    """Unsold tickets per item code (only positive counts)."""
+    rows = (
+        db.query(TicketProgress.code, TicketProgress.count)
+        .filter(TicketProgress.user_id == int(user_id), TicketProgress.count > 0)
+        .all()
+    )
+    return {str(r.code): int(r.count) for r in rows}
+
+
+def open_ticket_lots(db: Session, user_id: int) -> list[TicketLot]:
+    """Lots with unsold tickets, newest first."""
+    return (
+        db.query(TicketLot)
+        .filter(TicketLot.user_id == int(user_id), TicketLot.sold < TicketLot.added)
+        .order_by(TicketLot.tx_id.desc())
+        .all()
+    )
+
+
+def rebuild_ticket_progress(db: Session) -> int:
+    """Recompute every TicketProgress row from ticket_lots. Returns number of rows written.
+
+    Replaces the whole table, so run it with the app stopped (live increments would be lost).
+    """
+    totals: dict[tuple[int, str], int] = {}
+    for user_id, code, added, sold in db.query(TicketLot.user_id, TicketLot.code, TicketLot.added, TicketLot.sold):
+        key = (int(user_id), str(code))
+        totals[key] = totals.get(key, 0) + int(added or 0) - int(sold or 0)
+
+    db.query(TicketProgress).delete(synchronize_session=False)
+    for (user_id, code), count in totals.items():
+        db.add(TicketProgress(user_id=user_id, code=code, count=count))
+    db.commit()
+    return len(totals)
+
+
+def backfill_ticket_lots(db: Session, batch_size: int = 1000) -> int:
+    """Create lots for item wins recorded only in Transaction.meta and add them to progress.
+
+    Idempotent: wins that already have a lot are skipped. Progress is bumped only by the lots
+    created here, so it is safe while the app is serving spins. Returns number of lots created.
+    """
+    known = {int(x) for (x,) in db.query(TicketLot.tx_id)}
+    created = 0
+    deltas: dict[tuple[int, str], int] = {}
+    rows = (
+        db.query(Transaction)
+        .filter(Transaction.type == TxType.win)
+        .order_by(Transaction.id.asc())
+        .yield_per(batch_size)
+    )
+    for t in rows:
+        if int(t.id) in known:
+            continue
+        meta = t.meta or {}
+        code = str(meta.get("prize_code") or "")
+        added = int(meta.get("hidden_tickets_added") or 0)
+        if not code or added <= 0:
+            continue
+        sold = min(added, int(meta.get("hidden_tickets_sold") or 0))
+        db.add(
+            TicketLot(
+                tx_id=int(t.id),
+                user_id=int(t.user_id),
+                code=code,
+                ticket_kind=str(meta.get("hidden_ticket_kind") or ("bracelet" if code == "bracelet" else "sneakers")),
+                rarity=str(meta.get("rarity") or "blue"),
+                roulette_id=str(meta.get("roulette_id") or ""),
+                case_cost=max(0, int(meta.get("case_cost") or 0)),
+                added=added,
+                sold=sold,
+                created_at=t.created_at or datetime.utcnow(),
+            )
+        )
+        key = (int(t.user_id), code)
+        deltas[key] = deltas.get(key, 0) + added - sold
+        created += 1
+
+    db.flush()
+    for (user_id, code), delta in deltas.items():
+        if delta:
+            _bump_progress(db, user_id, code, delta)
+    db.commit()
+    return created
+
+
+def ensure_ticket_lots(db: Session) -> None:
+    """First-run migration: backfill once, recorded by a data_migrations marker.
+
+    Every worker calls this on startup. The marker is inserted in the backfill's transaction,
+    so when two workers race the loser fails on it (or on a lot) and rolls back.
+    """
+    if migration_applied(db, TICKET_LOTS_MIGRATION):
+        return
+    try:
+        record_migration(db, TICKET_LOTS_MIGRATION)
+        backfill_ticket_lots(db)
+    except IntegrityError:
+        # Another worker did it first.
+        db.rollback()
+
+
+def main(argv: list[str]) -> int:
+    from app.db import SessionLocal, init_db
+
+    if argv[:1] not in (["backfill"], ["rebuild-progress"]):
+        print("usage: python -m app.tickets backfill|rebuild-progress")
+        return 2
+    init_db()
+    db = SessionLocal()
+    try:
+        if argv[0] == "rebuild-progress":
+            print(f"ticket_progress rows: {rebuild_ticket_progress(db)}")
+        else:
+            print(f"ticket lots created: {backfill_ticket_lots(db)}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
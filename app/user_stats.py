@@ -0,0 +1,134 @@
+"""Lifetime per-user aggregates (user_stats).
+
+Deposits, spins (count and spend), stars won and referral bonuses are added to the user's row
+by the same transaction that writes them (payment confirm, spins, referral bind), so readers
+such as the referral endpoints never have to SUM over `transactions`. Archival doesn't touch
+the table: the totals stay lifetime totals.
+
+The table is filled from history on first start; it can be rebuilt by hand:
+    python -m app.user_stats rebuild
+"""
+from __future__ import annotations
+
+import sys
+
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.archive import iter_archived
+from app.db import on_conflict_insert
+from app.models import ArchiveSegment, Transaction, TxType, UserStat
+
+STAT_FIELDS = ("deposit_sum", "spins_count", "spent_on_spins", "wins_stars", "referral_bonus")
+
+
+def add_user_stats(db: Session, user_id: int, **deltas: int) -> None:
+    """Add deltas to one user's row (created on first use). The caller commits."""
+    deltas = {k: int(v) for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    unknown = set(deltas) - set(STAT_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown user stat: {', '.join(sorted(unknown))}")
+
+    insert = on_conflict_insert(db)
+    if insert is not None:
+        stmt = insert(UserStat).values(user_id=int(user_id), **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserStat.user_id],
+            set_={k: getattr(UserStat, k) + stmt.excluded[k] for k in deltas},
+        )
+        db.execute(stmt)
+        return
+
+    res = db.execute(
+        update(UserStat)
+        .where(UserStat.user_id == int(user_id))
+        .values(**{k: getattr(UserStat, k) + v for k, v in deltas.items()}),
+        execution_options={"synchronize_session": False},
+    )
+    if res.rowcount == 0:
+        db.add(UserStat(user_id=int(user_id), **deltas))
+        db.flush()
+
+
+def _fold(totals: dict[int, dict[str, int]], user_id: int, tx_type, is_sale: bool, count: int, amount: int, spent: int, positive: int) -> None:
+    row = totals.setdefault(int(user_id), dict.fromkeys(STAT_FIELDS, 0))
+    if tx_type == TxType.deposit:
+        row["deposit_sum"] += amount
+    elif tx_type == TxType.spin:
+        row["spins_count"] += count
+        row["spent_on_spins"] += spent
+    elif tx_type == TxType.win and not is_sale:
+        row["wins_stars"] += positive
+    elif tx_type == TxType.referral:
+        row["referral_bonus"] += amount
+
+
+def rebuild_user_stats(db: Session) -> int:
+    """Recompute user_stats from live and archived transactions. Returns rows written.
+
+    The table is cleared first, inside the same transaction: on SQLite that takes the write
+    lock, so no increments can slip in between the recount and the commit.
+    """
+    db.query(UserStat).delete(synchronize_session=False)
+
+    totals: dict[int, dict[str, int]] = {}
+    sale_col = case((Transaction.ticket_sell_tx_id.isnot(None), 1), else_=0)
+    for user_id, tx_type, is_sale, count, amount, spent, positive in (
+        db.query(
+            Transaction.user_id,
+            Transaction.type,
+            sale_col,
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.amount), 0),
+            func.coalesce(func.sum(func.abs(Transaction.amount)), 0),
+            func.coalesce(func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0)), 0),
+        )
+        .filter(Transaction.type.in_((TxType.deposit, TxType.spin, TxType.win, TxType.referral)))
+        .group_by(Transaction.user_id, Transaction.type, sale_col)
+    ):
+        _fold(totals, user_id, tx_type, bool(is_sale), int(count), int(amount), int(spent), int(positive))
+    for t in iter_archived(db):
+        amt = int(t.amount or 0)
+        _fold(totals, t.user_id, t.type, bool(t.ticket_sell_tx_id), 1, amt, abs(amt), max(0, amt))
+
+    rows = [{"user_id": uid, **row} for uid, row in totals.items() if any(row.values())]
+    if rows:
+        db.bulk_insert_mappings(UserStat, rows)
+    db.commit()
+    return len(rows)
+
+
+def ensure_user_stats(db: Session) -> None:
+    """Fill user_stats once, on the first start after the table appeared."""
+    if db.query(UserStat.user_id).first() is not None:
+        return
+    if db.query(Transaction.id).first() is None and db.query(ArchiveSegment.id).first() is None:
+        return
+    try:
+        rebuild_user_stats(db)
+    except IntegrityError:
+        # Another worker filled it first.
+        db.rollback()
+
+
+def main(argv: list[str]) -> int:
+    from app.db import SessionLocal, init_db
+
+    if argv[:1] != ["rebuild"]:
+        print("usage: python -m app.user_stats rebuild")
+        return 2
+    init_db()
+    db = SessionLocal()
+    try:
+        rows = rebuild_user_stats(db)
+    finally:
+        db.close()
+    print(f"user_stats rows: {rows}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
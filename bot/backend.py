@@ -0,0 +1,58 @@
+"""One long-lived HTTP client for bot -> backend calls.
+
+Created in bot.run.main() and closed on shutdown, so /start referral binds and payment
+confirmations reuse pooled keep-alive connections (HTTP/2 when `h2` is installed) instead of
+paying a TCP + TLS handshake through the tunnel for every update.
+"""
+from __future__ import annotations
+
+import importlib.util
+from typing import Optional
+
+import httpx
+
+from app.config import settings
+
+# Per-call timeouts: short connect, and a read budget that fits a batch confirm.
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+BIND_TIMEOUT = httpx.Timeout(5.0, connect=3.0)
+CONFIRM_TIMEOUT = httpx.Timeout(20.0, connect=5.0)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def make_client(base_url: Optional[str] = None, *, http2: Optional[bool] = None) -> httpx.AsyncClient:
+    headers = {}
+    if getattr(settings, "internal_api_token", ""):
+        headers["X-Internal-Token"] = settings.internal_api_token
+    return httpx.AsyncClient(
+        base_url=(settings.public_base_url if base_url is None else base_url).rstrip("/"),
+        headers=headers,
+        http2=http2_available() if http2 is None else http2,
+        timeout=DEFAULT_TIMEOUT,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0),
+    )
+
+
+def open_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = make_client()
+    return _client
+
+
+def get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("backend client is not open (bot.backend.open_client() in main)")
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,133 @@
+"""Bot -> backend HTTP benchmark: a new AsyncClient per call vs the shared pooled client.
+
+Starts a local stub backend (plain HTTP/1.1 keep-alive, answers {"ok": true}) that counts
+accepted connections and can delay every new connection by `--connect-delay-ms` to stand in
+for the TCP + TLS handshake through the tunnel. Then sends `--requests` POSTs with
+`--concurrency` in flight, once per mode, and prints req/s, mean latency and connections opened.
+
+CLI:  python -m bot.bench_http [--requests 500] [--concurrency 4] [--connect-delay-ms 30] [--mode both|fresh|shared]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from bot.backend import make_client
+
+_BODY = b'{"ok":true}'
+_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: keep-alive\r\n"
+    b"Content-Length: " + str(len(_BODY)).encode() + b"\r\n\r\n" + _BODY
+)
+
+
+class StubBackend:
+    def __init__(self, connect_delay: float):
+        self.connect_delay = connect_delay
+        self.connections = 0
+        self.server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        if self.connect_delay:
+            await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                writer.write(_RESPONSE)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _run_mode(mode: str, base_url: str, stub: StubBackend, requests: int, concurrency: int) -> dict:
+    stub.connections = 0
+    payload = {"items": [{"user_id": 1, "telegram_payment_charge_id": "bench", "total_amount": 1}]}
+    shared = make_client(base_url, http2=False) if mode == "shared" else None
+    latencies: list[float] = []
+    queue = iter(range(requests))
+
+    async def one() -> None:
+        t0 = time.perf_counter()
+        if shared is not None:
+            r = await shared.post("/api/internal/payment/confirm_batch", json=payload)
+        else:
+            # What bot.run did before: a fresh client (and connection) per update.
+            async with httpx.AsyncClient(timeout=20) as client:
+                r = await client.post(f"{base_url}/api/internal/payment/confirm_batch", json=payload)
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+
+    async def worker() -> None:
+        for _ in queue:
+            await one()
+
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        if shared is not None:
+            await shared.aclose()
+    elapsed = time.perf_counter() - t0
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "req_per_sec": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else None,
+        "connections": stub.connections,
+    }
+
+
+async def _bench(args: argparse.Namespace) -> list[dict]:
+    stub = StubBackend(args.connect_delay_ms / 1000.0)
+    base_url = await stub.start()
+    try:
+        modes = ("fresh", "shared") if args.mode == "both" else (args.mode,)
+        return [await _run_mode(mode, base_url, stub, args.requests, args.concurrency) for mode in modes]
+    finally:
+        await stub.stop()
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bot.bench_http", description="Bot -> backend HTTP client benchmark")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--connect-delay-ms", type=float, default=30.0, help="simulated handshake cost per new connection")
+    parser.add_argument("--mode", choices=("both", "fresh", "shared"), default="both")
+    args = parser.parse_args(argv)
+    args.requests = max(1, args.requests)
+    args.concurrency = max(1, args.concurrency)
+
+    report = asyncio.run(_bench(args))
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
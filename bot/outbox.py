@@ -0,0 +1,175 @@
+"""Durable outbox for payment confirmations (bot -> backend).
+
+Every successful_payment is written to a small local SQLite file before the handler returns;
+a background worker drains it into POST /api/internal/payment/confirm_batch (over the shared
+backend client) and deletes rows only after the backend accepted them. Failed flushes are
+retried with exponential backoff, and rows survive restarts, so a payment is never lost to a
+backend outage. The backend confirm is idempotent on the charge id, so re-sending after a
+crash mid-flush is harmless.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+from app.config import settings
+from bot.backend import CONFIRM_TIMEOUT
+
+log = logging.getLogger("bot.outbox")
+
+BASE_BACKOFF = 1.0
+IDLE_POLL = 30.0
+
+
+@dataclass(frozen=True)
+class PendingPayment:
+    charge_id: str
+    user_id: int
+    total_amount: int
+    chat_id: int
+    attempts: int
+
+
+class PaymentOutbox:
+    """SQLite-backed queue. Methods are blocking; the bot calls them via asyncio.to_thread."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # The row must be on disk before the user is told the payment went through.
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS payment_outbox (
+                charge_id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                total_amount INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+    def add(self, charge_id: str, user_id: int, total_amount: int, chat_id: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO payment_outbox (charge_id, user_id, total_amount, chat_id, next_attempt_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (charge_id, int(user_id), int(total_amount), int(chat_id), now, now),
+            )
+
+    def due(self, limit: int, now: Optional[float] = None) -> list[PendingPayment]:
+        """Oldest rows whose retry time has come (`now=math.inf`: all rows, ignoring backoff)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT charge_id, user_id, total_amount, chat_id, attempts FROM payment_outbox"
+                " WHERE next_attempt_at <= ? ORDER BY created_at LIMIT ?",
+                (time.time() if now is None else now, max(1, int(limit))),
+            ).fetchall()
+        return [PendingPayment(*r) for r in rows]
+
+    def next_due_in(self) -> Optional[float]:
+        """Seconds until the earliest row is due (0 if overdue), None when empty."""
+        with self._lock:
+            (at,) = self._conn.execute("SELECT MIN(next_attempt_at) FROM payment_outbox").fetchone()
+        return None if at is None else max(0.0, at - time.time())
+
+    def done(self, charge_ids: list[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM payment_outbox WHERE charge_id = ?", [(c,) for c in charge_ids])
+
+    def failed(self, items: list[PendingPayment], error: str, max_backoff: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE payment_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE charge_id = ?",
+                [
+                    # Jittered, so a backlog doesn't hit a recovering backend in lockstep.
+                    (now + random.uniform(0.5, 1.0) * min(max_backoff, BASE_BACKOFF * 2 ** it.attempts), error[:500], it.charge_id)
+                    for it in items
+                ],
+            )
+
+    def pending(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM payment_outbox").fetchone()[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# notify(item, credited): credited=True once the backend accepted it, False after the first failure.
+Notify = Callable[[PendingPayment, bool], Awaitable[None]]
+
+
+async def _post_batch(client: httpx.AsyncClient, items: list[PendingPayment]) -> None:
+    payload = {
+        "items": [
+            {"user_id": it.user_id, "telegram_payment_charge_id": it.charge_id, "total_amount": it.total_amount}
+            for it in items
+        ]
+    }
+    r = await client.post("/api/internal/payment/confirm_batch", json=payload, timeout=CONFIRM_TIMEOUT)
+    r.raise_for_status()
+    body = r.json()
+    if not bool(body.get("ok")):
+        raise RuntimeError(f"confirm failed: {body}")
+
+
+async def _notify_all(notify: Optional[Notify], items: list[PendingPayment], credited: bool) -> None:
+    if notify is None:
+        return
+    for it in items:
+        try:
+            await notify(it, credited)
+        except Exception as e:
+            log.warning("payment notify failed: charge_id=%s err=%s", it.charge_id, e)
+
+
+async def run_worker(
+    outbox: PaymentOutbox,
+    wake: asyncio.Event,
+    client: httpx.AsyncClient,
+    notify: Optional[Notify] = None,
+) -> None:
+    """Drain the outbox forever: batch, POST, delete on success, back off on failure."""
+    batch_size = max(1, int(settings.bot_outbox_batch_size))
+    max_backoff = max(BASE_BACKOFF, float(settings.bot_outbox_max_backoff))
+    while True:
+        # Cleared before reading: a payment queued from here on sets it again and ends the wait.
+        wake.clear()
+        items = await asyncio.to_thread(outbox.due, batch_size)
+        if not items:
+            wait = await asyncio.to_thread(outbox.next_due_in)
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=IDLE_POLL if wait is None else min(wait, IDLE_POLL))
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _post_batch(client, items)
+        except Exception as e:
+            log.warning("[payment-confirm-error] %d queued confirmation(s) not accepted: %s", len(items), e)
+            await asyncio.to_thread(outbox.failed, items, str(e), max_backoff)
+            await _notify_all(notify, [it for it in items if it.attempts == 0], False)
+            continue
+
+        await asyncio.to_thread(outbox.done, [it.charge_id for it in items])
+        await _notify_all(notify, items, True)
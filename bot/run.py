@@ -8,17 +8,28 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 import asyncio
+import logging
+from typing import Awaitable, Callable
+
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.types import Message, PreCheckoutQuery
 from aiogram.filters import CommandStart
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-import httpx
 
 from app.config import settings
+from bot.backend import BIND_TIMEOUT, close_client, get_client, open_client
+from bot.outbox import PaymentOutbox, PendingPayment, run_worker
+
+log = logging.getLogger("bot.run")
 
 dp = Dispatcher()
 
+# Webhook mode (app.bot_webhook) runs this dispatcher inside the web app and sets these hooks,
+# so referral binds and payment credits call the app's logic directly instead of over HTTP.
+in_process_bind: Callable[[int, int], Awaitable[None]] | None = None
+in_process_credit: Callable[[int, str, int], Awaitable[bool]] | None = None
+
 def webapp_kb():
     kb = InlineKeyboardBuilder()
     kb.button(text="⭐ Открыть SPIN MADESIX", web_app={"url": settings.webapp_url})
@@ -35,18 +46,27 @@ def extract_referrer_id(start_payload: str | None) -> int | None:
 
 
 async def bind_referral(user_id: int, referrer_id: int) -> None:
+    if in_process_bind is not None:
+        await in_process_bind(int(user_id), int(referrer_id))
+        return
     if not settings.public_base_url:
         return
-    url = f"{settings.public_base_url.rstrip('/')}/api/internal/referral/bind"
-    headers = {}
-    if getattr(settings, "internal_api_token", ""):
-        headers["X-Internal-Token"] = settings.internal_api_token
-    async with httpx.AsyncClient(timeout=20) as client:
-        await client.post(
-            url,
-            params={"user_id": int(user_id), "referrer_id": int(referrer_id)},
-            headers=headers,
-        )
+    await get_client().post(
+        "/api/internal/referral/bind",
+        params={"user_id": int(user_id), "referrer_id": int(referrer_id)},
+        timeout=BIND_TIMEOUT,
+    )
+
+
+# Background referral binds; referenced here so they aren't garbage-collected mid-flight.
+_bind_tasks: set[asyncio.Task] = set()
+
+
+async def _bind_in_background(user_id: int, referrer_id: int) -> None:
+    try:
+        await bind_referral(user_id=user_id, referrer_id=referrer_id)
+    except Exception as e:
+        log.warning("referral bind failed: user_id=%s referrer_id=%s err=%s", user_id, referrer_id, e)
 
 
 @dp.message(CommandStart())
@@ -58,11 +78,11 @@ async def start(m: Message):
 
     referrer_id = extract_referrer_id(payload)
     if referrer_id and m.from_user and int(m.from_user.id) != int(referrer_id):
-        try:
-            await bind_referral(user_id=int(m.from_user.id), referrer_id=int(referrer_id))
-        except Exception:
-            # Referral bind must not block /start UX
-            pass
+        # Not awaited: updates are handled one at a time (see main), so a slow backend here
+        # would hold up every update behind this /start. The bind is idempotent and best-effort.
+        task = asyncio.create_task(_bind_in_background(int(m.from_user.id), int(referrer_id)))
+        _bind_tasks.add(task)
+        task.add_done_callback(_bind_tasks.discard)
 
     await m.answer(
         "⭐ SPIN MADESIX\n\nЗапустите мини-приложение и крутите рулетку за Stars.\n\nКаждый спин — шанс выиграть одежду из коллекции MADESIX.",
@@ -73,6 +93,10 @@ async def start(m: Message):
 async def on_pre_checkout(q: PreCheckoutQuery, bot: Bot):
     await bot.answer_pre_checkout_query(q.id, ok=True)
 
+outbox: PaymentOutbox | None = None
+outbox_wake = asyncio.Event()
+
+
 @dp.message(F.successful_payment)
 async def on_success(m: Message):
     sp = m.successful_payment
@@ -80,39 +104,56 @@ async def on_success(m: Message):
     charge_id = sp.telegram_payment_charge_id
     total = sp.total_amount  # XTR units for Stars
 
-    try:
-        async with httpx.AsyncClient(timeout=20) as client:
-            url = f"{settings.public_base_url.rstrip('/')}/api/internal/payment/confirm"
-            headers = {}
-            if getattr(settings, "internal_api_token", ""):
-                headers["X-Internal-Token"] = settings.internal_api_token
-            r = await client.post(
-                url,
-                params={
-                    "user_id": uid,
-                    "telegram_payment_charge_id": charge_id,
-                    "total_amount": total,
-                },
-                headers=headers,
-            )
-            r.raise_for_status()
-            body = r.json()
-            if not bool(body.get("ok")):
-                raise RuntimeError(f"confirm failed: {body}")
-    except Exception as e:
-        print(f"[payment-confirm-error] uid={uid} charge_id={charge_id} err={e}")
-        await m.answer("⚠️ Оплата прошла, но зачисление задерживается. Напишите в поддержку и отправьте скриншот оплаты.")
+    if in_process_credit is not None:
+        # Webhook mode: credited in the app's DB transaction. If that fails the webhook request
+        # fails too, and Telegram delivers the update again (the credit is idempotent).
+        # A redelivered, already credited payment was confirmed to the user the first time.
+        if await in_process_credit(uid, charge_id, total):
+            await m.answer(f"✅ Оплата прошла! Начислено: {total}⭐")
         return
 
-    await m.answer(f"✅ Оплата прошла! Начислено: {total}⭐")
+    # Durable first; crediting happens in the outbox worker, the update loop never waits on the backend.
+    await asyncio.to_thread(outbox.add, charge_id, uid, total, m.chat.id)
+    outbox_wake.set()
+
+
+async def notify_payment(bot: Bot, item: PendingPayment, credited: bool) -> None:
+    if credited:
+        await bot.send_message(item.chat_id, f"✅ Оплата прошла! Начислено: {item.total_amount}⭐")
+    else:
+        await bot.send_message(item.chat_id, "⏳ Оплата прошла, зачисление задерживается. Звёзды будут начислены автоматически.")
+
+
+def make_bot() -> Bot:
+    proxy = (settings.telegram_proxy or "").strip() or None
+    session = AiohttpSession(proxy=proxy) if proxy else None
+    return Bot(token=settings.bot_token, session=session)
+
 
 async def main():
+    global outbox
     if not settings.bot_token:
         raise SystemExit("BOT_TOKEN not set in .env")
-    proxy = (settings.telegram_proxy or "").strip() or None
-    session = AiohttpSession(proxy=proxy) if proxy else None
-    bot = Bot(token=settings.bot_token, session=session)
-    await dp.start_polling(bot)
+    if settings.bot_webhook_enabled:
+        # Not an error: the web app serves the bot and credits whatever is left in the outbox.
+        print("BOT_WEBHOOK_ENABLED=true: the bot is served by the web app, polling is not started")
+        return
+    bot = make_bot()
+    # Switching back from webhook mode: getUpdates is refused while a webhook is set.
+    await bot.delete_webhook()
+    client = open_client()
+    outbox = PaymentOutbox(settings.bot_outbox_path)
+    worker = asyncio.create_task(
+        run_worker(outbox, outbox_wake, client, lambda item, credited: notify_payment(bot, item, credited))
+    )
+    try:
+        # Sequential handling: the next getUpdates (which acknowledges the offset) is only sent
+        # after on_success has written the payment to the outbox, so a crash can't drop it.
+        await dp.start_polling(bot, handle_as_tasks=False)
+    finally:
+        worker.cancel()
+        outbox.close()
+        await close_client()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,108 @@
+"""Test settings: a scratch SQLite database and a fixed bot token, set before `app` is imported."""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="roulette-tests-")
+
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_TMP, 'app.db')}",
+    READ_DATABASE_URL="",
+    ARCHIVE_DIR=os.path.join(_TMP, "archive"),
+    BOT_TOKEN="123456:test-token",
+    INTERNAL_API_TOKEN="",
+    ADMIN_TELEGRAM_IDS="700000000",
+    ASYNC_DB_ENABLED="false",
+    BOT_WEBHOOK_ENABLED="false",
+    BROWSER_TEST_AUTH_ENABLED="false",
+    STATS_SEAL_INTERVAL="0",
+    SQL_TIMING_ENABLED="true",
+)
+
+ADMIN_ID = 700_000_000
+_user_ids = itertools.count(700_000_001)
+
+
+@pytest.fixture(scope="session")
+def app_db():
+    from app.db import SessionLocal, init_db
+    from app.roulette import get_catalog
+
+    init_db()
+    db = SessionLocal()
+    try:
+        get_catalog(db)
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db(app_db):
+    from app.db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def funded_user(db):
+    """Factory: a new user whose balance came from one confirmed payment (so the ledger sums up)."""
+    from app.payments import credit_payment
+
+    def make(balance: int = 10_000) -> int:
+        uid = next(_user_ids)
+        assert credit_payment(db, uid, f"test-charge-{uid}", int(balance))
+        db.commit()
+        return uid
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def client(app_db):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+def chi_square_limit(df: int, z: float = 3.719) -> float:
+    """Wilson-Hilferty approximation of the chi-square quantile (z = 3.719 -> p = 1e-4)."""
+    k = 2.0 / (9.0 * df)
+    return df * (1.0 - k + z * k ** 0.5) ** 3
+
+
+def auth_headers(user_id: int, admin: bool = False) -> dict:
+    from app.telegram_session import issue_session_token
+
+    token, _ = issue_session_token(int(user_id), admin)
+    return {"X-Session-Token": token}
+
+
+@pytest.fixture
+def sql_budget(client):
+    """Request through the TestClient and fail if it ran more SQL statements than allowed.
+
+    The count comes from the response's Server-Timing header (app.sql_timing middleware).
+    """
+    from app.sql_timing import assert_response_budget
+
+    def request(method: str, path: str, max_statements: int, **kwargs):
+        response = client.request(method, path, **kwargs)
+        assert response.status_code < 400, response.text
+        assert_response_budget(response, max_statements)
+        return response
+
+    return request
@@ -0,0 +1,20 @@
+import pytest
+
+from conftest import ADMIN_ID, auth_headers
+
+
+@pytest.mark.parametrize("field, value", [("paths", "lots"), ("spins", [1]), ("seed", {"x": 1})])
+def test_simulate_rejects_non_integer_fields(client, field, value):
+    r = client.post("/api/admin/cases/simulate", json={field: value}, headers=auth_headers(ADMIN_ID, admin=True))
+    assert r.status_code == 400
+    assert field in r.json()["detail"]
+
+
+def test_simulate_accepts_numeric_strings(client):
+    r = client.post(
+        "/api/admin/cases/simulate",
+        json={"paths": "50", "spins": "10", "seed": 0},
+        headers=auth_headers(ADMIN_ID, admin=True),
+    )
+    assert r.status_code == 200
+    assert (r.json()["paths"], r.json()["spins"]) == (50, 10)
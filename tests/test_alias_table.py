@@ -0,0 +1,111 @@
+import random
+from collections import Counter
+
+import pytest
+
+from conftest import chi_square_limit
+
+from app.roulette import AliasTable, CompiledCase
+
+DRAWS = 100_000
+
+
+def _draw(table: AliasTable, seed: int) -> Counter:
+    rnd = random.Random(seed).random
+    return Counter(table.sample(rnd) for _ in range(DRAWS))
+
+
+def _assert_matches_weights(counts: Counter, weights: dict) -> None:
+    total = float(sum(weights.values()))
+    positive = {k: w for k, w in weights.items() if w > 0}
+    for k, w in weights.items():
+        if w == 0:
+            assert counts[k] == 0, f"zero-weight item {k!r} drawn {counts[k]} times"
+    assert set(counts) <= set(positive)
+    chi2 = sum((counts[k] - DRAWS * w / total) ** 2 / (DRAWS * w / total) for k, w in positive.items())
+    assert chi2 < chi_square_limit(len(positive) - 1), f"chi2={chi2:.1f} for {dict(counts)}"
+
+
+@pytest.mark.parametrize(
+    "weights",
+    [
+        {"a": 1, "b": 1, "c": 1, "d": 1},
+        {"common": 700, "rare": 250, "epic": 45, "legend": 5},
+        {"x": 1, "y": 1000},
+        {"a": 3, "zero": 0, "b": 7, "zero2": 0, "c": 90},
+    ],
+)
+def test_alias_draws_follow_weights(weights):
+    table = AliasTable(list(weights), list(weights.values()))
+    _assert_matches_weights(_draw(table, seed=1234), weights)
+
+
+def test_single_item_always_drawn():
+    table = AliasTable(["only"], [5])
+    assert _draw(table, seed=7) == Counter({"only": DRAWS})
+
+
+def test_rejects_no_positive_weight():
+    with pytest.raises(ValueError):
+        AliasTable([], [])
+    with pytest.raises(ValueError):
+        AliasTable(["a", "b"], [0, 0])
+
+
+def _prize(code: str, weight: int, enabled: int = 1) -> dict:
+    return {"code": code, "type": "stars", "weight": weight, "is_enabled": enabled}
+
+
+def test_compiled_case_skips_zero_weight_and_disabled_prizes():
+    compiled = CompiledCase.build({
+        "id": "t1",
+        "prizes": [_prize("a", 60), _prize("zero", 0), _prize("off", 500, enabled=0), _prize("b", 40)],
+    })
+    rnd = random.Random(99).random
+    counts = Counter(compiled.table.sample(rnd)["code"] for _ in range(DRAWS))
+    _assert_matches_weights(counts, {"a": 60, "b": 40, "zero": 0, "off": 0})
+
+
+def test_compiled_case_single_prize():
+    compiled = CompiledCase.build({"id": "t2", "prizes": [_prize("solo", 1)]})
+    rnd = random.Random(3).random
+    assert {compiled.table.sample(rnd)["code"] for _ in range(1000)} == {"solo"}
+
+
+def test_compiled_case_without_drawable_prizes_has_no_table():
+    compiled = CompiledCase.build({"id": "t3", "prizes": [_prize("zero", 0), _prize("off", 10, enabled=0)]})
+    assert compiled.table is None
+
+
+def _item(code: str, weight: int, enabled: int = 1) -> dict:
+    return {"code": code, "type": "item", "weight": weight, "is_enabled": enabled}
+
+
+BOOST_CASE = {
+    "id": "t4",
+    "prizes": [_prize("stars", 60), _item("s1", 10), _item("s2", 0), _item("s3", 30), _item("s4", 50, enabled=0)],
+}
+
+
+def test_boost_variants_are_built_with_the_case():
+    compiled = CompiledCase.build(BOOST_CASE)
+    # Every non-empty subset of the 4 item codes, for both kinds.
+    assert len(compiled.variants) == 2 * (2 ** 4 - 1)
+
+
+def test_without_items_distribution():
+    compiled = CompiledCase.build(BOOST_CASE)
+    table = compiled.without_items(frozenset({"s1", "not-in-case"}))
+    rnd = random.Random(5).random
+    counts = Counter(table.sample(rnd)["code"] for _ in range(DRAWS))
+    # Boost variants count enabled zero-weight prizes as weight 1; disabled ones never appear.
+    _assert_matches_weights(counts, {"stars": 60, "s2": 1, "s3": 30, "s1": 0, "s4": 0})
+
+
+def test_only_items_distribution():
+    compiled = CompiledCase.build(BOOST_CASE)
+    table = compiled.only_items(frozenset({"s1", "s2", "s4"}))
+    rnd = random.Random(6).random
+    counts = Counter(table.sample(rnd)["code"] for _ in range(DRAWS))
+    _assert_matches_weights(counts, {"s1": 10, "s2": 1, "s3": 0, "s4": 0, "stars": 0})
+    assert compiled.only_items(frozenset({"s4"})) is None
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import pytest
+
+import app.archive as archive
+from app.models import Transaction, TxType
+
+MONTHS = ("2020-03", "2020-04", "2020-05", "2020-06")
+
+
+@pytest.fixture(scope="module")
+def archived_user(app_db):
+    """A user with 10 spins a month archived into one segment per month, plus a neighbour's rows."""
+    from app.db import SessionLocal
+    from app.payments import credit_payment
+
+    db = SessionLocal()
+    try:
+        user_id, other_id = 700_400_001, 700_400_002
+        for uid in (user_id, other_id):
+            assert credit_payment(db, uid, f"archive-test-{uid}", 1_000)
+        for month in MONTHS:
+            for day in range(1, 11):
+                for uid in (user_id, other_id):
+                    db.add(Transaction(
+                        user_id=uid, type=TxType.spin, amount=-1, description="old spin",
+                        created_at=datetime.fromisoformat(f"{month}-{day:02d}T12:00:00"),
+                    ))
+        db.commit()
+        report = archive.archive_transactions(db, datetime(2021, 1, 1))
+        assert report["rows"] == 2 * 10 * len(MONTHS)
+        yield user_id
+    finally:
+        db.close()
+
+
+def _brute_force(db, user_id, limit, before_id=None, **filters):
+    rows = archive.iter_archived(db, user_id=user_id, before_id=before_id, **filters)
+    return sorted(rows, key=lambda t: t.id, reverse=True)[:limit]
+
+
+@pytest.mark.parametrize("limit", [1, 5, 10, 25, 100])
+def test_archived_history_pages_match_a_full_sort(db, archived_user, limit):
+    before_id = None
+    pages = 0
+    while True:
+        page = archive.archived_history(db, archived_user, limit, before_id)
+        assert page == _brute_force(db, archived_user, limit, before_id)
+        assert all(t.user_id == archived_user for t in page)
+        if len(page) < limit:
+            break
+        before_id = page[-1].id
+        pages += 1
+    assert pages == 40 // limit
+
+
+def test_archived_history_filters(db, archived_user):
+    since, until = datetime(2020, 4, 5), datetime(2020, 5, 3)
+    page = archive.archived_history(db, archived_user, 50, since=since, until=until, types={TxType.spin})
+    assert page == _brute_force(db, archived_user, 50, since=since, until=until, types={TxType.spin})
+    assert len(page) == 6 + 2
+    assert archive.archived_history(db, archived_user, 50, types={TxType.deposit}) == []
+
+
+def test_archived_history_stops_at_the_newest_segments(db, archived_user, monkeypatch):
+    opened = []
+    index = archive._segment_by_user
+
+    def spy(path):
+        opened.append(path)
+        return index(path)
+
+    monkeypatch.setattr(archive, "_segment_by_user", spy)
+    page = archive.archived_history(db, archived_user, 10)
+    assert [t.created_at.strftime("%Y-%m") for t in page] == ["2020-06"] * 10
+    assert len(opened) == 1
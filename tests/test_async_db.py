@@ -0,0 +1,55 @@
+"""Hot paths on the async engine. The engine is chosen at import, so this runs in a fresh process."""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import PROJECT_ROOT
+
+SCRIPT = r"""
+import inspect, json, random
+from fastapi.testclient import TestClient
+from app.db import SessionLocal, async_engine
+from app.main import app
+from app.payments import credit_payment
+from app.telegram_session import issue_session_token
+
+assert async_engine is not None
+routes = {r.path: r.endpoint for r in app.routes if getattr(r, "path", "") in ("/api/me", "/api/spin")}
+out = {"async": {p: inspect.iscoroutinefunction(fn) for p, fn in routes.items()}}
+uid = 700_500_001
+with TestClient(app) as client:
+    db = SessionLocal()
+    assert credit_payment(db, uid, "async-test-charge", 10_000)
+    db.commit()
+    db.close()
+    headers = {"X-Session-Token": issue_session_token(uid, False)[0]}
+    random.seed(3)
+    me = client.get("/api/me", headers=headers)
+    spins = [client.post("/api/spin", headers=headers, json={"roulette_id": "r1"}) for _ in range(5)]
+    after = client.get("/api/me", headers=headers)
+out["me"] = [me.status_code, me.json()["balance"]]
+out["spins"] = [[r.status_code, r.json().get("balance")] for r in spins]
+out["after"] = [after.status_code, after.json()["balance"]]
+print(json.dumps(out))
+"""
+
+
+def test_hot_paths_on_async_engine(tmp_path):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path / 'async.db'}",
+        ARCHIVE_DIR=str(tmp_path / "archive"),
+        ASYNC_DB_ENABLED="true",
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert proc.returncode == 0, proc.stderr
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    assert out["async"] == {"/api/me": True, "/api/spin": True}
+    assert out["me"] == [200, 10_000]
+    assert [status for status, _ in out["spins"]] == [200] * 5
+    assert out["spins"][0][1] < 10_000
+    assert out["after"] == [200, out["spins"][-1][1]]
@@ -0,0 +1,58 @@
+import threading
+
+from sqlalchemy import func
+
+from app.db import SessionLocal
+from app.models import TicketLot, TicketProgress, Transaction, User
+from app.roulette import get_catalog, spin_batch, spin_once
+
+THREADS = 8
+ROUNDS = 25
+
+
+def _spinner(user_id: int, case_ids: list[str], worker: int, errors: list) -> None:
+    db = SessionLocal()
+    try:
+        for k in range(ROUNDS):
+            user = db.get(User, user_id)
+            case_id = case_ids[(worker + k) % len(case_ids)]
+            if (worker + k) % 3 == 0:
+                spin_batch(db, user, case_id, 1 + k % 10)
+            else:
+                spin_once(db, user, case_id)
+            db.expire_all()
+    except Exception as e:  # pragma: no cover - reported by the assertion below
+        errors.append(repr(e))
+    finally:
+        db.close()
+
+
+def test_concurrent_spins_keep_balance_equal_to_ledger(db, funded_user):
+    # Enough for some spins to hit the balance guard, so the insufficient path races too.
+    user_id = funded_user(60_000)
+    case_ids = [c.case["id"] for c in get_catalog(db).cases]
+
+    errors: list = []
+    threads = [threading.Thread(target=_spinner, args=(user_id, case_ids, i, errors)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+    db.expire_all()
+    balance = db.query(User.balance).filter(User.user_id == user_id).scalar()
+    ledger = db.query(func.coalesce(func.sum(Transaction.amount), 0)).filter(Transaction.user_id == user_id).scalar()
+    assert balance >= 0
+    assert balance == ledger
+
+    lots = dict(
+        db.query(TicketLot.code, func.sum(TicketLot.added - TicketLot.sold))
+        .filter(TicketLot.user_id == user_id)
+        .group_by(TicketLot.code)
+        .all()
+    )
+    progress = dict(
+        db.query(TicketProgress.code, TicketProgress.count).filter(TicketProgress.user_id == user_id).all()
+    )
+    assert progress == lots
@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import bot_webhook
+from app.config import settings
+from app.main import app
+
+PATH = settings.bot_webhook_path
+
+
+def _message(**extra) -> dict:
+    return {
+        "message_id": 5,
+        "date": 1_700_000_000,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "U"},
+        **extra,
+    }
+
+
+PAYMENT_UPDATE = {
+    "update_id": 1,
+    "message": _message(successful_payment={
+        "currency": "XTR",
+        "total_amount": 100,
+        "invoice_payload": "stars",
+        "telegram_payment_charge_id": "webhook-charge-1",
+        "provider_payment_charge_id": "",
+    }),
+}
+START_UPDATE = {"update_id": 2, "message": _message(text="/start")}
+
+
+@pytest.fixture
+def webhook_client(app_db, monkeypatch):
+    monkeypatch.setattr(settings, "bot_webhook_enabled", True)
+    # No lifespan: startup would try to reach Telegram. 500s come back as responses.
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def _post(client, update, secret=None):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": bot_webhook.expected_secret() if secret is None else secret}
+    return client.post(PATH, json=update, headers=headers)
+
+
+def test_disabled_webhook_is_not_found(client):
+    assert client.post(PATH, json=START_UPDATE).status_code == 404
+
+
+def test_wrong_secret_is_rejected(webhook_client, monkeypatch):
+    calls = []
+
+    async def handle(data):
+        calls.append(data)
+
+    monkeypatch.setattr(bot_webhook, "handle", handle)
+    assert _post(webhook_client, START_UPDATE, secret="wrong").status_code == 403
+    assert webhook_client.post(PATH, json=START_UPDATE).status_code == 403
+    assert calls == []
+    assert _post(webhook_client, START_UPDATE).status_code == 200
+    assert calls == [START_UPDATE]
+
+
+def test_failed_update_is_a_500_so_telegram_redelivers(webhook_client, monkeypatch):
+    async def handle(data):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(bot_webhook, "handle", handle)
+    assert _post(webhook_client, PAYMENT_UPDATE).status_code == 500
+
+
+class _FailingDispatcher:
+    def __init__(self):
+        self.fed = []
+
+    async def feed_update(self, bot, update):
+        self.fed.append(update.update_id)
+        raise RuntimeError("handler failed")
+
+
+@pytest.fixture
+def stub_dispatcher(monkeypatch):
+    pytest.importorskip("aiogram")
+    import bot.run as bot_run
+
+    dispatcher = _FailingDispatcher()
+    monkeypatch.setattr(bot_run, "dp", dispatcher)
+    monkeypatch.setattr(bot_webhook, "_bot", bot_run.make_bot())
+    return dispatcher
+
+
+def test_dispatcher_failure_fails_only_payment_updates(webhook_client, stub_dispatcher):
+    assert _post(webhook_client, PAYMENT_UPDATE).status_code == 500
+    # A broken /start is logged and acknowledged, or Telegram would retry it forever.
+    assert _post(webhook_client, START_UPDATE).status_code == 200
+    assert stub_dispatcher.fed == [1, 2]
+
+
+def test_on_success_answers_only_when_credited(monkeypatch):
+    pytest.importorskip("aiogram")
+    import bot.run as bot_run
+
+    credited = iter([True, False])
+
+    async def in_process_credit(user_id, charge_id, total_amount):
+        return next(credited)
+
+    answers = []
+
+    async def answer(text, **kwargs):
+        answers.append(text)
+
+    monkeypatch.setattr(bot_run, "in_process_credit", in_process_credit)
+    message = SimpleNamespace(
+        successful_payment=SimpleNamespace(telegram_payment_charge_id="c-1", total_amount=100),
+        from_user=SimpleNamespace(id=42),
+        chat=SimpleNamespace(id=42),
+        answer=answer,
+    )
+    asyncio.run(bot_run.on_success(message))
+    asyncio.run(bot_run.on_success(message))  # redelivery of the same update
+    assert len(answers) == 1
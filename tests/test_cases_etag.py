@@ -0,0 +1,46 @@
+import app.media_config as media_config
+from app.roulette import list_cases, save_cases
+
+
+def _get(client, etag=None):
+    return client.get("/api/cases", headers={"If-None-Match": etag} if etag else {})
+
+
+def test_cases_not_modified(client):
+    r = _get(client)
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+    r = _get(client, etag)
+    assert r.status_code == 304
+    assert r.headers["etag"] == etag and r.content == b""
+
+
+def test_cases_etag_changes_after_save_cases(client, db):
+    original = list_cases(db)
+    first = _get(client).headers["etag"]
+    try:
+        edited = [dict(c, title="Renamed") if c["id"] == "r1" else c for c in original]
+        save_cases(db, edited)
+        r = _get(client, first)
+        assert r.status_code == 200
+        assert r.headers["etag"] != first
+        assert any(c.get("title") == "Renamed" for c in r.json()["items"])
+    finally:
+        save_cases(db, original)
+    # Same content again, same ETag.
+    assert _get(client).headers["etag"] == first
+
+
+def test_cases_etag_changes_after_save_media_config(client, tmp_path, monkeypatch):
+    first = _get(client).headers["etag"]
+    data = media_config.get_media_config().to_dict()
+    data["roulettes"].setdefault("r1", {})["desc"] = "From media config"
+    # Keep the repo's roulettes.json untouched: the saved copy goes to a scratch file.
+    monkeypatch.setattr(media_config, "MEDIA_CONFIG_PATH", tmp_path / "roulettes.json")
+    media_config.save_media_config(data)
+
+    r = _get(client, first)
+    assert r.status_code == 200
+    assert r.headers["etag"] != first
+    assert r.json()["items"][0]["desc"] == "From media config"
+    assert _get(client, r.headers["etag"]).status_code == 304
@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from app.export import TABLES
+from app.models import Transaction, TxType
+from conftest import ADMIN_ID, auth_headers
+
+COLUMNS = list(TABLES["transactions"].columns)
+
+
+@pytest.fixture(scope="module")
+def export_user(app_db):
+    """A user with spins on three days, the middle one late in the evening, plus one win."""
+    from app.db import SessionLocal
+    from app.payments import credit_payment
+
+    db = SessionLocal()
+    try:
+        uid = 700_200_001
+        assert credit_payment(db, uid, f"export-test-{uid}", 1_000)
+        ids = {}
+        for key, ts, type_ in [
+            ("day1", "2022-03-01T08:00:00", TxType.spin),
+            ("day2_evening", "2022-03-02T23:30:00", TxType.spin),
+            ("day2_win", "2022-03-02T23:30:01", TxType.win),
+            ("day3", "2022-03-03T00:00:00", TxType.spin),
+        ]:
+            tx = Transaction(user_id=uid, type=type_, amount=-10 if type_ == TxType.spin else 5,
+                             description=key, created_at=datetime.fromisoformat(ts), meta={"k": key})
+            db.add(tx)
+            db.flush()
+            ids[key] = int(tx.id)
+        db.commit()
+        yield uid, ids
+    finally:
+        db.close()
+
+
+def _export(client, fmt: str, **params):
+    r = client.get(
+        "/api/admin/export/transactions",
+        params={"format": fmt, **params},
+        headers=auth_headers(ADMIN_ID, admin=True),
+    )
+    assert r.status_code == 200, r.text
+    return r
+
+
+def _csv_rows(body: str) -> tuple[list[str], list[dict]]:
+    rows = list(csv.reader(io.StringIO(body)))
+    return rows[0], [dict(zip(rows[0], row)) for row in rows[1:]]
+
+
+def _ndjson_rows(body: str) -> list[dict]:
+    return [json.loads(line) for line in body.splitlines() if line]
+
+
+def test_csv_export_header_and_date_filter(client, export_user):
+    uid, ids = export_user
+    r = _export(client, "csv", user_id=uid, **{"from": "2022-03-01", "to": "2022-03-02"})
+    assert r.headers["content-type"].startswith("text/csv")
+    assert 'filename="transactions-2022-03-01-2022-03-02.csv"' in r.headers["content-disposition"]
+    header, rows = _csv_rows(r.text)
+    assert header == COLUMNS
+    # A plain-date `to` includes the whole day, late evening too.
+    assert [int(row["id"]) for row in rows] == [ids["day1"], ids["day2_evening"], ids["day2_win"]]
+    assert json.loads(rows[0]["meta"]) == {"k": "day1"}
+
+    # Only the header when nothing matches.
+    header, rows = _csv_rows(_export(client, "csv", user_id=uid, to="2000-01-01").text)
+    assert header == COLUMNS and rows == []
+
+
+def test_ndjson_export_keys_and_type_filter(client, export_user):
+    uid, ids = export_user
+    r = _export(client, "ndjson", user_id=uid, type="spin", **{"from": "2022-03-02", "to": "2022-03-03"})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = _ndjson_rows(r.text)
+    assert all(list(row) == COLUMNS for row in rows)
+    assert [row["id"] for row in rows] == [ids["day2_evening"], ids["day3"]]
+    assert {row["type"] for row in rows} == {"spin"}
+    assert rows[0]["created_at"] == "2022-03-02T23:30:00"
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import auth_headers
+
+
+@pytest.mark.parametrize("params", [{"from": "yesterday"}, {"to": "2025-13-40"}, {"from": "2025-01-01", "to": "soon"}])
+def test_history_rejects_malformed_dates(client, funded_user, params):
+    r = client.get("/api/history", params=params, headers=auth_headers(funded_user(100)))
+    assert r.status_code == 400
+
+
+def test_history_date_filter(client, funded_user):
+    headers = auth_headers(funded_user(100))
+    assert len(client.get("/api/history", params={"from": "2000-01-01"}, headers=headers).json()["items"]) == 1
+    assert client.get("/api/history", params={"to": "2000-01-01"}, headers=headers).json()["items"] == []
+
+
+def test_history_plain_date_to_covers_the_whole_day(client, funded_user):
+    headers = auth_headers(funded_user(100))
+    today = datetime.utcnow().date().isoformat()
+    assert len(client.get("/api/history", params={"to": today}, headers=headers).json()["items"]) == 1
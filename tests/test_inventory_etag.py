@@ -0,0 +1,29 @@
+import app.main as main_module
+from app.media_config import MediaConfig, get_media_config
+from app.roulette import _rebuild_catalog
+from conftest import auth_headers
+
+
+def _etag(client, headers) -> str:
+    r = client.get("/api/inventory", headers=headers)
+    assert r.status_code == 200
+    return r.headers["etag"]
+
+
+def test_inventory_etag_follows_content_not_process_counters(client, db, funded_user, monkeypatch):
+    headers = auth_headers(funded_user(1_000))
+    media = get_media_config()
+    first = _etag(client, headers)
+
+    # Another worker (or a restart) rebuilds the same catalog under a different version.
+    _rebuild_catalog(db)
+    assert _etag(client, headers) == first
+
+    # Same version number, different content (e.g. another worker saved new targets): new ETag.
+    data = media.to_dict()
+    data["ticket_targets"]["shoes"] = 77
+    monkeypatch.setattr(main_module, "get_media_config", lambda: MediaConfig.build(media.version, data))
+    changed = _etag(client, headers)
+    assert changed != first
+    r = client.get("/api/inventory", headers={**headers, "If-None-Match": first})
+    assert r.status_code == 200
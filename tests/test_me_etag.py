@@ -0,0 +1,27 @@
+from app.config import settings
+from conftest import auth_headers
+
+
+def _me(client, headers, etag=None):
+    if etag is not None:
+        headers = {**headers, "If-None-Match": etag}
+    return client.get("/api/me", headers=headers)
+
+
+def test_me_etag_changes_with_admin_list_and_bot_username(client, funded_user, monkeypatch):
+    uid = funded_user(1_000)
+    headers = auth_headers(uid)
+    first = _me(client, headers)
+    assert first.json()["is_admin"] is False
+    etag = first.headers["etag"]
+    assert _me(client, headers, etag).status_code == 304
+
+    monkeypatch.setattr(settings, "admin_telegram_ids", f"{settings.admin_telegram_ids},{uid}")
+    r = _me(client, headers, etag)
+    assert r.status_code == 200 and r.json()["is_admin"] is True
+    etag = r.headers["etag"]
+
+    monkeypatch.setattr(settings, "bot_username", "other_bot")
+    r = _me(client, headers, etag)
+    assert r.status_code == 200 and r.json()["ref_link"] == f"https://t.me/other_bot?start=ref_{uid}"
+    assert _me(client, headers, r.headers["etag"]).status_code == 304
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import math
+
+import httpx
+import pytest
+
+import bot.outbox as outbox_module
+from bot.outbox import PaymentOutbox, run_worker
+
+
+@pytest.fixture
+def outbox_path(tmp_path):
+    return str(tmp_path / "outbox.db")
+
+
+def test_rows_survive_reopen(outbox_path):
+    box = PaymentOutbox(outbox_path)
+    box.add("ch-1", 1, 100, 11)
+    box.add("ch-2", 2, 200, 22)
+    box.add("ch-1", 1, 100, 11)  # redelivered update: ignored
+    box.close()
+
+    box = PaymentOutbox(outbox_path)
+    try:
+        assert box.pending() == 2
+        assert [(p.charge_id, p.user_id, p.total_amount, p.chat_id) for p in box.due(10)] == [
+            ("ch-1", 1, 100, 11),
+            ("ch-2", 2, 200, 22),
+        ]
+    finally:
+        box.close()
+
+
+def test_backoff_grows_and_is_capped(outbox_path, monkeypatch):
+    monkeypatch.setattr(outbox_module.random, "uniform", lambda a, b: 1.0)
+    box = PaymentOutbox(outbox_path)
+    try:
+        box.add("ch-1", 1, 100, 11)
+        delays = []
+        for _ in range(6):
+            box.failed(box.due(1, now=math.inf), "backend down", max_backoff=10.0)
+            delays.append(box.next_due_in())
+        assert box.due(1) == []
+        assert box.due(1, now=math.inf)[0].attempts == 6
+        base = outbox_module.BASE_BACKOFF
+        assert delays == pytest.approx([base, 2 * base, 4 * base, 8 * base, 10.0, 10.0], abs=0.5)
+    finally:
+        box.close()
+
+
+def test_worker_deletes_rows_only_after_a_2xx(outbox_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "BASE_BACKOFF", 0.01)
+    box = PaymentOutbox(outbox_path)
+    box.add("ch-1", 1, 100, 11)
+    responses = [httpx.Response(503), httpx.Response(200, json={"ok": False}), httpx.Response(200, json={"ok": True})]
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        # Still queued while the backend is handling the batch.
+        charge_ids = [it["telegram_payment_charge_id"] for it in json.loads(request.content)["items"]]
+        seen.append((box.pending(), charge_ids))
+        return responses[len(seen) - 1]
+
+    notified = []
+
+    async def notify(item, credited):
+        notified.append((item.charge_id, credited))
+
+    async def scenario():
+        wake = asyncio.Event()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://backend") as client:
+            worker = asyncio.create_task(run_worker(box, wake, client, notify))
+            try:
+                for _ in range(500):
+                    if box.pending() == 0:
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                worker.cancel()
+
+    try:
+        asyncio.run(scenario())
+        assert seen == [(1, ["ch-1"])] * 3
+        assert box.pending() == 0
+        # Told "delayed" after the first failure, "credited" once accepted.
+        assert notified == [("ch-1", False), ("ch-1", True)]
+    finally:
+        box.close()
@@ -0,0 +1,59 @@
+from sqlalchemy import func
+
+from app.models import Payment, Transaction, TxType, User
+
+CONFIRM = "/api/internal/payment/confirm"
+CONFIRM_BATCH = "/api/internal/payment/confirm_batch"
+
+
+def _credited(db, user_id: int) -> tuple[int, int, int]:
+    """(balance, payment rows, deposit transactions) of a user."""
+    db.expire_all()
+    balance = db.query(User.balance).filter(User.user_id == user_id).scalar()
+    payments = db.query(func.count(Payment.id)).filter(Payment.user_id == user_id).scalar()
+    deposits = (
+        db.query(func.count(Transaction.id))
+        .filter(Transaction.user_id == user_id, Transaction.type == TxType.deposit)
+        .scalar()
+    )
+    return balance, payments, deposits
+
+
+def test_confirm_same_charge_twice_credits_once(client, db):
+    uid = 700_100_001
+    params = {"user_id": uid, "telegram_payment_charge_id": "dup-charge-1", "total_amount": 250}
+    first = client.post(CONFIRM, params=params)
+    assert first.json() == {"ok": True, "credited": 250}
+    second = client.post(CONFIRM, params=params)
+    assert second.json() == {"ok": True, "already": True}
+    assert _credited(db, uid) == (250, 1, 1)
+
+
+def test_confirm_batch_with_repeated_charge_credits_once(client, db):
+    uid = 700_100_002
+    client.post(CONFIRM, params={"user_id": uid, "telegram_payment_charge_id": "batch-old", "total_amount": 100})
+
+    items = [
+        {"user_id": uid, "telegram_payment_charge_id": "batch-a", "total_amount": 300},
+        {"user_id": uid, "telegram_payment_charge_id": "batch-b", "total_amount": 50},
+        {"user_id": uid, "telegram_payment_charge_id": "batch-a", "total_amount": 300},
+        {"user_id": uid, "telegram_payment_charge_id": "batch-old", "total_amount": 100},
+    ]
+    r = client.post(CONFIRM_BATCH, json={"items": items})
+    assert r.status_code == 200
+    assert r.json() == {
+        "ok": True,
+        "items": [
+            {"telegram_payment_charge_id": "batch-a", "credited": 300},
+            {"telegram_payment_charge_id": "batch-b", "credited": 50},
+            {"telegram_payment_charge_id": "batch-a", "already": True},
+            {"telegram_payment_charge_id": "batch-old", "already": True},
+        ],
+        "credited": 350,
+    }
+    assert _credited(db, uid) == (450, 3, 3)
+
+    # Redelivering the whole batch changes nothing.
+    again = client.post(CONFIRM_BATCH, json={"items": items}).json()
+    assert again["credited"] == 0 and all(it.get("already") for it in again["items"])
+    assert _credited(db, uid) == (450, 3, 3)
@@ -0,0 +1,48 @@
+import math
+import random
+from collections import Counter
+
+from conftest import chi_square_limit
+
+from app.media_config import get_media_config
+from app.models import User
+from app.roulette import MAX_BATCH_SPINS, get_catalog, spin_batch
+from app.simulator import simulate_case
+
+CASE_ID = "r1"
+USERS = 150
+SPINS_PER_USER = 2 * MAX_BATCH_SPINS
+
+
+def test_simulator_matches_live_spins(db, funded_user):
+    """The simulator's drop rates and RTP agree with spin_batch on the same case and path length.
+
+    Each user is one simulator path, so the near-target boost and the one-left penalty are
+    exercised the same way on both sides.
+    """
+    compiled = get_catalog(db).get(CASE_ID)
+    cost = int(compiled.case["spin_cost"])
+    expected = simulate_case(compiled.case, get_media_config(), paths=100_000, spins=SPINS_PER_USER, seed=11)
+
+    random.seed(2024)
+    drops: Counter = Counter()
+    stars = 0
+    for _ in range(USERS):
+        user = db.get(User, funded_user(cost * SPINS_PER_USER))
+        for _ in range(SPINS_PER_USER // MAX_BATCH_SPINS):
+            res = spin_batch(db, user, CASE_ID, MAX_BATCH_SPINS)
+            assert res["ok"], res
+            for r in res["results"]:
+                drops[r["prize"]["code"]] += 1
+                if r["prize"]["type"] == "stars":
+                    stars += r["prize"]["amount"]
+    n = USERS * SPINS_PER_USER
+
+    rates = {code: row["observed"] for code, row in expected["drop_rates"].items() if row["observed"] > 0}
+    assert set(drops) <= set(rates)
+    chi2 = sum((drops[c] - n * p) ** 2 / (n * p) for c, p in rates.items())
+    assert chi2 < chi_square_limit(len(rates) - 1), f"chi2={chi2:.1f} live={dict(drops)} sim={rates}"
+
+    sim = expected["stars_per_spin"]
+    assert abs(stars / n - sim["mean"]) < 4 * sim["std"] / math.sqrt(n)
+    assert abs(stars / (n * cost) - expected["rtp_stars"]) < 4 * sim["std"] / (cost * math.sqrt(n))
@@ -0,0 +1,81 @@
+"""SQL statement budgets of the hot user endpoints.
+
+A budget is the most statements the endpoint may run by design, so an N+1 query or an
+extra round trip fails here instead of showing up as latency in production.
+"""
+import random
+
+import pytest
+
+from app.roulette import MAX_BATCH_SPINS
+from conftest import auth_headers
+
+CASES = ("r1", "r2", "r3", "r4", "r5", "r6")
+
+# /api/me for a new user: version lookup, user lookup, insert, refresh.
+ME_FIRST_VISIT = 4
+ME = 2
+NOT_MODIFIED = 1
+INVENTORY = 4
+HISTORY = 2
+
+
+def spin_budget(count: int) -> int:
+    # Version + user lookups, ticket progress read, the guarded UPDATE and the user_stats upsert,
+    # then per draw: the spin and win transactions, at most one ticket_progress upsert and lot.
+    return 4 + 4 * count
+
+
+@pytest.fixture
+def user(funded_user):
+    uid = funded_user(1_000_000)
+    return uid, auth_headers(uid)
+
+
+def test_me(sql_budget):
+    headers = auth_headers(699_000_001)
+    sql_budget("GET", "/api/me", ME_FIRST_VISIT, headers=headers)
+    etag = sql_budget("GET", "/api/me", ME, headers=headers).headers["etag"]
+    r = sql_budget("GET", "/api/me", NOT_MODIFIED, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+
+
+def test_spin(sql_budget, user):
+    _, headers = user
+    random.seed(1)
+    for k in range(30):
+        sql_budget("POST", "/api/spin", spin_budget(1), headers=headers, json={"roulette_id": CASES[k % len(CASES)]})
+
+
+@pytest.mark.parametrize("count", [2, MAX_BATCH_SPINS])
+def test_spin_batch(sql_budget, user, count):
+    _, headers = user
+    random.seed(2)
+    for k in range(10):
+        sql_budget(
+            "POST", "/api/spin/batch", spin_budget(count),
+            headers=headers, json={"roulette_id": CASES[k % len(CASES)], "count": count},
+        )
+
+
+def test_inventory(sql_budget, user):
+    _, headers = user
+    sql_budget(
+        "POST", "/api/spin/batch", spin_budget(MAX_BATCH_SPINS),
+        headers=headers, json={"roulette_id": "r1", "count": MAX_BATCH_SPINS},
+    )
+    etag = sql_budget("GET", "/api/inventory", INVENTORY, headers=headers).headers["etag"]
+    r = sql_budget("GET", "/api/inventory", NOT_MODIFIED, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304
+
+
+def test_history(sql_budget, user):
+    _, headers = user
+    sql_budget(
+        "POST", "/api/spin/batch", spin_budget(MAX_BATCH_SPINS),
+        headers=headers, json={"roulette_id": "r1", "count": MAX_BATCH_SPINS},
+    )
+    first = sql_budget("GET", "/api/history?limit=5", HISTORY, headers=headers).json()
+    before_id = first["next_before_id"]
+    assert before_id
+    sql_budget("GET", f"/api/history?limit=5&before_id={before_id}", HISTORY, headers=headers)
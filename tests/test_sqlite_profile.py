@@ -0,0 +1,32 @@
+from sqlalchemy import create_engine
+
+from app.config import settings
+from app.db import install_sqlite_profile
+
+
+def _pragmas(url: str) -> tuple:
+    engine = create_engine(url)
+    install_sqlite_profile(engine)
+    try:
+        with engine.connect() as conn:
+            return (
+                conn.exec_driver_sql("PRAGMA journal_mode").scalar(),
+                conn.exec_driver_sql("PRAGMA synchronous").scalar(),
+                conn.exec_driver_sql("PRAGMA busy_timeout").scalar(),
+            )
+    finally:
+        engine.dispose()
+
+
+def test_profile_follows_each_engines_own_url(tmp_path):
+    # The app's DATABASE_URL is a file; an in-memory engine must still skip WAL, and vice versa.
+    assert _pragmas("sqlite://")[0] == "memory"
+    assert _pragmas("sqlite:///:memory:")[0] == "memory"
+    journal, synchronous, busy = _pragmas(f"sqlite:///{tmp_path / 'other.db'}")
+    assert (journal, synchronous) == ("wal", 1)
+    assert busy > 0
+
+
+def test_file_engine_gets_wal_when_main_url_is_in_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "database_url", "sqlite://")
+    assert _pragmas(f"sqlite:///{tmp_path / 'read.db'}")[0] == "wal"
@@ -0,0 +1,57 @@
+from sqlalchemy import func
+
+from app.migrations import migration_applied
+from app.models import DataMigration, TicketLot, TicketProgress, Transaction, TxType
+from app.tickets import TICKET_LOTS_MIGRATION, backfill_ticket_lots, ensure_ticket_lots, user_ticket_progress
+
+
+def _legacy_win(db, user_id: int, code: str, added: int, sold: int = 0) -> int:
+    # An item win from before ticket_lots existed: the tickets live only in meta.
+    tx = Transaction(
+        user_id=user_id,
+        type=TxType.win,
+        amount=0,
+        description="legacy win",
+        meta={"prize_code": code, "hidden_tickets_added": added, "hidden_tickets_sold": sold},
+    )
+    db.add(tx)
+    db.commit()
+    return int(tx.id)
+
+
+def test_backfill_adds_to_live_progress(db, funded_user):
+    user_id = funded_user()
+    db.add(TicketProgress(user_id=user_id, code="sneaker_live", count=3))
+    db.commit()
+    tx_a = _legacy_win(db, user_id, "sneaker_a", added=5, sold=2)
+    _legacy_win(db, user_id, "sneaker_a", added=4)
+    _legacy_win(db, user_id, "sneaker_b", added=1)
+
+    assert backfill_ticket_lots(db) >= 3
+    db.expire_all()
+    # The increment written by a live spin is kept, not recomputed away.
+    assert user_ticket_progress(db, user_id) == {"sneaker_live": 3, "sneaker_a": 7, "sneaker_b": 1}
+    assert db.get(TicketLot, tx_a).sold == 2
+
+    # Idempotent: nothing new to create, progress unchanged.
+    assert backfill_ticket_lots(db) == 0
+    db.expire_all()
+    assert user_ticket_progress(db, user_id) == {"sneaker_live": 3, "sneaker_a": 7, "sneaker_b": 1}
+
+
+def test_ensure_runs_once_and_tolerates_a_racing_worker(db, funded_user, monkeypatch):
+    ensure_ticket_lots(db)
+    assert migration_applied(db, TICKET_LOTS_MIGRATION)
+
+    # After the marker, a later start does not scan the ledger again.
+    user_id = funded_user()
+    tx_id = _legacy_win(db, user_id, "sneaker_c", added=2)
+    ensure_ticket_lots(db)
+    assert db.get(TicketLot, tx_id) is None
+
+    # A worker that checked before another one committed loses on the marker and rolls back.
+    monkeypatch.setattr("app.tickets.migration_applied", lambda db, name: False)
+    ensure_ticket_lots(db)
+    assert db.get(TicketLot, tx_id) is None
+    markers = db.query(func.count(DataMigration.name)).filter(DataMigration.name == TICKET_LOTS_MIGRATION)
+    assert markers.scalar() == 1